@@ -34,11 +34,12 @@ from magisk_modules import MagiskModules
 from message_box_ex import MessageBoxEx
 from modules import (adb_kill_server, check_platform_tools, flash_phone,
                      live_flash_boot_phone, patch_boot_img, populate_boot_list,
-                     process_file, select_firmware, set_flash_button_state,
+                     process_file, select_firmware, set_firmware_hash,
+                     set_flash_button_state, start_firmware_hashing,
                      wifi_adb_connect)
 from package_manager import PackageManager
 from partition_manager import PartitionManager
-from phone import get_connected_devices
+from phone import get_connected_devices, start_device_watcher
 from runtime import *
 
 # see https://discuss.wxpython.org/t/wxpython4-1-1-python3-8-locale-wxassertionerror/35168
@@ -206,22 +207,10 @@ class PixelFlasher(wx.Frame):
                     set_firmware_id(filename)
             if self.config.firmware_sha256:
                 print("Using previously stored firmware SHA-256 ...")
-                firmware_hash = self.config.firmware_sha256
+                set_firmware_hash(self, self.config.firmware_path, self.config.firmware_sha256)
             else:
                 print("Computing firmware SHA-256 ...")
-                firmware_hash = sha256(self.config.firmware_path)
-                self.config.firmware_sha256 = firmware_hash
-            print(f"Firmware SHA-256: {firmware_hash}")
-            self.firmware_picker.SetToolTip(f"SHA-256: {firmware_hash}")
-            # Check to see if the first 8 characters of the checksum is in the filename, Google published firmwares do have this.
-            if firmware_hash[:8] in self.config.firmware_path:
-                print(f"Expected to match {firmware_hash[:8]} in the firmware filename and did. This is good!")
-                puml(f"#CDFFC8:Checksum matches portion of the firmware filename {self.config.firmware_path};\n")
-                set_firmware_hash_validity(True)
-            else:
-                print(f"WARNING: Expected to match {firmware_hash[:8]} in the firmware filename but didn't, please double check to make sure the checksum is good.")
-                puml("#orange:Unable to match the checksum in the filename;\n")
-                set_firmware_hash_validity(False)
+                start_firmware_hashing(self, self.config.firmware_path)
 
         # check platform tools
         res_sdk = check_platform_tools(self)
@@ -270,14 +259,17 @@ class PixelFlasher(wx.Frame):
 
         self._update_custom_flash_options()
 
+        # enable / disable use_native_adb, before the first device scan so that it already uses it
+        set_use_native_adb(self.config.use_native_adb)
+
         if res_sdk != -1:
             print("\nLoading Device list ...")
             puml(":Loading device list;\n", True)
             print("This could take a while, please be patient.\n")
 
             debug("Populate device list")
-            connected_devices = get_connected_devices()
-            self.device_choice.AppendItems(connected_devices)
+            connected_devices = get_connected_devices(self.device_choice.Append)
+            self.device_choice.SetItems(connected_devices)
             d_list_string = '\n'.join(connected_devices)
             puml(f"note right\n{d_list_string}\nend note\n")
 
@@ -286,6 +278,9 @@ class PixelFlasher(wx.Frame):
             self._select_configured_device()
             self._refresh_ui()
 
+        # keep the device list current as devices are plugged in / out or change modes
+        start_device_watcher(lambda: wx.CallAfter(self._on_devices_changed))
+
         # enable / disable offer_patch_methods
         set_patch_methods_settings(self.config.offer_patch_methods)
         # enable / disable Patching Recovery Partition option
@@ -711,6 +706,7 @@ class PixelFlasher(wx.Frame):
             self.config.offer_patch_methods = get_patch_methods_settings()
             self.config.show_recovery_patching_option = get_recovery_patch_settings()
             self.config.use_busybox_shell = get_use_busybox_shell_settings()
+            self.config.use_native_adb = get_use_native_adb()
             self.config.update_check = get_update_check()
             self.config.force_codepage = get_codepage_setting()
             self.config.custom_codepage = get_codepage_value()
@@ -880,12 +876,17 @@ class PixelFlasher(wx.Frame):
             self.spinner.Start()
             self.spinner.Refresh()
             self.SetCursor(wx.Cursor(wx.CURSOR_WAIT))
+            # device operations must not race the watcher's polling / device init
+            if get_device_watcher():
+                get_device_watcher().pause()
         else:
             self.spinner.Stop()
             self.spinner.Hide()
             self.spinner_label.Hide()
             self.spinner.Refresh()
             self.SetCursor(wx.Cursor(wx.CURSOR_ARROW))
+            if get_device_watcher():
+                get_device_watcher().resume()
 
     # -----------------------------------------------
     #                  _refresh_ui
@@ -1077,6 +1078,28 @@ class PixelFlasher(wx.Frame):
         self.update_widget_states()
 
 
+    # -----------------------------------------------
+    #                  _on_devices_changed
+    # -----------------------------------------------
+    def _on_devices_changed(self):
+        if self.spinner.IsRunning():
+            # an operation is in progress, it refreshes the list itself when it's done
+            wx.CallLater(1000, self._on_devices_changed)
+            return
+        connected_devices = get_connected_devices()
+        if connected_devices == list(self.device_choice.GetItems()) and get_phone() in get_phones() + [None]:
+            return
+        print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} Connected devices changed, {len(connected_devices)} Device(s) are found.")
+        self.device_choice.SetItems(connected_devices)
+        # keep the configured device selected while it's connected
+        set_phone(None)
+        for index, device in enumerate(get_phones()):
+            if device.id == self.config.device:
+                self.device_choice.Select(index)
+                set_phone(device)
+        self._reflect_slots()
+        self.update_widget_states()
+
     # -----------------------------------------------
     #                  _reflect_slots
     # -----------------------------------------------
@@ -1151,6 +1174,11 @@ class PixelFlasher(wx.Frame):
                     return True
                 return False
 
+            elif condition == 'firmware_hash_is_ready':
+                if not get_firmware_hash_pending():
+                    return True
+                return False
+
             elif condition == 'not_custom_flash':
                 if self.config.flash_mode != 'customFlash':
                     return True
@@ -1247,7 +1275,7 @@ class PixelFlasher(wx.Frame):
                 self.scan_button:                       ['sdk_ok'],
                 self.wifi_adb:                          ['sdk_ok'],
                 self.device_choice:                     ['sdk_ok'],
-                self.process_firmware:                  ['firmware_selected'],
+                self.process_firmware:                  ['firmware_selected', 'firmware_hash_is_ready'],
                 self.delete_boot_button:                ['boot_is_selected'],
                 self.boot_folder_button:                ['boot_is_selected'],
                 self.firmware_folder_button:            ['boot_is_selected'],
@@ -1339,7 +1367,9 @@ class PixelFlasher(wx.Frame):
                 print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} Scanning for Devices ...")
                 puml(":Scan for Devices;\n")
                 self._on_spin('start')
-                connected_devices = get_connected_devices()
+                # devices show up as they are initialized, the final list is in adb / fastboot order
+                self.device_choice.Clear()
+                connected_devices = get_connected_devices(self.device_choice.Append)
                 self.device_choice.SetItems(connected_devices)
                 d_list_string = '\n'.join(connected_devices)
                 puml(f"note right\n{d_list_string}\nend note\n")
@@ -1377,12 +1407,7 @@ class PixelFlasher(wx.Frame):
         def _on_select_firmware(event):
             self.config.firmware_path = event.GetPath().replace("'", "")
             self._on_spin('start')
-            checksum = select_firmware(self)
-            if len(checksum) == 64:
-                self.config.firmware_sha256 = checksum
-            else:
-                self.config.firmware_sha256 = None
-            self.firmware_picker.SetToolTip(f"SHA-256: {checksum}")
+            select_firmware(self)
             self._on_spin('stop')
 
         # -----------------------------------------------
@@ -1709,7 +1734,7 @@ class PixelFlasher(wx.Frame):
                 device = get_phone()
                 device.lock_bootloader()
                 time.sleep(5)
-                self.device_choice.SetItems(get_connected_devices())
+                self.device_choice.SetItems(get_connected_devices(rescan=True))
                 self._select_configured_device()
                 self._on_spin('stop')
 
@@ -1749,7 +1774,7 @@ class PixelFlasher(wx.Frame):
                 device = get_phone()
                 device.unlock_bootloader()
                 time.sleep(5)
-                self.device_choice.SetItems(get_connected_devices())
+                self.device_choice.SetItems(get_connected_devices(rescan=True))
                 self._select_configured_device()
                 self._on_spin('stop')
 
@@ -1787,7 +1812,7 @@ class PixelFlasher(wx.Frame):
                 device = get_phone()
                 device.disable_magisk_modules()
                 time.sleep(5)
-                self.device_choice.SetItems(get_connected_devices())
+                self.device_choice.SetItems(get_connected_devices(rescan=True))
                 self._select_configured_device()
                 self._on_spin('stop')
 
@@ -1910,7 +1935,7 @@ class PixelFlasher(wx.Frame):
                 print(f"User clicked on Set Active slot: Target [{slot}]")
                 device.set_active_slot(slot)
                 time.sleep(5)
-                self.device_choice.SetItems(get_connected_devices())
+                self.device_choice.SetItems(get_connected_devices(rescan=True))
                 self._select_configured_device()
                 self._on_spin('stop')
 
@@ -2050,7 +2075,14 @@ class PixelFlasher(wx.Frame):
                         PACKAGE.type as package_type,
                         PACKAGE.package_sig,
                         PACKAGE.file_path as package_path,
-                        PACKAGE.epoch as package_date
+                        PACKAGE.epoch as package_date,
+                        BOOT.header_version,
+                        BOOT.os_version,
+                        BOOT.os_patch_level,
+                        BOOT.kernel_size,
+                        BOOT.ramdisk_size,
+                        BOOT.cmdline,
+                        BOOT.has_magisk_ramdisk
                     FROM BOOT
                     JOIN PACKAGE_BOOT
                         ON BOOT.id = PACKAGE_BOOT.boot_id
@@ -2077,6 +2109,13 @@ class PixelFlasher(wx.Frame):
                         boot.package_sig = row[12]
                         boot.package_path = row[13]
                         boot.package_epoch = row[14]
+                        boot.header_version = row[15]
+                        boot.os_version = row[16]
+                        boot.os_patch_level = row[17]
+                        boot.kernel_size = row[18]
+                        boot.ramdisk_size = row[19]
+                        boot.cmdline = row[20]
+                        boot.has_magisk_ramdisk = row[21]
                         i += 1
                     if i > 1:
                         debug("INFO: Duplicate PACKAGE_BOOT records found")
@@ -2101,6 +2140,18 @@ class PixelFlasher(wx.Frame):
                 if boot.is_odin == 1:
                     message += f"    Samsung Boot:          True\n"
                 message += f"    Date:                  {ts.strftime('%Y-%m-%d %H:%M:%S')}\n"
+                if boot.header_version is not None and boot.header_version != -1:
+                    message += f"    Boot Header Version:   {boot.header_version}\n"
+                    if boot.os_version:
+                        message += f"    OS Version:            {boot.os_version}\n"
+                    if boot.os_patch_level:
+                        message += f"    OS Patch Level:        {boot.os_patch_level}\n"
+                    message += f"    Kernel Size:           {boot.kernel_size}\n"
+                    message += f"    Ramdisk Size:          {boot.ramdisk_size}\n"
+                    if boot.cmdline:
+                        message += f"    Cmdline:               {boot.cmdline}\n"
+                    if boot.has_magisk_ramdisk is not None:
+                        message += f"    Magisk Ramdisk:        {boot.has_magisk_ramdisk == 1}\n"
                 message += f"    Firmware Fingerprint:  {boot.package_sig}\n"
                 message += f"    Firmware:              {boot.package_path}\n"
                 message += f"    Type:                  {boot.package_type}\n"
@@ -2445,7 +2496,8 @@ class PixelFlasher(wx.Frame):
         self.list.InsertColumn(4, 'Patch Method', wx.LIST_FORMAT_LEFT,  -1)
         self.list.InsertColumn(5, 'Patched on Device', wx.LIST_FORMAT_LEFT,  -1)
         self.list.InsertColumn(6, 'Date', wx.LIST_FORMAT_LEFT,  -1)
-        self.list.InsertColumn(7, 'Package Path', wx.LIST_FORMAT_LEFT,  -1)
+        self.list.InsertColumn(7, 'Boot Header', wx.LIST_FORMAT_LEFT,  -1)
+        self.list.InsertColumn(8, 'Package Path', wx.LIST_FORMAT_LEFT,  -1)
         self.list.SetHeaderAttr(wx.ItemAttr(wx.Colour('BLUE'),wx.Colour('DARK GREY'), wx.Font(wx.FontInfo(10))))
         if sys.platform != "win32":
             self.list.SetFont(wx.Font(11, wx.FONTFAMILY_TELETYPE, wx.FONTSTYLE_NORMAL,wx.FONTWEIGHT_NORMAL))
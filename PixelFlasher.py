@@ -1,4 +1,10 @@
 #!/usr/bin/env python
 
-import Main
-Main.main()
+import multiprocessing
+
+if __name__ == '__main__':
+    # needed so that payload extraction worker processes work in frozen builds.
+    multiprocessing.freeze_support()
+    # imported here, spawned worker processes run this module too and must not load the GUI.
+    import Main
+    Main.main()
@@ -0,0 +1,278 @@
+import os
+import select
+import socket
+import stat
+import struct
+import subprocess
+import threading
+import time
+
+# Where `adb start-server` listens unless ANDROID_ADB_SERVER_PORT says otherwise.
+ADB_SERVER_HOST = '127.0.0.1'
+ADB_SERVER_PORT = 5037
+# Largest DATA chunk the sync protocol accepts.
+SYNC_DATA_MAX = 64 * 1024
+# Shell protocol (v2) packet ids.
+SHELL_STDIN = 0
+SHELL_STDOUT = 1
+SHELL_STDERR = 2
+SHELL_EXIT = 3
+SHELL_CLOSE_STDIN = 4
+
+
+class AdbError(Exception):
+    pass
+
+
+class AdbClient():
+    # Talks to the adb server (the one `adb start-server` runs) over its socket protocol,
+    # so device queries don't spawn the adb binary each time.
+    # Host requests and shells need a connection each, the server closes them when done,
+    # sync connections stay open and are reused per device for further push / pull.
+    def __init__(self, host=ADB_SERVER_HOST, port=None, timeout=10):
+        self.host = host
+        self.port = port or int(os.environ.get('ANDROID_ADB_SERVER_PORT', ADB_SERVER_PORT))
+        self.timeout = timeout
+        self._features = {}
+        self._sync = {}
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    @staticmethod
+    def _recv_exactly(sock, size):
+        data = bytearray()
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionResetError("adb server closed the connection")
+            data += chunk
+        return bytes(data)
+
+    def _read_hex_data(self, sock):
+        size = int(self._recv_exactly(sock, 4), 16)
+        return self._recv_exactly(sock, size)
+
+    def _request(self, sock, request):
+        # sends a host request, raises AdbError with the server's message if it FAILs
+        data = request.encode('utf-8')
+        sock.sendall(b'%04x' % len(data) + data)
+        status = self._recv_exactly(sock, 4)
+        if status == b'FAIL':
+            raise AdbError(self._read_hex_data(sock).decode('utf-8', errors='replace'))
+        if status != b'OKAY':
+            raise AdbError(f"Unexpected response from adb server: {status!r}")
+
+    def _host_query(self, request):
+        with self._connect() as sock:
+            self._request(sock, request)
+            return self._read_hex_data(sock).decode('utf-8', errors='replace')
+
+    def _transport(self, serial, service):
+        sock = self._connect()
+        try:
+            self._request(sock, f"host:transport:{serial}")
+            self._request(sock, service)
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    def version(self):
+        return int(self._host_query('host:version'), 16)
+
+    @staticmethod
+    def _parse_devices(text):
+        devices = []
+        for line in text.splitlines():
+            if '\t' in line:
+                serial, state = line.split('\t', 1)
+                devices.append((serial, state))
+        return devices
+
+    def devices(self):
+        # returns [(serial, state)], same as `adb devices`
+        return self._parse_devices(self._host_query('host:devices'))
+
+    def track_devices(self, stop=None):
+        # yields the device list [(serial, state)] right away and again whenever it changes,
+        # until the server goes away (AdbError / OSError) or the stop event is set
+        with self._connect() as sock:
+            self._request(sock, 'host:track-devices')
+            while not (stop and stop.is_set()):
+                # wait for a whole update with a short timeout, so that stop is noticed
+                readable, _, _ = select.select([sock], [], [], 1)
+                if not readable:
+                    continue
+                sock.settimeout(self.timeout)
+                yield self._parse_devices(self._read_hex_data(sock).decode('utf-8', errors='replace'))
+
+    def features(self, serial):
+        if serial not in self._features:
+            self._features[serial] = set(self._host_query(f"host-serial:{serial}:features").strip().split(','))
+        return self._features[serial]
+
+    def shell(self, serial, cmd, timeout=None):
+        # runs cmd with the shell v2 protocol, which carries stderr and the exit code separately
+        # returns a subprocess.CompletedProcess like runtime.run_shell
+        if 'shell_v2' not in self.features(serial):
+            raise AdbError(f"{serial} does not support the shell v2 protocol")
+        sock = self._transport(serial, f"shell,v2,raw:{cmd}")
+        deadline = None if timeout is None else time.time() + timeout
+        stdout = bytearray()
+        stderr = bytearray()
+        returncode = None
+        with sock:
+            sock.sendall(struct.pack('<BI', SHELL_CLOSE_STDIN, 0))
+            while returncode is None:
+                sock.settimeout(None if deadline is None else max(deadline - time.time(), 0.001))
+                try:
+                    packet_id, size = struct.unpack('<BI', self._recv_exactly(sock, 5))
+                    data = self._recv_exactly(sock, size)
+                except socket.timeout:
+                    raise subprocess.TimeoutExpired(cmd, timeout, bytes(stdout), bytes(stderr)) from None
+                except ConnectionError:
+                    # connection dropped without an exit packet, e.g. the device went away
+                    returncode = 255
+                    break
+                if packet_id == SHELL_STDOUT:
+                    stdout += data
+                elif packet_id == SHELL_STDERR:
+                    stderr += data
+                elif packet_id == SHELL_EXIT:
+                    returncode = data[0] if data else 255
+        return subprocess.CompletedProcess(cmd, returncode, stdout.decode('ISO-8859-1', errors='replace'), stderr.decode('ISO-8859-1', errors='replace'))
+
+    def _sync_connection(self, serial):
+        # returns a sync connection and whether it came from the pool
+        with self._lock:
+            sock = self._sync.pop(serial, None)
+        if sock:
+            return sock, True
+        return self._transport(serial, 'sync:'), False
+
+    def _release_sync_connection(self, serial, sock):
+        with self._lock:
+            if serial not in self._sync:
+                self._sync[serial] = sock
+                return
+        self._sync_quit(sock)
+
+    @staticmethod
+    def _sync_send(sock, command, data):
+        sock.sendall(command + struct.pack('<I', len(data)) + data)
+
+    def _sync_read(self, sock):
+        command, size = struct.unpack('<4sI', self._recv_exactly(sock, 8))
+        return command, size
+
+    def _sync_quit(self, sock):
+        try:
+            self._sync_send(sock, b'QUIT', b'')
+        except OSError:
+            pass
+        sock.close()
+
+    def _run_sync(self, serial, action):
+        # runs action(sock) on a pooled sync connection, a connection is only reused if action completed
+        sock, reused = self._sync_connection(serial)
+        try:
+            res = action(sock)
+        except OSError:
+            sock.close()
+            if not reused:
+                raise
+            # the pooled connection went stale (device reconnected), try once more on a fresh one
+            sock = self._transport(serial, 'sync:')
+            try:
+                res = action(sock)
+            except Exception:
+                sock.close()
+                raise
+        except Exception:
+            sock.close()
+            raise
+        self._release_sync_connection(serial, sock)
+        return res
+
+    def stat(self, serial, remote_path):
+        # returns (mode, size, mtime), mode 0 if the path doesn't exist
+        def action(sock):
+            self._sync_send(sock, b'STAT', remote_path.encode('utf-8'))
+            command, mode = self._sync_read(sock)
+            size, mtime = struct.unpack('<II', self._recv_exactly(sock, 8))
+            if command != b'STAT':
+                raise AdbError(f"Unexpected sync response: {command!r}")
+            return mode, size, mtime
+        return self._run_sync(serial, action)
+
+    def push(self, serial, local_path, remote_path, mode=None):
+        st = os.stat(local_path)
+        if mode is None:
+            mode = stat.S_IMODE(st.st_mode) | 0o644
+
+        def action(sock):
+            self._sync_send(sock, b'SEND', f"{remote_path},{stat.S_IFREG | mode}".encode('utf-8'))
+            with open(local_path, 'rb') as f:
+                while True:
+                    chunk = f.read(SYNC_DATA_MAX)
+                    if not chunk:
+                        break
+                    self._sync_send(sock, b'DATA', chunk)
+            sock.sendall(b'DONE' + struct.pack('<I', int(st.st_mtime)))
+            command, size = self._sync_read(sock)
+            if command == b'FAIL':
+                raise AdbError(self._recv_exactly(sock, size).decode('utf-8', errors='replace'))
+            if command != b'OKAY':
+                raise AdbError(f"Unexpected sync response: {command!r}")
+            return st.st_size
+        return self._run_sync(serial, action)
+
+    def pull(self, serial, remote_path, local_path):
+        # writes to a .part file first so a failed pull doesn't leave a truncated local_path
+        if os.path.isdir(local_path):
+            local_path = os.path.join(local_path, remote_path.rstrip('/').split('/')[-1])
+        temp_path = f"{local_path}.part"
+
+        def action(sock):
+            self._sync_send(sock, b'RECV', remote_path.encode('utf-8'))
+            total = 0
+            with open(temp_path, 'wb') as f:
+                while True:
+                    command, size = self._sync_read(sock)
+                    if command == b'DATA':
+                        f.write(self._recv_exactly(sock, size))
+                        total += size
+                    elif command == b'DONE':
+                        break
+                    elif command == b'FAIL':
+                        raise AdbError(self._recv_exactly(sock, size).decode('utf-8', errors='replace'))
+                    else:
+                        raise AdbError(f"Unexpected sync response: {command!r}")
+            return total
+        try:
+            total = self._run_sync(serial, action)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        os.replace(temp_path, local_path)
+        return total
+
+    def forget(self, serial):
+        # drops cached state of a device, e.g. after it rebooted or disconnected
+        self._features.pop(serial, None)
+        with self._lock:
+            sock = self._sync.pop(serial, None)
+        if sock:
+            self._sync_quit(sock)
+
+    def close(self):
+        with self._lock:
+            socks = list(self._sync.values())
+            self._sync.clear()
+        for sock in socks:
+            self._sync_quit(sock)
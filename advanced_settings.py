@@ -111,6 +111,15 @@ IT IS YOUR RESPONSIBILITY TO ENSURE THAT YOU KNOW WHAT YOU ARE DOING.
         use_busybox_shell_cb_sizer.Add(self.use_busybox_shell_checkbox, 0, wx.ALL, 5)
         vSizer.Add(use_busybox_shell_cb_sizer, 0, wx.EXPAND, 5)
 
+        # Use Native ADB Client
+        use_native_adb_cb_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        use_native_adb_cb_sizer.Add((20, 0), 0, 0, 5)
+        self.use_native_adb_checkbox = wx.CheckBox(self, wx.ID_ANY, u"Use Native ADB Client", wx.DefaultPosition, wx.DefaultSize, 0)
+        self.use_native_adb_checkbox.SetValue(get_use_native_adb())
+        self.use_native_adb_checkbox.SetToolTip(u"Talk to the adb server directly for shell commands, push and pull instead of running adb for each of them.\nFalls back to adb if the server can't be reached.")
+        use_native_adb_cb_sizer.Add(self.use_native_adb_checkbox, 0, wx.ALL, 5)
+        vSizer.Add(use_native_adb_cb_sizer, 0, wx.EXPAND, 5)
+
         # Check for updates options
         check_for_update_sizer = wx.BoxSizer(wx.HORIZONTAL)
         check_for_update_sizer.Add((20, 0), 0, 0, 5)
@@ -226,6 +235,10 @@ IT IS YOUR RESPONSIBILITY TO ENSURE THAT YOU KNOW WHAT YOU ARE DOING.
             print(f"Setting Use Busybox Shell to: {self.use_busybox_shell_checkbox.GetValue()}")
         set_use_busybox_shell_settings(self.use_busybox_shell_checkbox.GetValue())
 
+        if self.use_native_adb_checkbox.GetValue() != get_use_native_adb():
+            print(f"Setting Use Native ADB Client to: {self.use_native_adb_checkbox.GetValue()}")
+        set_use_native_adb(self.use_native_adb_checkbox.GetValue())
+
         if self.check_for_update_checkbox.GetValue() != get_update_check():
             print(f"Setting Check for updates to: {self.check_for_update_checkbox.GetValue()}")
         set_update_check(self.check_for_update_checkbox.GetValue())
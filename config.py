@@ -48,6 +48,7 @@ class Config():
         self.dev_mode = False
         self.offer_patch_methods = False
         self.use_busybox_shell = False
+        self.use_native_adb = False
         self.linux_file_explorer = ''
         self.linux_shell = ''
         self.firmware_has_init_boot = False
@@ -140,6 +141,8 @@ class Config():
                     conf.offer_patch_methods = data['offer_patch_methods']
                 with contextlib.suppress(Exception):
                     conf.use_busybox_shell = data['use_busybox_shell']
+                with contextlib.suppress(Exception):
+                    conf.use_native_adb = data['use_native_adb']
                 with contextlib.suppress(Exception):
                     conf.linux_file_explorer = data['linux_file_explorer']
                 with contextlib.suppress(Exception):
@@ -202,6 +205,7 @@ class Config():
             'dev_mode': self.dev_mode,
             'offer_patch_methods': self.offer_patch_methods,
             'use_busybox_shell': self.use_busybox_shell,
+            'use_native_adb': self.use_native_adb,
             'linux_file_explorer': self.linux_file_explorer,
             'linux_shell': self.linux_shell,
             'firmware_has_init_boot': self.firmware_has_init_boot,
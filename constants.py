@@ -9,3 +9,31 @@ HEIGHT = 1040
 POS_X = 40
 POS_Y = 40
 KNOWN_INIT_BOOT_DEVICES = ['panther', 'cheetah', 'lynx']
+HASH_CHUNK_SIZE = 4 * 1024 * 1024
+# files modified more recently than this (in ns) are hashed but not cached
+HASH_CACHE_MIN_AGE_NS = 2 * 1000 * 1000 * 1000
+ARCHIVE_COPY_CHUNK_SIZE = 1024 * 1024
+
+# boot image markers: marker -> (bytes of value to keep, bytes to skip after the marker)
+BOOT_MARKERS = {
+    'SHA1=': (64, 0),
+    'fingerprint': (65, 1),
+    'KEEPVERITY=': (5, 0),
+    'KEEPFORCEENCRYPT=': (5, 0),
+    'PATCHVBMETAFLAG=': (5, 0),
+    'RECOVERYMODE=': (5, 0),
+}
+# ramdisk bytes read / decompressed when looking for a Magisk patched ramdisk
+BOOT_RAMDISK_SCAN_LIMIT = 64 * 1024 * 1024
+# idle adb shell sessions kept per device and shell type (user / root)
+ADB_SHELL_POOL_SIZE = 2
+# seconds to wait for a new adb shell session (and su grant) to come up
+ADB_SHELL_START_TIMEOUT = 30
+# seconds a device shell command may run when the caller doesn't give a timeout
+ADB_SHELL_TIMEOUT = 300
+# devices initialized in parallel when scanning, and seconds after which a device is skipped
+DEVICE_SCAN_WORKERS = 8
+DEVICE_INIT_TIMEOUT = 60
+# seconds between fastboot device polls of the device watcher, and before it retries a device that failed to initialize
+FASTBOOT_POLL_INTERVAL = 2
+DEVICE_RETRY_INTERVAL = 30
@@ -21,7 +21,7 @@ from constants import *
 from file_editor import FileEditor
 from magisk_downloads import MagiskDownloads
 from message_box_ex import MessageBoxEx
-from payload_dumper import extract_payload
+from payload_dumper import extract_payload, get_stored_member_offset
 from phone import get_connected_devices
 from runtime import *
 
@@ -76,8 +76,9 @@ def check_platform_tools(self):
             fastboot = os.path.join(self.config.platform_tools_path, fastboot_binary)
             set_adb(adb)
             set_fastboot(fastboot)
-            set_adb_sha256(sha256(adb))
-            set_fastboot_sha256(sha256(fastboot))
+            hashes = multi_hash_files([adb, fastboot], ('sha256',))
+            set_adb_sha256(hashes[adb]['sha256'])
+            set_fastboot_sha256(hashes[fastboot]['sha256'])
             res = identify_sdk_version(self)
             print(f"SDK Version:      {get_sdk_version()}")
             print(f"Adb SHA256:       {get_adb_sha256()}")
@@ -166,7 +167,10 @@ def populate_boot_list(self):
             PACKAGE.package_sig,
             PACKAGE.file_path as package_path,
             PACKAGE.epoch as package_date,
-            BOOT.is_odin
+            BOOT.is_odin,
+            BOOT.header_version,
+            BOOT.os_version,
+            BOOT.os_patch_level
         FROM BOOT
         JOIN PACKAGE_BOOT
             ON BOOT.id = PACKAGE_BOOT.boot_id
@@ -184,6 +188,12 @@ def populate_boot_list(self):
             firmware_path = self.config.firmware_path
         sql += f"AND package.file_path IN (\'{firmware_path}\', \'{rom_path}\');"
 
+    # parse the headers of boot images recorded before the header columns existed, once.
+    with contextlib.suppress(Exception):
+        missing = con.execute("SELECT boot_hash, file_path FROM BOOT WHERE header_version IS NULL").fetchall()
+        for boot_hash, file_path in missing:
+            update_boot_header_info(con, boot_hash, file_path)
+
     with con:
         data = con.execute(sql)
         i = 0
@@ -197,7 +207,11 @@ def populate_boot_list(self):
             self.list.SetItem(index, 5, row[6])                             # hardware
             ts = datetime.fromtimestamp(row[7])
             self.list.SetItem(index, 6, ts.strftime('%Y-%m-%d %H:%M:%S'))   # boot_date
-            self.list.SetItem(index, 7, row[12])                            # package_path
+            header = ''
+            if row[15] is not None and row[15] != -1:
+                header = f"v{row[15]} {row[16] or ''} {row[17] or ''}".strip()
+            self.list.SetItem(index, 7, header)                             # boot header version / os version / patch level
+            self.list.SetItem(index, 8, row[12])                            # package_path
             if row[3]:
                 self.list.SetItemColumnImage(i, 0, 0)
             else:
@@ -362,7 +376,7 @@ def wifi_adb_connect(self, value, disconnect = False):
         if res.returncode == 0 and 'cannot' not in res.stdout and 'failed' not in res.stdout:
             print(f"ADB {command}ed: {ip}:{port}")
             puml(f"#palegreen:Succeeded;\n")
-            self.device_choice.SetItems(get_connected_devices())
+            self.device_choice.SetItems(get_connected_devices(rescan=True))
             self._select_configured_device()
             if not disconnect:
                 print(f"Please select the device: {ip}:{port}")
@@ -387,7 +401,7 @@ def adb_kill_server(self):
         if res.returncode == 0:
             print("returncode: 0")
             puml(f"#palegreen:Succeeded;\n")
-            self.device_choice.SetItems(get_connected_devices())
+            self.device_choice.SetItems(get_connected_devices(rescan=True))
             self._select_configured_device()
             return 0
         else:
@@ -426,19 +440,6 @@ def select_firmware(self):
     extension = extension.lower()
     if extension in ['.zip', '.tgz', '.tar']:
         print(f"{datetime.now():%Y-%m-%d %H:%M:%S} The following firmware is selected:\n{firmware}")
-        firmware_hash = sha256(self.config.firmware_path)
-        print(f"Selected Firmware {firmware} SHA-256: {firmware_hash}")
-        puml(f"note right\n{firmware}\nSHA-256: {firmware_hash}\nend note\n")
-
-        # Check to see if the first 8 characters of the checksum is in the filename, Google published firmwares do have this.
-        if firmware_hash[:8] in firmware:
-            print(f"Expected to match {firmware_hash[:8]} in the filename and did. This is good!")
-            puml(f"#CDFFC8:Checksum matches portion of the filename {firmware};\n")
-            set_firmware_hash_validity(True)
-        else:
-            print(f"WARNING: Expected to match {firmware_hash[:8]} in the filename but didn't, please double check to make sure the checksum is good.")
-            puml("#orange:Unable to match the checksum in the filename;\n")
-            set_firmware_hash_validity(False)
 
         firmware = filename.split("-")
         if len(firmware) == 1:
@@ -466,14 +467,104 @@ def select_firmware(self):
         else:
             self.flash_button.Disable()
         populate_boot_list(self)
-        self.update_widget_states()
-        return firmware_hash
+        # the hash is computed in the background, Process is enabled once it is known.
+        start_firmware_hashing(self, self.config.firmware_path)
     else:
         print(f"{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: The selected file {firmware} is not a valid archive file.")
         puml("#red:The selected firmware is not valid;\n")
         self.config.firmware_path = None
+        self.config.firmware_sha256 = None
         self.firmware_picker.SetPath('')
-        return 'Select Pixel Firmware'
+        self.firmware_picker.SetToolTip('Select Pixel Firmware')
+
+
+# ============================================================================
+#                               Function start_firmware_hashing
+# ============================================================================
+def start_firmware_hashing(self, firmware_path):
+    set_firmware_hash_pending(True)
+    set_firmware_hash_validity(False)
+    self.config.firmware_sha256 = None
+    self.firmware_picker.SetToolTip("SHA-256: computing ...")
+    self.update_widget_states()
+    hash_file_async(firmware_path, 'sha256', lambda firmware_hash: set_firmware_hash(self, firmware_path, firmware_hash), progress=get_hash_progress_handler(self, ntpath.basename(firmware_path)))
+
+
+# ============================================================================
+#                               Function set_firmware_hash
+# ============================================================================
+def set_firmware_hash(self, firmware_path, firmware_hash):
+    if firmware_path != self.config.firmware_path:
+        # a different firmware got selected while this one was being hashed.
+        return
+    set_firmware_hash_pending(False)
+    with contextlib.suppress(Exception):
+        self.statusBar.SetStatusText('', 1)
+    if not firmware_hash:
+        print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: Could not compute the SHA-256 of {firmware_path}")
+        puml("#red:Could not compute the firmware checksum;\n")
+        set_firmware_hash_validity(False)
+        self.firmware_picker.SetToolTip('Select Pixel Firmware')
+        self.update_widget_states()
+        return
+    firmware = ntpath.basename(firmware_path)
+    print(f"Selected Firmware {firmware} SHA-256: {firmware_hash}")
+    puml(f"note right\n{firmware}\nSHA-256: {firmware_hash}\nend note\n")
+
+    # Check to see if the first 8 characters of the checksum is in the filename, Google published firmwares do have this.
+    if firmware_hash[:8] in firmware:
+        print(f"Expected to match {firmware_hash[:8]} in the filename and did. This is good!")
+        puml(f"#CDFFC8:Checksum matches portion of the filename {firmware};\n")
+        set_firmware_hash_validity(True)
+    else:
+        print(f"WARNING: Expected to match {firmware_hash[:8]} in the filename but didn't, please double check to make sure the checksum is good.")
+        puml("#orange:Unable to match the checksum in the filename;\n")
+        set_firmware_hash_validity(False)
+    self.config.firmware_sha256 = firmware_hash
+    self.firmware_picker.SetToolTip(f"SHA-256: {firmware_hash}")
+    self.update_widget_states()
+
+
+# ============================================================================
+#                               Function get_hash_progress_handler
+# ============================================================================
+def get_hash_progress_handler(self, name, interval=0.5):
+    # called from the hashing thread, the status bar is updated on the main thread.
+    last_update = [0]
+    start = time.time()
+
+    def handler(bytes_done, bytes_total):
+        now = time.time()
+        if bytes_done < bytes_total and now - last_update[0] < interval:
+            return
+        last_update[0] = now
+        percent = bytes_done * 100 // max(bytes_total, 1)
+        rate = bytes_done / max(now - start, 0.001) / (1024 * 1024)
+        with contextlib.suppress(Exception):
+            wx.CallAfter(self.statusBar.SetStatusText, f"Hashing {name}: {percent}% ({rate:.1f} MB/s)", 1)
+
+    return handler
+
+
+# ============================================================================
+#                               Function get_payload_progress_handler
+# ============================================================================
+def get_payload_progress_handler(self, interval=0.5):
+    # extract_payload reports after every operation, only refresh the status bar every interval seconds.
+    last_update = [0]
+
+    def handler(event):
+        now = time.time()
+        if not event.done and now - last_update[0] < interval:
+            return
+        last_update[0] = now
+        eta = f", ETA {event.eta:.0f}s" if event.eta else ''
+        percent = event.bytes_done * 100 // max(event.bytes_total, 1)
+        with contextlib.suppress(Exception):
+            self.statusBar.SetStatusText(f"Extracting {event.partition}: {percent}% ({event.rate:.1f} MB/s{eta})", 1)
+            wx.Yield()
+
+    return handler
 
 
 # ============================================================================
@@ -486,7 +577,6 @@ def process_file(self, file_type):
     print("==============================================================================")
     puml(f"#cyan:Process {file_type};\n", True)
     config_path = get_config_path()
-    path_to_7z = get_path_to_7z()
     boot_images = os.path.join(config_path, get_boot_images_dir())
     tmp_dir_full = os.path.join(config_path, 'tmp')
     con = get_db()
@@ -503,10 +593,12 @@ def process_file(self, file_type):
         file_to_process = self.config.firmware_path
         package_sig = get_firmware_id()
         package_dir_full = os.path.join(factory_images, package_sig)
-        found_flash_all_bat = check_archive_contains_file(archive_file_path=file_to_process, file_to_check="flash-all.bat", nested=False)
-        found_flash_all_sh = check_archive_contains_file(archive_file_path=file_to_process, file_to_check="flash-all.sh", nested=False)
-        found_boot_img = check_archive_contains_file(archive_file_path=file_to_process, file_to_check="boot.img", nested=True)
-        found_init_boot_img = check_archive_contains_file(archive_file_path=file_to_process, file_to_check="init_boot.img", nested=True)
+        # scan the archive (and the archives nested in it) once, all the lookups below are answered from the index.
+        archive = get_archive_index(file_to_process)
+        found_flash_all_bat = archive.find("flash-all.bat", nested=False)
+        found_flash_all_sh = archive.find("flash-all.sh", nested=False)
+        found_boot_img = archive.find("boot.img", nested=True)
+        found_init_boot_img = archive.find("init_boot.img", nested=True)
         found_boot_img_lz4 = ''
         set_firmware_has_init_boot(False)
         if found_init_boot_img:
@@ -514,16 +606,13 @@ def process_file(self, file_type):
         if found_flash_all_bat and found_flash_all_sh and get_firmware_hash_validity():
             # assume Pixel factory file
             print("Detected Pixel firmware")
-            image_file_path = os.path.join(package_dir_full, f"image-{package_sig}.zip")
-            # Unzip the factory image
-            debug(f"Unzipping Image: {file_to_process} into {package_dir_full} ...")
-            theCmd = f"\"{path_to_7z}\" x -bd -y -o\"{factory_images}\" \"{file_to_process}\""
-            debug(theCmd)
-            res = run_shell2(theCmd)
+            # boot / init_boot are read straight out of the nested image zip,
+            # the factory package itself is only unpacked when it is needed for flashing.
+            image_file_path = file_to_process
         elif found_boot_img or found_init_boot_img:
             print(f"Detected Non Pixel firmware, with: {found_boot_img} {found_init_boot_img}")
             image_file_path = file_to_process
-        elif check_zip_contains_file(file_to_process, "payload.bin"):
+        elif archive.kind == 'zip' and archive.find("payload.bin"):
             is_payload_bin = True
             if get_firmware_hash_validity() and get_ota():
                 print("Detected OTA file, please select a firmware file")
@@ -534,7 +623,7 @@ def process_file(self, file_type):
             # Samsung firmware handling
             # -------------------------
             # Get file list from zip
-            file_list = get_zip_file_list(file_to_process)
+            file_list = archive.namelist()
             patterns = {
                 'AP': 'AP_*.tar.md5',
                 'BL': 'BL_*.tar.md5',
@@ -568,39 +657,33 @@ def process_file(self, file_type):
                 # assume Samsung firmware
                 print("Detected Samsung firmware")
                 image_file_path = os.path.join(package_dir_full, found_ap)
-                # Unzip the factory image
+                # Unzip the factory image, the package files are needed for flashing with Odin.
                 debug(f"Unzipping Image: {file_to_process} into {package_dir_full} ...")
-                theCmd = f"\"{path_to_7z}\" x -bd -y -o\"{package_dir_full}\" \"{file_to_process}\""
-                debug(theCmd)
-                res = run_shell2(theCmd)
+                res = unpack_archive(file_to_process, package_dir_full)
+                if res != 0:
+                    puml("#red:ERROR: Could not unzip the firmware;\n")
+                    print("Aborting ...\n")
+                    return
                 # see if there is boot.img.lz4 in AP file
                 found_boot_img_lz4 = check_archive_contains_file(archive_file_path=image_file_path, file_to_check="boot.img.lz4", nested=False)
                 if found_boot_img_lz4:
-                    print(f"Extracting boot.img.lz4 from {found_ap} ...")
-                    puml(f":Extract boot.img.lz4;\n")
-                    theCmd = f"\"{path_to_7z}\" x -bd -y -o\"{package_dir_full}\" \"{image_file_path}\" boot.img.lz4"
-                    debug(f"{theCmd}")
-                    res = run_shell(theCmd)
-                    # expect ret 0
-                    if res.returncode != 0:
-                        print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: Could not extract boot.img.lz4")
-                        print(res.stderr)
-                        puml("#red:ERROR: Could not extract boot.img.lz4;\n")
+                    # decompress boot.img.lz4 straight out of the AP tar, without writing the .lz4 to disk
+                    print(f"Unpacking boot.img.lz4 from {found_ap} ...")
+                    puml(f":Unpack boot.img.lz4;\n")
+                    try:
+                        with open_archive_member(image_file_path, found_boot_img_lz4) as boot_img_lz4:
+                            res = unpack_lz4(boot_img_lz4, os.path.join(package_dir_full, 'boot.img'))
+                    except Exception as e:
+                        print(e)
+                        res = -1
+                    # Check if it exists
+                    if res != -1 and os.path.exists(os.path.join(package_dir_full, 'boot.img')):
+                        found_boot_img = 'boot.img'
+                    else:
+                        print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: Could not unpack boot.img.lz4")
+                        puml("#red:ERROR: Could not unpack boot.img.lz4;\n")
                         print("Aborting ...\n")
                         return
-                    else:
-                        # unpack boot.img.lz4
-                        print("Unpacking boot.img.lz4 ...")
-                        puml(f":Unpack boot.img.lz4;\n")
-                        unpack_lz4(os.path.join(package_dir_full, 'boot.img.lz4'), os.path.join(package_dir_full, 'boot.img'))
-                        # Check if it exists
-                        if os.path.exists(os.path.join(package_dir_full, 'boot.img')):
-                            found_boot_img = 'boot.img'
-                        else:
-                            print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: Could not unpack boot.img.lz4")
-                            puml("#red:ERROR: Could not unpack boot.img.lz4;\n")
-                            print("Aborting ...\n")
-                            return
                 else:
                     print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: Could not find boot.img.lz4")
                     puml("#red:ERROR: Could not find boot.img.lz4;\n")
@@ -612,12 +695,13 @@ def process_file(self, file_type):
                 return
     else:
         file_to_process = self.config.custom_rom_path
-        found_boot_img = check_archive_contains_file(archive_file_path=file_to_process, file_to_check="boot.img", nested=False)
-        found_init_boot_img = check_archive_contains_file(archive_file_path=file_to_process, file_to_check="init_boot.img", nested=False)
+        archive = get_archive_index(file_to_process)
+        found_boot_img = archive.find("boot.img", nested=False)
+        found_init_boot_img = archive.find("init_boot.img", nested=False)
         set_rom_has_init_boot(False)
         if found_init_boot_img:
             set_rom_has_init_boot(True)
-        elif check_zip_contains_file(file_to_process, "payload.bin"):
+        elif archive.kind == 'zip' and archive.find("payload.bin"):
             print("Detected a ROM, with payload.bin")
             is_payload_bin = True
         package_sig = get_custom_rom_id()
@@ -640,26 +724,29 @@ def process_file(self, file_type):
     delete_all(tmp_dir_full)
 
     if is_payload_bin:
-        # extract the payload.bin into a temporary directory
-        temp_dir = tempfile.TemporaryDirectory()
-        temp_dir_path = temp_dir.name
-        print(f"Extracting payload.bin from {file_to_process} ...")
-        puml(":Extract payload.bin;\n")
-        theCmd = f"\"{path_to_7z}\" x -bd -y -o\"{temp_dir_path}\" \"{file_to_process}\" payload.bin"
-        debug(f"{theCmd}")
-        res = run_shell(theCmd)
-        # expect ret 0
-        if res.returncode != 0:
-            print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: Could not extract payload.bin.")
-            print(res.stderr)
-            puml("#red:ERROR: Could not extract payload.bin;\n")
-            print("Aborting ...\n")
-            return
-        # extract boot.img, init_boot.img, vbmeta.img from payload.bin
-        payload_file_path = os.path.join(temp_dir_path, "payload.bin")
         if not os.path.exists(package_dir_full):
             os.makedirs(package_dir_full, exist_ok=True)
-        extract_payload(payload_file_path, out=package_dir_full, diff=False, old='old', images='boot,vbmeta,init_boot')
+        # payload.bin is normally stored uncompressed, in which case we read it in place from the archive.
+        payload_member = archive.find("payload.bin")
+        if get_stored_member_offset(file_to_process, payload_member) != -1:
+            print(f"Reading payload.bin in place from {file_to_process} ...")
+            puml(":Read payload.bin in place;\n")
+            extract_payload(file_to_process, out=package_dir_full, diff=False, old='old', images='boot,vbmeta,init_boot', workers=None, member=payload_member, index_dir=get_sys_config_path(), progress=get_payload_progress_handler(self))
+        else:
+            # extract the payload.bin into a temporary directory
+            temp_dir = tempfile.TemporaryDirectory()
+            temp_dir_path = temp_dir.name
+            print(f"Extracting payload.bin from {file_to_process} ...")
+            puml(":Extract payload.bin;\n")
+            res = extract_archive_member(file_to_process, payload_member, os.path.join(temp_dir_path, "payload.bin"))
+            if res != 0:
+                print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: Could not extract payload.bin.")
+                puml("#red:ERROR: Could not extract payload.bin;\n")
+                print("Aborting ...\n")
+                return
+            # extract boot.img, init_boot.img, vbmeta.img from payload.bin
+            payload_file_path = os.path.join(temp_dir_path, "payload.bin")
+            extract_payload(payload_file_path, out=package_dir_full, diff=False, old='old', images='boot,vbmeta,init_boot', workers=None, index_dir=get_sys_config_path(), progress=get_payload_progress_handler(self))
         if os.path.exists(os.path.join(package_dir_full, 'boot.img')):
             boot_img_file = os.path.join(package_dir_full, 'boot.img')
             shutil.copy(boot_img_file, os.path.join(tmp_dir_full, 'boot.img'), follow_symlinks=True)
@@ -680,14 +767,14 @@ def process_file(self, file_type):
             print("Aborting ...\n")
             return
 
-        files_to_extract = ''
+        # members as found in the archive index, these can be inside a nested archive.
+        files_to_extract = []
         if found_boot_img:
             boot_file_name = 'boot.img'
-            files_to_extract += 'boot.img '
+            files_to_extract.append(found_boot_img)
         if found_init_boot_img:
             boot_file_name = 'init_boot.img'
-            files_to_extract += 'init_boot.img '
-        files_to_extract = files_to_extract.strip()
+            files_to_extract.append(found_init_boot_img)
 
         if not is_odin:
             if not files_to_extract:
@@ -698,16 +785,13 @@ def process_file(self, file_type):
 
             print(f"Extracting {boot_file_name} from {image_file_path} ...")
             puml(f":Extract {boot_file_name};\n")
-            theCmd = f"\"{path_to_7z}\" x -bd -y -o\"{tmp_dir_full}\" \"{image_file_path}\" {files_to_extract}"
-            debug(f"{theCmd}")
-            res = run_shell(theCmd)
-            # expect ret 0
-            if res.returncode != 0:
-                print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: Could not extract {boot_file_name}.")
-                print(res.stderr)
-                puml(f"#red:ERROR: Could not extract {boot_file_name};\n")
-                print("Aborting ...\n")
-                return
+            for member in files_to_extract:
+                res = extract_archive_member(image_file_path, member, os.path.join(tmp_dir_full, os.path.basename(member)))
+                if res != 0:
+                    print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: Could not extract {boot_file_name}.")
+                    puml(f"#red:ERROR: Could not extract {boot_file_name};\n")
+                    print("Aborting ...\n")
+                    return
 
     # sometimes the return code is 0 but no file to extract, handle that case.
     # also handle the case of extraction from payload.bin
@@ -766,6 +850,9 @@ def process_file(self, file_type):
         print(e)
     boot_id = cursor.lastrowid
     print(f"Boot ID: {boot_id}")
+    header = update_boot_header_info(con, checksum, cached_boot_img_path)
+    if header and header.header_version != -1:
+        print(f"Boot header: {header.summary}")
     # if boot_id record does not exist, set it to 0
     cursor.execute(f"SELECT ID FROM BOOT WHERE id = '{boot_id}'")
     data = cursor.fetchall()
@@ -1916,14 +2003,14 @@ Unless you know what you're doing, it is recommended that you take the default s
         puml("#red:Failed to pull magisk_patched from the phone;\n}\n")
         return
 
-    # get the checksum of the magisk_patched.img
-    print(f"Getting SHA1 of {magisk_patched_img_file} ...")
-    checksum = sha1(os.path.join(magisk_patched_img_file))
+    # get the checksum of the magisk_patched.img and the source boot_file_name in one go
+    print(f"Getting SHA1 of {magisk_patched_img_file} and source {boot_file_name} ...")
+    hashes = multi_hash_files([magisk_patched_img_file, boot_path], ('sha1',))
+    checksum = hashes[magisk_patched_img_file]['sha1']
     print(f"SHA1 of {magisk_patched_img} file: {checksum}")
 
     # get source boot_file_name sha1
-    print(f"\nGetting SHA1 of source {boot_file_name} ...")
-    boot_sha1_long = sha1(boot_path)
+    boot_sha1_long = hashes[boot_path]['sha1']
     boot_sha1 = boot_sha1_long[:8]
     print(f"Source {boot_file_name}'s SHA1 is: {boot_sha1_long}")
 
@@ -2046,6 +2133,7 @@ Unless you know what you're doing, it is recommended that you take the default s
             debug(f"DB BOOT record ID: {boot_id}")
         except Exception as e:
             boot_id = 0
+        update_boot_header_info(con, checksum, cached_boot_img_path)
         # if we didn't insert in BOOT, see if we have a record for the boot being processed in case we need to insert a record into PACKAGE_BOOT
         if boot_id == 0:
             cursor.execute(f"SELECT ID FROM BOOT WHERE boot_hash = '{checksum}'")
@@ -2305,6 +2393,53 @@ def live_flash_boot_phone(self, option):
     return
 
 
+# ============================================================================
+#                               Function prepare_factory_package
+# ============================================================================
+def prepare_factory_package(self, package_dir_full, members):
+    # Pixel factory images are not unpacked when processed, boot / init_boot are read in place.
+    # Instead, the members of the package that flashing references are extracted just before they are used.
+    # members are relative to the package directory, i.e. flash-all.sh, radio-*.img, image-*.zip
+    os.makedirs(package_dir_full, exist_ok=True)
+    firmware_path = self.config.firmware_path
+    if get_ota():
+        return 0
+    if not firmware_path or not os.path.exists(firmware_path):
+        print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: The selected firmware {firmware_path} does not exist.")
+        puml("#red:The selected firmware does not exist;\n")
+        return -1
+    if get_firmware_hash_pending():
+        # the SHA-256 is computed in the background, the package is only trusted once it is known.
+        print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: The firmware hash is not ready yet, please wait for the SHA-256 computation to finish.")
+        puml("#red:Firmware hash is not ready;\n")
+        return -1
+    if not get_firmware_hash_validity():
+        print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: The SHA-256 of {ntpath.basename(firmware_path)} does not match its filename, not extracting it as a factory image.")
+        puml("#red:Firmware hash is not valid;\n")
+        return -1
+    archive = get_archive_index(firmware_path)
+    flash_all = archive.find("flash-all.sh")
+    if not flash_all or not archive.find("flash-all.bat"):
+        print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: {ntpath.basename(firmware_path)} is not a factory image, it has no flash-all files.")
+        puml("#red:Firmware is not a factory image;\n")
+        return -1
+    prefix = flash_all[:-len("flash-all.sh")]
+    for member in members:
+        member_path = f"{prefix}{member}"
+        dest = os.path.join(package_dir_full, member)
+        if member_path not in archive.sizes:
+            # not part of the package, let the flash script report it.
+            debug(f"{member} is not in {firmware_path}")
+            continue
+        if os.path.exists(dest) and os.path.getsize(dest) == archive.sizes[member_path]:
+            continue
+        print(f"Extracting {member} from {ntpath.basename(firmware_path)} ...")
+        puml(f":Extract {member};\n")
+        if extract_archive_member(firmware_path, member_path, dest) != 0:
+            return -1
+    return 0
+
+
 # ============================================================================
 #                               Function flash_phone
 # ============================================================================
@@ -2370,6 +2505,11 @@ def flash_phone(self):
                 return
 
         package_dir_full = os.path.join(factory_images, package_sig)
+        res = prepare_factory_package(self, package_dir_full, ["flash-all.bat", "flash-all.sh"])
+        if res == -1:
+            print("Aborting ...\n")
+            puml("#red:Could not extract flash-all files from the factory image;\n}\n")
+            return
         boot = get_boot()
 
     message = ''
@@ -2662,6 +2802,19 @@ If you insist to continue, you can press the **Continue** button, otherwise plea
                 flash_all_file = flash_all_win32
             else:
                 flash_all_file = flash_all_linux
+
+            # extract only the images the flash script is going to use, a dry run doesn't use any.
+            members = []
+            for f in flash_all_file if self.config.flash_mode != 'dryRun' else []:
+                if f.action == 'flash':
+                    members.append(f.arg2)
+                elif f.action == '-w update' and not (self.config.custom_rom and self.config.advanced_options):
+                    members.append(f.arg1)
+            res = prepare_factory_package(self, package_dir_full, members)
+            if res == -1:
+                print("Aborting ...\n")
+                puml("#red:Could not extract images from the factory image;\n}\n")
+                return
             for f in flash_all_file:
                 if f.type == 'init':
                     data += f"{f.full_line}\n"
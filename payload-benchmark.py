@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+"""
+Benchmark for payload_dumper.extract_payload using synthetic payload.bin files.
+
+Builds a CrAU payload with update_metadata_pb2 out of a configurable mix of
+REPLACE, REPLACE_XZ, REPLACE_BZ, ZERO and SOURCE_BSDIFF operations, then times
+the extraction end to end and per operation type, and reports MB/s and peak RSS.
+
+Example:
+    python payload-benchmark.py --size 512 --mix REPLACE_XZ=6,ZERO=2,REPLACE=1,SOURCE_BSDIFF=1 --workers 1,4
+"""
+import argparse
+import bz2
+import hashlib
+import lzma
+import multiprocessing
+import os
+import random
+import shutil
+import struct
+import sys
+import tempfile
+import time
+
+import bsdiff4
+
+import payload_dumper
+import update_metadata_pb2 as um
+
+BLOCK_SIZE = 4096
+DEFAULT_MIX = 'REPLACE=1,REPLACE_XZ=6,REPLACE_BZ=1,ZERO=2,SOURCE_BSDIFF=1'
+
+
+# ============================================================================
+#                               Function parse_mix
+# ============================================================================
+def parse_mix(mix):
+    weights = {}
+    for item in mix.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip().upper()
+        if name not in ('REPLACE', 'REPLACE_XZ', 'REPLACE_BZ', 'ZERO', 'SOURCE_BSDIFF'):
+            sys.exit(f"Unsupported operation type in mix: {name}")
+        weights[name] = int(weight or 1)
+    return weights
+
+
+# ============================================================================
+#                               Function make_blocks
+# ============================================================================
+def make_blocks(rnd, num_blocks):
+    # roughly what system images look like to a compressor: some incompressible data, some text-like, some empty
+    data = bytearray()
+    for i in range(num_blocks):
+        kind = rnd.random()
+        if kind < 0.4:
+            data += rnd.randbytes(BLOCK_SIZE)
+        elif kind < 0.8:
+            word = rnd.randbytes(16).hex().encode()
+            data += (word * (BLOCK_SIZE // len(word) + 1))[:BLOCK_SIZE]
+        else:
+            data += bytes(BLOCK_SIZE)
+    return bytes(data)
+
+
+# ============================================================================
+#                               Function build_payload
+# ============================================================================
+def build_payload(work_dir, size_mb, mix, blocks_per_op, seed):
+    """Writes payload.bin (and old/system.img for SOURCE_BSDIFF) into work_dir.
+
+    Returns the list of operation types used, in order, and whether diff mode is needed.
+    """
+    rnd = random.Random(seed)
+    weights = parse_mix(mix)
+    types = list(weights)
+    num_blocks = size_mb * 1024 * 1024 // BLOCK_SIZE
+    has_diff = 'SOURCE_BSDIFF' in weights
+
+    dam = um.DeltaArchiveManifest()
+    dam.block_size = BLOCK_SIZE
+    dam.minor_version = 4 if has_diff else 0
+    part = dam.partitions.add()
+    part.partition_name = 'system'
+
+    old_dir = os.path.join(work_dir, 'old')
+    os.makedirs(old_dir, exist_ok=True)
+    old_image = open(os.path.join(old_dir, 'system.img'), 'wb') if has_diff else None
+
+    blobs_path = os.path.join(work_dir, 'blobs.tmp')
+    image_hash = hashlib.sha256()
+    op_types = []
+    data_offset = 0
+    block = 0
+    with open(blobs_path, 'wb') as blobs:
+        while block < num_blocks:
+            count = min(blocks_per_op, num_blocks - block)
+            op_type = rnd.choices(types, [weights[t] for t in types])[0]
+            new_data = make_blocks(rnd, count)
+            op = part.operations.add()
+            op.type = getattr(op, op_type)
+            blob = b''
+            if op_type == 'REPLACE':
+                blob = new_data
+            elif op_type == 'REPLACE_XZ':
+                blob = lzma.compress(new_data, preset=1)
+            elif op_type == 'REPLACE_BZ':
+                blob = bz2.compress(new_data, compresslevel=1)
+            elif op_type == 'ZERO':
+                new_data = bytes(count * BLOCK_SIZE)
+            elif op_type == 'SOURCE_BSDIFF':
+                # the old image differs from the new one in a few places per op
+                old_data = bytearray(new_data)
+                for i in range(8):
+                    pos = rnd.randrange(len(old_data))
+                    old_data[pos:pos + 64] = rnd.randbytes(64)[:len(old_data) - pos]
+                old_image.seek(block * BLOCK_SIZE)
+                old_image.write(old_data)
+                blob = bsdiff4.diff(bytes(old_data), new_data)
+                ext = op.src_extents.add()
+                ext.start_block = block
+                ext.num_blocks = count
+            if old_image and op_type != 'SOURCE_BSDIFF':
+                old_image.seek(block * BLOCK_SIZE)
+                old_image.write(bytes(count * BLOCK_SIZE))
+            if blob:
+                op.data_offset = data_offset
+                op.data_length = len(blob)
+                op.data_sha256_hash = hashlib.sha256(blob).digest()
+                blobs.write(blob)
+                data_offset += len(blob)
+            ext = op.dst_extents.add()
+            ext.start_block = block
+            ext.num_blocks = count
+            image_hash.update(new_data)
+            op_types.append(op_type)
+            block += count
+    if old_image:
+        old_image.close()
+
+    part.new_partition_info.size = num_blocks * BLOCK_SIZE
+    part.new_partition_info.hash = image_hash.digest()
+    manifest = dam.SerializeToString()
+    with open(os.path.join(work_dir, 'payload.bin'), 'wb') as payload, open(blobs_path, 'rb') as blobs:
+        payload.write(b'CrAU')
+        payload.write(struct.pack('>Q', 2))
+        payload.write(struct.pack('>Q', len(manifest)))
+        payload.write(struct.pack('>I', 0))
+        payload.write(manifest)
+        shutil.copyfileobj(blobs, payload, 1024 * 1024)
+    os.remove(blobs_path)
+    return op_types, has_diff
+
+
+# ============================================================================
+#                               Function get_peak_rss_mb
+# ============================================================================
+def get_peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        # not available on Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss + resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    if sys.platform == 'darwin':
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+# ============================================================================
+#                               Function run_case
+# ============================================================================
+def run_case(work_dir, workers, verify, diff, per_op, results):
+    # runs in its own process so that peak RSS belongs to this case only
+    op_times = {}
+    op_bytes = {}
+    if per_op:
+        data_for_op = payload_dumper.data_for_op
+
+        def timed_data_for_op(op, payload, data_offset, block_size, *args, **kwargs):
+            start = time.perf_counter()
+            res = data_for_op(op, payload, data_offset, block_size, *args, **kwargs)
+            name = op.Type.Name(op.type)
+            op_times[name] = op_times.get(name, 0) + time.perf_counter() - start
+            op_bytes[name] = op_bytes.get(name, 0) + payload_dumper.get_op_size(op, block_size)
+            return res
+
+        payload_dumper.data_for_op = timed_data_for_op
+
+    out_dir = os.path.join(work_dir, f"out-{workers}")
+    os.makedirs(out_dir, exist_ok=True)
+    start = time.perf_counter()
+    res = payload_dumper.extract_payload(os.path.join(work_dir, 'payload.bin'), out=out_dir, diff=diff, old=os.path.join(work_dir, 'old'), workers=workers, verify=verify)
+    elapsed = time.perf_counter() - start
+    size = os.path.getsize(os.path.join(out_dir, 'system.img'))
+    shutil.rmtree(out_dir, ignore_errors=True)
+    results.put((res, elapsed, size, get_peak_rss_mb(), op_times, op_bytes))
+
+
+# ============================================================================
+#                               Function main
+# ============================================================================
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark payload_dumper.extract_payload on a synthetic payload.")
+    parser.add_argument('--size', type=int, default=256, help="size of the synthetic partition in MB (default 256)")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f"weighted operation mix (default {DEFAULT_MIX})")
+    parser.add_argument('--blocks-per-op', type=int, default=512, help="4K blocks per operation (default 512, i.e. 2 MB like AOSP full OTAs)")
+    parser.add_argument('--workers', default='1', help="comma separated list of worker counts to run (default 1)")
+    parser.add_argument('--repeat', type=int, default=1, help="runs per worker count, the best one is reported")
+    parser.add_argument('--verify', action='store_true', help="extract with verify=True")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--keep', metavar='DIR', help="build the payload in DIR and keep it instead of using a temporary directory")
+    args = parser.parse_args()
+
+    work_dir = args.keep or tempfile.mkdtemp(prefix='payload-benchmark-')
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        print(f"Building {args.size} MB synthetic payload in {work_dir} ...")
+        start = time.perf_counter()
+        op_types, diff = build_payload(work_dir, args.size, args.mix, args.blocks_per_op, args.seed)
+        payload_size = os.path.getsize(os.path.join(work_dir, 'payload.bin'))
+        counts = {t: op_types.count(t) for t in sorted(set(op_types))}
+        print(f"Built payload.bin ({payload_size / (1024 * 1024):.1f} MB, {len(op_types)} ops: {counts}) in {time.perf_counter() - start:.1f}s\n")
+
+        print(f"{'workers':>8} {'seconds':>9} {'MB/s':>9} {'peak RSS MB':>12}")
+        per_op = None
+        for workers in [int(w) for w in args.workers.split(',')]:
+            best = None
+            for i in range(args.repeat):
+                results = multiprocessing.Queue()
+                proc = multiprocessing.Process(target=run_case, args=(work_dir, workers, args.verify, diff, workers == 1, results))
+                proc.start()
+                res = results.get()
+                proc.join()
+                if res[0] != 0:
+                    sys.exit("extract_payload failed")
+                if best is None or res[1] < best[1]:
+                    best = res
+            res, elapsed, size, rss, op_times, op_bytes = best
+            rss = f"{rss:.0f}" if rss is not None else 'n/a'
+            print(f"{workers:>8} {elapsed:>9.2f} {size / elapsed / (1024 * 1024):>9.1f} {rss:>12}")
+            if op_times:
+                per_op = (op_times, op_bytes)
+
+        if per_op:
+            op_times, op_bytes = per_op
+            print(f"\nPer operation type (workers=1):\n{'type':>14} {'seconds':>9} {'MB/s':>9}")
+            for name in sorted(op_times):
+                seconds = op_times[name]
+                rate = op_bytes[name] / seconds / (1024 * 1024) if seconds else 0
+                print(f"{name:>14} {seconds:>9.2f} {rate:>9.1f}")
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+# ---------------------------------------------------------------------------
+if __name__ == '__main__':
+    main()
@@ -1,148 +1,761 @@
-import struct
-import hashlib
-import bz2
-import sys
-import bsdiff4
-import io
-import os
-try:
-    import lzma
-except ImportError:
-    from backports import lzma
-
-import update_metadata_pb2 as um
-
-
-def extract_payload(payload_file_path, out='output', diff=False, old='old', images=''):
-    def u32(x):
-        return struct.unpack('>I', x)[0]
-
-    def u64(x):
-        return struct.unpack('>Q', x)[0]
-
-    def verify_contiguous(exts):
-        blocks = 0
-
-        for ext in exts:
-            if ext.start_block != blocks:
-                return False
-
-            blocks += ext.num_blocks
-
-        return True
-
-    def data_for_op(op, out_file, old_file):
-        payload_file.seek(data_offset + op.data_offset)
-        data = payload_file.read(op.data_length)
-
-        # assert hashlib.sha256(data).digest() == op.data_sha256_hash, 'operation data hash mismatch'
-
-        if op.type == op.REPLACE_XZ:
-            dec = lzma.LZMADecompressor()
-            data = dec.decompress(data)
-            out_file.seek(op.dst_extents[0].start_block * block_size)
-            out_file.write(data)
-        elif op.type == op.REPLACE_BZ:
-            dec = bz2.BZ2Decompressor()
-            data = dec.decompress(data)
-            out_file.seek(op.dst_extents[0].start_block * block_size)
-            out_file.write(data)
-        elif op.type == op.REPLACE:
-            out_file.seek(op.dst_extents[0].start_block * block_size)
-            out_file.write(data)
-        elif op.type == op.SOURCE_COPY:
-            if not diff:
-                print("SOURCE_COPY supported only for differential OTA")
-                sys.exit(-2)
-            out_file.seek(op.dst_extents[0].start_block * block_size)
-            for ext in op.src_extents:
-                old_file.seek(ext.start_block * block_size)
-                data = old_file.read(ext.num_blocks * block_size)
-                out_file.write(data)
-        elif op.type == op.SOURCE_BSDIFF:
-            if not diff:
-                print("SOURCE_BSDIFF supported only for differential OTA")
-                sys.exit(-3)
-            out_file.seek(op.dst_extents[0].start_block * block_size)
-            tmp_buff = io.BytesIO()
-            for ext in op.src_extents:
-                old_file.seek(ext.start_block * block_size)
-                old_data = old_file.read(ext.num_blocks * block_size)
-                tmp_buff.write(old_data)
-            tmp_buff.seek(0)
-            old_data = tmp_buff.read()
-            tmp_buff.seek(0)
-            tmp_buff.write(bsdiff4.patch(old_data, data))
-            n = 0
-            tmp_buff.seek(0)
-            for ext in op.dst_extents:
-                tmp_buff.seek(n * block_size)
-                n += ext.num_blocks
-                data = tmp_buff.read(ext.num_blocks * block_size)
-                out_file.seek(ext.start_block * block_size)
-                out_file.write(data)
-        elif op.type == op.ZERO:
-            for ext in op.dst_extents:
-                out_file.seek(ext.start_block * block_size)
-                out_file.write(b'\x00' * ext.num_blocks * block_size)
-        else:
-            print("Unsupported type = %d" % op.type)
-            sys.exit(-1)
-
-        return data
-
-    def dump_part(part):
-        sys.stdout.write("Processing %s partition" % part.partition_name)
-        sys.stdout.flush()
-
-        with open('%s/%s.img' % (out, part.partition_name), 'wb') as out_file:
-            h = hashlib.sha256()
-
-            if diff:
-                with open('%s/%s.img' % (old, part.partition_name), 'rb') as old_file:
-                    for op in part.operations:
-                        data = data_for_op(op, out_file, old_file)
-                        sys.stdout.write(".")
-                        sys.stdout.flush()
-            else:
-                for op in part.operations:
-                    data = data_for_op(op, out_file, None)
-                    sys.stdout.write(".")
-                    sys.stdout.flush()
-
-        print("Done")
-
-    with open(payload_file_path, 'rb') as payload_file:
-        magic = payload_file.read(4)
-        assert magic == b'CrAU'
-
-        file_format_version = u64(payload_file.read(8))
-        assert file_format_version == 2
-
-        manifest_size = u64(payload_file.read(8))
-
-        metadata_signature_size = 0
-
-        if file_format_version > 1:
-            metadata_signature_size = u32(payload_file.read(4))
-
-        manifest = payload_file.read(manifest_size)
-        metadata_signature = payload_file.read(metadata_signature_size)
-
-        data_offset = payload_file.tell()
-
-        dam = um.DeltaArchiveManifest()
-        dam.ParseFromString(manifest)
-        block_size = dam.block_size
-
-        if images == "":
-            for part in dam.partitions:
-                dump_part(part)
-        else:
-            images_list = images.split(",")
-            for image in images_list:
-                partition = [part for part in dam.partitions if part.partition_name == image]
-                if partition:
-                    dump_part(partition[0])
-                else:
-                    sys.stderr.write("Partition %s not found in payload!\n" % image)
+import struct
+import hashlib
+import bz2
+import sys
+import tempfile
+import bsdiff4
+import io
+import json
+import mmap
+import multiprocessing
+import os
+import queue
+import requests
+import threading
+import time
+import traceback
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+try:
+    import lzma
+except ImportError:
+    from backports import lzma
+
+import update_metadata_pb2 as um
+
+# Number of op batches handed to each worker, more batches balance better at the cost of more IPC.
+BATCHES_PER_WORKER = 4
+# Shared source of zeros for hashing ZERO / DISCARD extents, so they don't allocate per operation.
+ZERO_CHUNK = bytes(1024 * 1024)
+# Size of the reused buffer SOURCE_COPY streams through, bounds memory use of incremental OTAs.
+COPY_CHUNK = 4 * 1024 * 1024
+# Minimum size of a ranged request for remote payloads, partition data is laid out
+# sequentially so a large read-ahead turns hundreds of ops into a handful of requests.
+REMOTE_READ_AHEAD = 16 * 1024 * 1024
+# With workers=None, selections smaller than this are extracted in process instead of by a worker pool.
+PARALLEL_MIN_BYTES = 512 * 1024 * 1024
+
+
+class PayloadFile():
+    # Read-only mapping of a payload.bin, read() hands out memoryview slices of the
+    # mapping instead of copying each operation blob onto the heap.
+    # base is where the payload starts in the file, non zero when it is a stored zip member.
+    def __init__(self, path, base=0):
+        self.path = path
+        self.base = base
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._map)
+
+    def read(self, offset, length):
+        offset += self.base
+        return self._view[offset:offset + length]
+
+    def close(self):
+        # callers must have released the views read() handed out, or this raises BufferError.
+        self._view.release()
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # the frames of an exception being raised still hold views of the mapping in their locals
+        if tb:
+            traceback.clear_frames(tb)
+        self.close()
+
+
+class HttpRangeFetcher():
+    # Default fetcher for remote payloads, any object with a size attribute and a
+    # fetch(offset, length) method returning bytes can be used in its place.
+    def __init__(self, url, headers=None, timeout=60):
+        self.url = url
+        self.headers = headers or {}
+        self.timeout = timeout
+        self._session = None
+        self._size = None
+
+    def __getstate__(self):
+        # sessions don't pickle, workers open their own.
+        state = self.__dict__.copy()
+        state['_session'] = None
+        return state
+
+    @property
+    def session(self):
+        if self._session is None:
+            self._session = requests.Session()
+        return self._session
+
+    @property
+    def size(self):
+        # asks for the first byte rather than a HEAD, so a server ignoring Range is caught right away.
+        if self._size is None:
+            headers = dict(self.headers)
+            headers['Range'] = 'bytes=0-0'
+            try:
+                with self.session.get(self.url, headers=headers, timeout=self.timeout, stream=True) as response:
+                    response.raise_for_status()
+                    if response.status_code != 206:
+                        raise PayloadError("Server does not support range requests for %s" % self.url)
+                    self._size = int(response.headers['Content-Range'].rsplit('/', 1)[1])
+            except requests.RequestException as e:
+                raise PayloadError("Could not download %s: %s" % (self.url, e)) from e
+        return self._size
+
+    def fetch(self, offset, length):
+        # requests failures are raised as PayloadError, zipfile would turn an IOError into "not a zip file".
+        if length <= 0:
+            return b''
+        headers = dict(self.headers)
+        headers['Range'] = 'bytes=%d-%d' % (offset, offset + length - 1)
+        try:
+            response = self.session.get(self.url, headers=headers, timeout=self.timeout)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            raise PayloadError("Could not download %s: %s" % (self.url, e)) from e
+        if response.status_code != 206:
+            raise PayloadError("Server does not support range requests for %s" % self.url)
+        if len(response.content) != length:
+            raise PayloadError("Server returned %d bytes for a %d byte range of %s" % (len(response.content), length, self.url))
+        return response.content
+
+
+class RemoteFile(io.RawIOBase):
+    # Seekable read-only file over a fetcher, enough for zipfile to read the central directory.
+    def __init__(self, fetcher):
+        self.fetcher = fetcher
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.fetcher.size
+        self.position = offset
+        return self.position
+
+    def readinto(self, buffer):
+        length = min(len(buffer), self.fetcher.size - self.position)
+        if length <= 0:
+            return 0
+        data = self.fetcher.fetch(self.position, length)
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+class RemotePayload():
+    # Same interface as PayloadFile, backed by ranged reads through a fetcher with a read-ahead window.
+    def __init__(self, fetcher, base=0):
+        self.fetcher = fetcher
+        self.base = base
+        self._window = memoryview(b'')
+        self._window_start = 0
+
+    def read(self, offset, length):
+        offset += self.base
+        start = offset - self._window_start
+        if start < 0 or start + length > len(self._window):
+            self._window_start = offset
+            self._window = memoryview(self.fetcher.fetch(offset, max(length, min(REMOTE_READ_AHEAD, self.fetcher.size - offset))))
+            start = 0
+        return self._window[start:start + length]
+
+    def close(self):
+        self._window = memoryview(b'')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def open_payload(source, base=0):
+    # source is either a local path or a fetcher for a remote payload.
+    if isinstance(source, str):
+        return PayloadFile(source, base)
+    return RemotePayload(source, base)
+
+
+def get_zip_member_offset(zip_file, info):
+    # Returns the offset of a member's data inside an open zip, or -1 if the member is
+    # compressed / encrypted and can't be read in place.
+    if info.compress_type != zipfile.ZIP_STORED or info.flag_bits & 0x1:
+        return -1
+    # the local file header can carry a different extra field than the central directory
+    zip_file.fp.seek(info.header_offset)
+    header = zip_file.fp.read(30)
+    if header[:4] != b'PK\x03\x04':
+        return -1
+    name_length, extra_length = struct.unpack('<HH', header[26:30])
+    return info.header_offset + 30 + name_length + extra_length
+
+
+def get_stored_member_offset(zip_path, member):
+    # Returns the offset of the member's data inside the zip, or -1 if the member is
+    # compressed / encrypted and can't be read in place.
+    # zip_path can also be a seekable file object, e.g. RemoteFile.
+    # Raises PayloadError if it isn't a zip or the member is missing.
+    try:
+        with zipfile.ZipFile(zip_path, 'r') as zip_file:
+            return get_zip_member_offset(zip_file, zip_file.getinfo(member))
+    except zipfile.BadZipFile as e:
+        raise PayloadError("The payload source is not a valid zip file: %s" % e) from e
+    except KeyError as e:
+        raise PayloadError("%s is not in the zip file" % member) from e
+
+
+def u32(x):
+    return struct.unpack('>I', x)[0]
+
+
+def u64(x):
+    return struct.unpack('>Q', x)[0]
+
+
+def read_manifest(payload):
+    # Returns the serialized manifest (as a view) and the offset of the data blobs.
+    magic = bytes(payload.read(0, 4))
+    assert magic == b'CrAU'
+
+    file_format_version = u64(payload.read(4, 8))
+    assert file_format_version == 2
+
+    manifest_size = u64(payload.read(12, 8))
+
+    metadata_signature_size = 0
+
+    if file_format_version > 1:
+        metadata_signature_size = u32(payload.read(20, 4))
+
+    manifest = payload.read(24, manifest_size)
+
+    data_offset = 24 + manifest_size + metadata_signature_size
+    return manifest, data_offset
+
+
+def read_varint(buffer, pos):
+    result = 0
+    shift = 0
+    while True:
+        b = buffer[pos]
+        pos += 1
+        result |= (b & 0x7f) << shift
+        if not b & 0x80:
+            return result, pos
+        shift += 7
+
+
+def get_partition_ranges(manifest):
+    # Walks the top level protobuf fields of a serialized DeltaArchiveManifest and returns
+    # the (start, length) of every PartitionUpdate (field 13) in manifest order,
+    # so a single partition can be parsed later without parsing the whole manifest.
+    ranges = []
+    pos = 0
+    while pos < len(manifest):
+        key, pos = read_varint(manifest, pos)
+        wire_type = key & 0x7
+        if wire_type == 0:
+            value, pos = read_varint(manifest, pos)
+        elif wire_type == 1:
+            pos += 8
+        elif wire_type == 2:
+            length, pos = read_varint(manifest, pos)
+            if key >> 3 == 13:
+                ranges.append((pos, length))
+            pos += length
+        elif wire_type == 5:
+            pos += 4
+        else:
+            raise ValueError("Unexpected wire type %d in payload manifest" % wire_type)
+    return ranges
+
+
+def build_payload_index(manifest, data_offset):
+    dam = um.DeltaArchiveManifest()
+    dam.ParseFromString(manifest)
+    partitions = {}
+    for part, (start, length) in zip(dam.partitions, get_partition_ranges(manifest)):
+        data_ops = [op for op in part.operations if op.data_length]
+        partitions[part.partition_name] = {
+            'ops': len(part.operations),
+            'size': part.new_partition_info.size,
+            'hash': part.new_partition_info.hash.hex(),
+            'data_start': min((op.data_offset for op in data_ops), default=0),
+            'data_end': max((op.data_offset + op.data_length for op in data_ops), default=0),
+            'manifest_range': [start, length],
+        }
+    return {
+        'block_size': dam.block_size,
+        'data_offset': data_offset,
+        'partitions': partitions,
+    }
+
+
+def get_payload_index(payload, index_dir=None):
+    # The index is keyed by the SHA-256 of the payload header and manifest, the manifest
+    # carries the hashes of every operation blob and partition, so it identifies the payload
+    # content without hashing the (multi GB) payload itself.
+    manifest, data_offset = read_manifest(payload)
+    key = hashlib.sha256(payload.read(0, data_offset)).hexdigest()
+    index_file = None
+    if index_dir:
+        index_file = os.path.join(index_dir, 'payload_index', '%s.json' % key)
+        if os.path.exists(index_file):
+            try:
+                with open(index_file, 'r', encoding='ISO-8859-1', errors='replace') as f:
+                    index = json.load(f)
+                if index.get('sha256') != key:
+                    raise ValueError("it belongs to a different payload")
+                return index, manifest
+            except (OSError, ValueError, AttributeError) as e:
+                sys.stderr.write("Discarding payload index %s: %s\n" % (index_file, e))
+    index = build_payload_index(manifest, data_offset)
+    index['sha256'] = key
+    if index_file:
+        # written next to its final name and moved into place, so a crash or a concurrent
+        # PixelFlasher never leaves a truncated index behind.
+        temp_file = None
+        try:
+            os.makedirs(os.path.dirname(index_file), exist_ok=True)
+            fd, temp_file = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(index_file))
+            with os.fdopen(fd, 'w', encoding='ISO-8859-1', errors='replace') as f:
+                json.dump(index, f)
+            os.replace(temp_file, index_file)
+        except OSError as e:
+            sys.stderr.write("Could not save payload index %s: %s\n" % (index_file, e))
+            if temp_file and os.path.exists(temp_file):
+                os.remove(temp_file)
+    return index, manifest
+
+
+def get_partition(index, manifest, name):
+    start, length = index['partitions'][name]['manifest_range']
+    part = um.PartitionUpdate()
+    part.ParseFromString(manifest[start:start + length])
+    return part
+
+
+def list_payload_partitions(payload_file_path, member=None, fetcher=None, index_dir=None):
+    # Returns the partition entries of the payload index (ops, size, hash, data range),
+    # served from the on disk index when the payload has been seen before.
+    source, base = get_payload_source(payload_file_path, member, fetcher)
+    if base == -1:
+        return None
+    with open_payload(source, base) as payload:
+        index, manifest = get_payload_index(payload, index_dir)
+        manifest.release()
+    return index['partitions']
+
+
+def verify_contiguous(exts):
+    blocks = 0
+
+    for ext in exts:
+        if ext.start_block != blocks:
+            return False
+
+        blocks += ext.num_blocks
+
+    return True
+
+
+class PayloadError(Exception):
+    pass
+
+
+class ExtractProgress():
+    # Passed to the progress callback of extract_payload() after every operation (or worker batch).
+    def __init__(self, partition, bytes_done, bytes_total, elapsed):
+        self.partition = partition
+        self.bytes_done = bytes_done
+        self.bytes_total = bytes_total
+        self.elapsed = elapsed
+        self.rate = bytes_done / elapsed / (1024 * 1024) if elapsed > 0 else 0.0
+        if self.rate > 0:
+            self.eta = (bytes_total - bytes_done) / (self.rate * 1024 * 1024)
+        else:
+            self.eta = None
+
+    @property
+    def done(self):
+        return self.bytes_done >= self.bytes_total
+
+
+class Verifier():
+    # Checks operation blobs against data_sha256_hash and the finished image against
+    # new_partition_info.hash on a background thread, fed from the extraction pass itself.
+    # hashlib releases the GIL, so this costs roughly one extra core instead of a second read.
+    def __init__(self, part):
+        self.partition_name = part.partition_name
+        self.expected = part.new_partition_info.hash
+        self.size = part.new_partition_info.size
+        self.image_hash = hashlib.sha256()
+        self.position = 0
+        self.in_order = True
+        self.errors = []
+        self.queue = queue.Queue(maxsize=64)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def check_op(self, op, data):
+        if op.data_sha256_hash:
+            self.queue.put((op.data_sha256_hash, data, None))
+
+    def written(self, offset, data):
+        if self.expected and self.in_order:
+            self.queue.put((None, data, offset))
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            expected, data, offset = item
+            if expected:
+                if hashlib.sha256(data).digest() != expected:
+                    self.errors.append("operation data hash mismatch in %s partition" % self.partition_name)
+            elif offset == self.position:
+                self.image_hash.update(data)
+                self.position += len(data)
+            else:
+                # ops are not writing the image sequentially, the image is hashed from disk instead.
+                self.in_order = False
+
+    def stop(self):
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
+    def finish(self, out_path):
+        self.stop()
+        if self.errors:
+            raise PayloadError(self.errors[0])
+        if self.expected:
+            if self.in_order and self.position == self.size:
+                digest = self.image_hash.digest()
+            else:
+                digest = hash_file(out_path)
+            if digest != self.expected:
+                raise PayloadError("%s partition hash mismatch" % self.partition_name)
+
+
+def hash_file(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.digest()
+
+
+def write_at(out_file, offset, data, verifier=None):
+    out_file.seek(offset)
+    out_file.write(data)
+    if verifier:
+        verifier.written(offset, data)
+
+
+def skip_zeros(offset, length, verifier=None):
+    # Output images are preallocated with truncate(), so zeroed extents are left as holes
+    # and only the verifier needs to see the zeros.
+    if not verifier:
+        return
+    zeros = memoryview(ZERO_CHUNK)
+    while length > 0:
+        n = min(length, len(ZERO_CHUNK))
+        verifier.written(offset, zeros[:n])
+        offset += n
+        length -= n
+
+
+def write_extents(out_file, extents, block_size, data, verifier=None):
+    # scatter data over the destination extents in order
+    view = memoryview(data)
+    n = 0
+    for ext in extents:
+        length = ext.num_blocks * block_size
+        write_at(out_file, ext.start_block * block_size, view[n:n + length], verifier)
+        n += length
+
+
+def read_extents(old_file, extents, block_size):
+    if len(extents) == 1:
+        old_file.seek(extents[0].start_block * block_size)
+        return old_file.read(extents[0].num_blocks * block_size)
+    data = []
+    for ext in extents:
+        old_file.seek(ext.start_block * block_size)
+        data.append(old_file.read(ext.num_blocks * block_size))
+    return b''.join(data)
+
+
+def copy_extents(old_file, out_file, op, block_size, buffer, verifier=None):
+    # Streams the source extents into the destination extents through a bounded, reused buffer,
+    # src and dst can be split into extents differently, only their total length matches.
+    dst = [(ext.start_block * block_size, ext.num_blocks * block_size) for ext in op.dst_extents]
+    if sum(length for offset, length in dst) != sum(ext.num_blocks for ext in op.src_extents) * block_size:
+        raise PayloadError("%s source and destination extents differ in length" % get_op_type_name(op))
+    if not dst:
+        return
+    dst.reverse()
+    dst_offset, dst_left = dst.pop()
+    for ext in op.src_extents:
+        src_offset = ext.start_block * block_size
+        src_left = ext.num_blocks * block_size
+        while src_left > 0:
+            if dst_left == 0:
+                dst_offset, dst_left = dst.pop()
+            n = min(src_left, dst_left, len(buffer))
+            view = memoryview(buffer)[:n]
+            old_file.seek(src_offset)
+            if old_file.readinto(view) != n:
+                raise PayloadError("source image is shorter than expected")
+            # the verifier hashes asynchronously, so it needs its own copy of the reused buffer.
+            write_at(out_file, dst_offset, bytes(view) if verifier else view, verifier)
+            src_offset += n
+            src_left -= n
+            dst_offset += n
+            dst_left -= n
+
+
+def get_op_type_name(op):
+    if op.HasField('type'):
+        return op.Type.Name(op.type)
+    # newer op types (BROTLI_BSDIFF, ZUCCHINI, LZ4DIFF_*) are unknown to update_metadata_pb2
+    # and end up in the unknown fields instead.
+    for field in op.UnknownFields():
+        if field.field_number == 1:
+            return "type %d" % field.data
+    return "unknown type"
+
+
+def get_partition_size(part, block_size):
+    if part.new_partition_info.size:
+        return part.new_partition_info.size
+    return max((ext.start_block + ext.num_blocks for op in part.operations for ext in op.dst_extents), default=0) * block_size
+
+
+def data_for_op(op, payload, data_offset, block_size, out_file, old_file, diff=False, verifier=None, buffer=None):
+    # out_file must already be truncated to the partition size, see skip_zeros().
+    if not op.HasField('type') or op.type in (op.MOVE, op.BSDIFF, op.PUFFDIFF):
+        raise PayloadError("%s operations are not supported" % get_op_type_name(op))
+    if op.type in (op.SOURCE_COPY, op.SOURCE_BSDIFF) and not diff:
+        raise PayloadError("%s supported only for differential OTA" % get_op_type_name(op))
+
+    data = payload.read(data_offset + op.data_offset, op.data_length)
+
+    if verifier:
+        verifier.check_op(op, data)
+
+    if op.type in (op.REPLACE_XZ, op.REPLACE_BZ):
+        dec = lzma.LZMADecompressor() if op.type == op.REPLACE_XZ else bz2.BZ2Decompressor()
+        try:
+            data = dec.decompress(data)
+        except (OSError, EOFError, lzma.LZMAError) as e:
+            raise PayloadError("corrupt operation data at offset %d: %s" % (op.data_offset, e))
+        write_extents(out_file, op.dst_extents, block_size, data, verifier)
+    elif op.type == op.REPLACE:
+        write_extents(out_file, op.dst_extents, block_size, data, verifier)
+    elif op.type == op.SOURCE_COPY:
+        copy_extents(old_file, out_file, op, block_size, buffer or bytearray(COPY_CHUNK), verifier)
+    elif op.type == op.SOURCE_BSDIFF:
+        # bsdiff4 only accepts bytes, so the source is read straight into one bytes object
+        # and the patched result is scattered to the destination through views, without further copies.
+        try:
+            data = bsdiff4.patch(read_extents(old_file, op.src_extents, block_size), bytes(data))
+        except ValueError as e:
+            raise PayloadError("could not apply bsdiff at offset %d: %s" % (op.data_offset, e))
+        write_extents(out_file, op.dst_extents, block_size, data, verifier)
+    elif op.type in (op.ZERO, op.DISCARD):
+        for ext in op.dst_extents:
+            skip_zeros(ext.start_block * block_size, ext.num_blocks * block_size, verifier)
+
+    return data
+
+
+def dump_ops(source, base, data_offset, block_size, out_path, old_path, ops, diff=False, verify=False):
+    # Worker entry point, ops are passed serialized so the batch pickles cheaply,
+    # each worker opens its own handles and writes to the preallocated image in place.
+    buffer = bytearray(COPY_CHUNK)
+    with open_payload(source, base) as payload, open(out_path, 'r+b') as out_file:
+        old_file = open(old_path, 'rb') if diff else None
+        try:
+            for op_data in ops:
+                op = um.InstallOperation()
+                op.ParseFromString(op_data)
+                if verify and op.data_sha256_hash:
+                    if hashlib.sha256(payload.read(data_offset + op.data_offset, op.data_length)).digest() != op.data_sha256_hash:
+                        raise PayloadError("operation data hash mismatch in %s" % os.path.basename(out_path))
+                data_for_op(op, payload, data_offset, block_size, out_file, old_file, diff, buffer=buffer)
+        finally:
+            if old_file:
+                old_file.close()
+    return len(ops)
+
+
+def get_op_size(op, block_size):
+    # number of image bytes an operation produces, used for progress reporting
+    return sum(ext.num_blocks for ext in op.dst_extents) * block_size
+
+
+def batch_ops(operations, batches, block_size):
+    # split the operations into contiguous batches of roughly equal payload data size,
+    # yields the serialized batch along with the image bytes it produces.
+    total = sum(op.data_length for op in operations) or 1
+    target = total / batches
+    batch = []
+    size = 0
+    batch_bytes = 0
+    for op in operations:
+        batch.append(op.SerializeToString())
+        size += op.data_length
+        batch_bytes += get_op_size(op, block_size)
+        if size >= target:
+            yield batch, batch_bytes
+            batch = []
+            size = 0
+            batch_bytes = 0
+    if batch:
+        yield batch, batch_bytes
+
+
+def get_payload_source(payload_file_path, member=None, fetcher=None):
+    # Returns what open_payload() needs: the path or fetcher, and the payload's offset
+    # within it (-1 if the zip member can't be read in place).
+    source = payload_file_path
+    if fetcher:
+        source = fetcher
+    elif payload_file_path.startswith(('http://', 'https://')):
+        source = HttpRangeFetcher(payload_file_path)
+
+    base = 0
+    if member:
+        base = get_stored_member_offset(source if isinstance(source, str) else RemoteFile(source), member)
+        if base == -1:
+            sys.stderr.write("%s is compressed in %s and can't be read in place!\n" % (member, payload_file_path))
+    return source, base
+
+
+def extract_payload(payload_file_path, out='output', diff=False, old='old', images='', workers=1, member=None, fetcher=None, index_dir=None, verify=False, progress=None):
+    # When member is set, payload_file_path is a zip (OTA / ROM) and the payload is
+    # read in place from that stored member, without extracting it first.
+    # payload_file_path can also be an http(s) url, or a fetcher can be passed, in which
+    # case only the zip directory, the manifest and the selected partitions' data are downloaded.
+    # workers > 1 fans the operations out over that many processes, workers=None picks one per CPU
+    # for large selections and extracts small ones in process.
+    # With index_dir set, the manifest index is cached there and reused on later calls.
+    # With verify set, operation blobs and the extracted images are checked against the manifest hashes.
+    # progress, if set, is called with an ExtractProgress after every operation, callers are
+    # expected to throttle what they display.
+    def report(part, bytes_done, bytes_total, start):
+        if progress:
+            progress(ExtractProgress(part.partition_name, bytes_done, bytes_total, time.time() - start))
+
+    def dump_part(part):
+        sys.stdout.write("Processing %s partition ... " % part.partition_name)
+        sys.stdout.flush()
+        start = time.time()
+        bytes_done = 0
+        bytes_total = get_partition_size(part, block_size)
+
+        out_path = '%s/%s.img' % (out, part.partition_name)
+        old_path = '%s/%s.img' % (old, part.partition_name)
+
+        if diff and not os.path.exists(old_path):
+            raise PayloadError("source image %s for differential OTA is not found" % old_path)
+
+        # preallocate the image, this lets workers write their extents in place and
+        # leaves ZERO / DISCARD extents as holes, so images come out sparse where the filesystem allows it.
+        with open(out_path, 'wb') as out_file:
+            out_file.truncate(bytes_total)
+
+        if executor:
+            futures = {executor.submit(dump_ops, source, base, data_offset, block_size, out_path, old_path, batch, diff, verify): batch_bytes
+                       for batch, batch_bytes in batch_ops(part.operations, workers * BATCHES_PER_WORKER, block_size)}
+            for future in as_completed(futures):
+                future.result()
+                bytes_done += futures[future]
+                report(part, bytes_done, bytes_total, start)
+            if verify and part.new_partition_info.hash and hash_file(out_path) != part.new_partition_info.hash:
+                raise PayloadError("%s partition hash mismatch" % part.partition_name)
+        else:
+            verifier = Verifier(part) if verify else None
+            buffer = bytearray(COPY_CHUNK) if diff else None
+            with open(out_path, 'r+b') as out_file:
+                old_file = open(old_path, 'rb') if diff else None
+                try:
+                    for op in part.operations:
+                        data_for_op(op, payload, data_offset, block_size, out_file, old_file, diff, verifier, buffer)
+                        bytes_done += get_op_size(op, block_size)
+                        report(part, bytes_done, bytes_total, start)
+                finally:
+                    if old_file:
+                        old_file.close()
+                    # the verifier holds views of the payload, it must be done before the payload is closed.
+                    if verifier:
+                        verifier.stop()
+            if verifier:
+                verifier.finish(out_path)
+
+        elapsed = time.time() - start
+        rate = bytes_total / elapsed / (1024 * 1024) if elapsed > 0 else 0.0
+        print("Done (%.1f MB in %.1fs, %.1f MB/s)" % (bytes_total / (1024 * 1024), elapsed, rate))
+
+    try:
+        source, base = get_payload_source(payload_file_path, member, fetcher)
+    except PayloadError as e:
+        sys.stderr.write("ERROR: %s\n" % e)
+        return -1
+    if base == -1:
+        return -1
+
+    executor = None
+    failed = True
+    try:
+        with open_payload(source, base) as payload:
+            index, manifest = get_payload_index(payload, index_dir)
+            try:
+                data_offset = index['data_offset']
+                block_size = index['block_size']
+
+                if images == "":
+                    images_list = list(index['partitions'])
+                else:
+                    images_list = images.split(",")
+                if workers is None:
+                    # a few small images (boot, vbmeta ...) extract faster than worker processes start.
+                    selected_size = sum(index['partitions'][image]['size'] for image in images_list if image in index['partitions'])
+                    workers = (os.cpu_count() or 1) if selected_size >= PARALLEL_MIN_BYTES else 1
+                if workers > 1:
+                    # spawned rather than forked, forking a multi threaded (GUI) process can deadlock the child.
+                    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+                for image in images_list:
+                    if image in index['partitions']:
+                        dump_part(get_partition(index, manifest, image))
+                    else:
+                        sys.stderr.write("Partition %s not found in payload!\n" % image)
+            finally:
+                manifest.release()
+        failed = False
+    except PayloadError as e:
+        print("")
+        sys.stderr.write("ERROR: %s\n" % e)
+        return -1
+    finally:
+        if executor:
+            # after a failure the batches still queued are dropped rather than waited for
+            executor.shutdown(cancel_futures=failed)
+    return 0
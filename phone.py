@@ -1,15 +1,25 @@
 #!/usr/bin/env python
 
 import contextlib
+import queue
 import re
+import secrets
 import subprocess
+import sys
+import threading
 import time
 from datetime import datetime
 from urllib.parse import urlparse
 
+import wx
+
 from constants import *
 from runtime import *
 
+# [name]: [value] lines of getprop, values can span lines
+GETPROP_RE = re.compile(r'^\[([^\]]+)\]: \[(.*?)\]\r?$', re.MULTILINE | re.DOTALL)
+# (bootloader) name:value lines of fastboot getvar all, names can contain ':' (partition-size:boot_a: 0x...)
+FASTBOOT_VAR_RE = re.compile(r'^\(bootloader\) (.*):(.*)$', re.MULTILINE)
 
 # ============================================================================
 #                               Class Package
@@ -54,6 +64,120 @@ class MagiskApk():
         self.type = type
 
 
+# ============================================================================
+#                               Class AdbShellSession
+# ============================================================================
+class AdbShellSession():
+    """A long lived `adb shell` (or root `adb shell su`) that runs commands one at a time.
+
+    Each command runs in a subshell with stdin from /dev/null, followed by a
+    sentinel line carrying its exit code on stdout and a bare sentinel on stderr,
+    so consecutive commands never bleed into each other.
+    """
+    def __init__(self, id, with_su = False):
+        self.id = id
+        self.with_su = with_su
+        self.sentinel = f"__pf_{secrets.token_hex(8)}__"
+        self.proc = None
+        self.stdout = None
+        self.stderr = None
+
+    # ----------------------------------------------------------------------------
+    #                               method start
+    # ----------------------------------------------------------------------------
+    def start(self):
+        try:
+            theCmd = [get_adb(), '-s', self.id, 'shell']
+            if self.with_su:
+                theCmd.append('su')
+            creationflags = subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0
+            self.proc = subprocess.Popen(theCmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=get_env_variables(), creationflags=creationflags)
+            self.stdout = queue.Queue()
+            self.stderr = queue.Queue()
+            for stream, lines in ((self.proc.stdout, self.stdout), (self.proc.stderr, self.stderr)):
+                threading.Thread(target=self._read_lines, args=(stream, lines), daemon=True).start()
+            res = self.run('true', ADB_SHELL_START_TIMEOUT)
+            if res.returncode == 0:
+                return 0
+        except Exception as e:
+            debug(f"Could not start adb shell session on {self.id}: {e}")
+        self.close()
+        return -1
+
+    # ----------------------------------------------------------------------------
+    #                               method _read_lines
+    # ----------------------------------------------------------------------------
+    @staticmethod
+    def _read_lines(stream, lines):
+        with contextlib.suppress(Exception):
+            for line in iter(stream.readline, b''):
+                lines.put(line.decode('ISO-8859-1', errors='replace'))
+        lines.put(None)
+
+    # ----------------------------------------------------------------------------
+    #                               method is_alive
+    # ----------------------------------------------------------------------------
+    def is_alive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    # ----------------------------------------------------------------------------
+    #                               method run
+    # ----------------------------------------------------------------------------
+    def run(self, cmd, timeout = None):
+        """Runs cmd in the session and returns a subprocess.CompletedProcess.
+
+        Raises subprocess.TimeoutExpired (and closes the session) on timeout.
+        If the session dies mid command, returncode is 255 like adb's own.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        script = f"( {cmd}\n) </dev/null; printf '\\n{self.sentinel} %d\\n' $?; printf '\\n{self.sentinel}\\n' >&2\n"
+        self.proc.stdin.write(script.encode('ISO-8859-1', errors='replace'))
+        self.proc.stdin.flush()
+        stdout, returncode = self._read_until(self.stdout, cmd, timeout, deadline)
+        stderr, _ = self._read_until(self.stderr, cmd, timeout, deadline)
+        if returncode is None:
+            self.close()
+            returncode = 255
+        return subprocess.CompletedProcess(cmd, returncode, stdout, stderr)
+
+    # ----------------------------------------------------------------------------
+    #                               method _read_until
+    # ----------------------------------------------------------------------------
+    def _read_until(self, lines, cmd, timeout, deadline):
+        # returns the output up to the sentinel line and the exit code it carries (None on EOF)
+        output = []
+        while True:
+            try:
+                line = lines.get(timeout=None if deadline is None else max(deadline - time.time(), 0))
+            except queue.Empty:
+                self.close()
+                raise subprocess.TimeoutExpired(cmd, timeout, ''.join(output)) from None
+            if line is None:
+                # put it back so that the other stream (or the next caller) sees the EOF too
+                lines.put(None)
+                return ''.join(output), None
+            if line.startswith(self.sentinel):
+                value = line[len(self.sentinel):].strip()
+                output = ''.join(output)
+                # drop the newline printed ahead of the sentinel
+                if output.endswith('\n'):
+                    output = output[:-1]
+                return output, int(value) if value else 0
+            output.append(line)
+
+    # ----------------------------------------------------------------------------
+    #                               method close
+    # ----------------------------------------------------------------------------
+    def close(self):
+        if self.proc is None:
+            return
+        with contextlib.suppress(Exception):
+            self.proc.stdin.close()
+        with contextlib.suppress(Exception):
+            self.proc.kill()
+            self.proc.wait(timeout=5)
+
+
 # ============================================================================
 #                               Class Device
 # ============================================================================
@@ -70,29 +194,8 @@ class Device():
         else:
             self.true_mode = mode
         # The below are for caching.
-        self._adb_device_info = None
-        self._fastboot_device_info = None
-        self._hardware = None
-        self._build = None
-        self._api_level = None
-        self._architecture = None
-        self._active_slot = None
-        self._bootloader_version = None
-        self._sys_oem_unlock_allowed = None
-        self._ro_boot_flash_locked = None
-        self._ro_boot_vbmeta_device_state = None
-        self._vendor_boot_verifiedbootstate = None
-        self._ro_product_first_api_level = None
-        self._ro_boot_verifiedbootstate = None
-        self._vendor_boot_vbmeta_device_state = None
-        self._ro_boot_warranty_bit = None
-        self._ro_warranty_bit = None
-        self._ro_secure = None
-        self._ro_zygote = None
-        self._ro_vendor_product_cpu_abilist = None
-        self._ro_vendor_product_cpu_abilist32 = None
+        self._props = None
         self._rooted = None
-        self._unlocked = None
         self._magisk_version = None
         self._magisk_app_version = None
         self._magisk_version_code = None
@@ -104,18 +207,131 @@ class Device():
         self._has_init_boot = None
         self.packages = {}
         self.backups = {}
+        # idle adb shell sessions, keyed by with_su
+        self._shell_sessions = {False: [], True: []}
+        self._busy_shell_sessions = set()
+        self._shell_sessions_lock = threading.Lock()
+        # default timeout of shell commands (None means ADB_SHELL_TIMEOUT), set while a scan initializes the device
+        self.command_timeout = None
+        self._abandoned = False
+        self._shell_v2 = None
+
+    # ----------------------------------------------------------------------------
+    #                               method shell
+    # ----------------------------------------------------------------------------
+    def shell(self, cmd, with_su = False, timeout = None):
+        """Runs cmd on the device (as root if with_su) over a pooled adb shell session.
+
+        Returns a subprocess.CompletedProcess like run_shell, or None on timeout.
+        With the native adb client enabled, non root commands go straight to the adb server.
+        Falls back to a one off adb shell when no session can be started, or when the
+        device lacks shell_v2 (stderr is then merged into stdout, which sessions can't split).
+        """
+        if self._abandoned:
+            return None
+        if timeout is None:
+            timeout = self.command_timeout or ADB_SHELL_TIMEOUT
+        try:
+            if get_use_native_adb() and not with_su:
+                with contextlib.suppress(AdbError, OSError):
+                    return get_adb_client().shell(self.id, cmd, timeout)
+            session = self.get_shell_session(with_su) if self.has_shell_v2 else None
+            if session:
+                res = None
+                try:
+                    res = session.run(cmd, timeout)
+                except OSError:
+                    # the session went away between commands (reboot, unplug), try a one off shell
+                    session.close()
+                except subprocess.TimeoutExpired:
+                    # the session may still be stuck in the command (or an unbalanced quote), never reuse it
+                    session.close()
+                    raise
+                finally:
+                    self.release_shell_session(session)
+                if res is not None:
+                    return res
+            theCmd = [get_adb(), '-s', self.id, 'shell']
+            if with_su:
+                theCmd.append('su')
+            return subprocess.run(theCmd, input=f"{cmd}\n", stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding='ISO-8859-1', errors="replace", timeout=timeout, env=get_env_variables())
+        except subprocess.TimeoutExpired as e:
+            print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: Command timed out after {timeout} seconds")
+            puml("#red:Command timed out;\n", True)
+            puml(f"note right\n{e}\nend note\n")
 
     # ----------------------------------------------------------------------------
-    #                               property adb_device_info
+    #                               property has_shell_v2
     # ----------------------------------------------------------------------------
     @property
-    def adb_device_info(self):
-        if self.mode == 'adb':
-            if self._adb_device_info is None:
-                self._adb_device_info = self.device_info
-            else:
-                 self._adb_device_info = ''
-            return self._adb_device_info
+    def has_shell_v2(self):
+        # cached once known, a failed query is retried on the next call
+        if self._shell_v2 is None:
+            features = None
+            if get_use_native_adb():
+                with contextlib.suppress(AdbError, OSError):
+                    features = get_adb_client().features(self.id)
+            if features is None:
+                res = run_shell(f"\"{get_adb()}\" -s {self.id} features", ADB_SHELL_START_TIMEOUT)
+                if not res or res.returncode != 0:
+                    return False
+                features = re.split(r'[,\s]+', res.stdout.strip())
+            self._shell_v2 = 'shell_v2' in features
+        return self._shell_v2
+
+    # ----------------------------------------------------------------------------
+    #                               method get_shell_session
+    # ----------------------------------------------------------------------------
+    def get_shell_session(self, with_su = False):
+        with self._shell_sessions_lock:
+            sessions = self._shell_sessions[with_su]
+            while sessions:
+                session = sessions.pop()
+                if session.is_alive():
+                    self._busy_shell_sessions.add(session)
+                    return session
+                session.close()
+            # tracked while in use, so that close_shell_sessions can end a command that hangs
+            session = AdbShellSession(self.id, with_su)
+            self._busy_shell_sessions.add(session)
+        if session.start() == 0:
+            return session
+        with self._shell_sessions_lock:
+            self._busy_shell_sessions.discard(session)
+
+    # ----------------------------------------------------------------------------
+    #                               method release_shell_session
+    # ----------------------------------------------------------------------------
+    def release_shell_session(self, session):
+        with self._shell_sessions_lock:
+            self._busy_shell_sessions.discard(session)
+            sessions = self._shell_sessions[session.with_su]
+            if session.is_alive() and len(sessions) < ADB_SHELL_POOL_SIZE:
+                sessions.append(session)
+                return
+        session.close()
+
+    # ----------------------------------------------------------------------------
+    #                               method close_shell_sessions
+    # ----------------------------------------------------------------------------
+    def close_shell_sessions(self):
+        # closes idle sessions as well as the ones running a command, which then returns 255
+        with self._shell_sessions_lock:
+            for sessions in self._shell_sessions.values():
+                for session in sessions:
+                    session.close()
+                sessions.clear()
+            for session in self._busy_shell_sessions:
+                session.close()
+            self._busy_shell_sessions.clear()
+
+    # ----------------------------------------------------------------------------
+    #                               method abandon
+    # ----------------------------------------------------------------------------
+    def abandon(self):
+        # gives up on a device that doesn't respond, ends what it runs and fails its further commands
+        self._abandoned = True
+        self.close_shell_sessions()
 
     # ----------------------------------------------------------------------------
     #                               method get_package_details
@@ -124,8 +340,8 @@ class Device():
         if self.mode != 'adb':
             return
         try:
-            theCmd = f"\"{get_adb()}\" -s {self.id} shell dumpsys package {package}"
-            res = run_shell(theCmd)
+            theCmd = f"dumpsys package {package}"
+            res = self.shell(theCmd)
             if res.returncode == 0:
                 path = self.get_path_from_details(res.stdout)
                 return res.stdout, path
@@ -148,18 +364,6 @@ class Device():
         else:
             return ''
 
-    # ----------------------------------------------------------------------------
-    #                               property fastboot_device_info
-    # ----------------------------------------------------------------------------
-    @property
-    def fastboot_device_info(self):
-        if self.mode == 'f.b':
-            if self._fastboot_device_info is None:
-                self._fastboot_device_info = self.device_info
-            else:
-                 self._fastboot_device_info = ''
-            return self._fastboot_device_info
-
     # ----------------------------------------------------------------------------
     #                               property device_info
     # ----------------------------------------------------------------------------
@@ -167,11 +371,11 @@ class Device():
     def device_info(self):
         if self.mode == 'adb':
             if get_adb():
-                theCmd = f"\"{get_adb()}\" -s {self.id} shell /bin/getprop"
-                device_info = run_shell(theCmd)
+                theCmd = "/bin/getprop"
+                device_info = self.shell(theCmd)
                 if device_info.returncode == 127:
-                    theCmd = f"\"{get_adb()}\" -s {self.id} shell getprop"
-                    device_info = run_shell(theCmd)
+                    theCmd = "getprop"
+                    device_info = self.shell(theCmd)
                 return ''.join(device_info.stdout)
             else:
                 print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: adb command is not found!")
@@ -179,7 +383,7 @@ class Device():
         elif self.mode == 'f.b':
             if get_fastboot():
                 theCmd = f"\"{get_fastboot()}\" -s {self.id} getvar all"
-                device_info = run_shell(theCmd)
+                device_info = run_shell(theCmd, self.command_timeout)
                 if (device_info.stdout == ''):
                     return ''.join(device_info.stderr)
                 else:
@@ -192,88 +396,8 @@ class Device():
     #                               Method init
     # ----------------------------------------------------------------------------
     def init(self, mode):
-        if mode == 'adb':
-            device_info = self.adb_device_info
-            if device_info:
-                s_active_slot = "ro.boot.slot_suffix"
-                s_bootloader_version = "ro.bootloader"
-                s_build = "ro.build.fingerprint"
-                s_api_level = "ro.build.version.sdk"
-                s_hardware = "ro.hardware"
-                s_architecture = "ro.product.cpu.abi"
-                # USNF related props
-                s_sys_oem_unlock_allowed = 'sys.oem_unlock_allowed'
-                s_ro_boot_flash_locked = 'ro.boot.flash.locked'
-                s_ro_boot_vbmeta_device_state = 'ro.boot.vbmeta.device_state'
-                s_vendor_boot_verifiedbootstate = 'vendor.boot.verifiedbootstate'
-                s_ro_product_first_api_level = 'ro.product.first_api_level'
-                s_ro_boot_verifiedbootstate = 'ro.boot.verifiedbootstate'
-                s_vendor_boot_vbmeta_device_state = 'vendor.boot.vbmeta.device_state'
-                s_ro_boot_warranty_bit = 'ro.boot.warranty_bit'
-                s_ro_warranty_bit = 'ro.warranty_bit'
-                s_ro_secure = 'ro.secure'
-                # Magisk zygote64_32 related props. https://forum.xda-developers.com/t/magisk-magisk-zygote64_32-enabling-32-bit-support-for-apps.4521029/
-                s_ro_zygote = 'ro.zygote'
-                s_ro_vendor_product_cpu_abilist = 'ro.vendor.product.cpu.abilist'
-                s_ro_vendor_product_cpu_abilist32 = 'ro.vendor.product.cpu.abilist32'
-                for line in device_info.split("\n"):
-                    if s_active_slot in line and not self._active_slot:
-                        self._active_slot = self.extract_prop(s_active_slot, line.strip())
-                        self._active_slot = self._active_slot.replace("_", "")
-                    elif s_bootloader_version in line and not self._bootloader_version:
-                        self._bootloader_version = self.extract_prop(s_bootloader_version, line.strip())
-                    elif s_build in line and not self._build:
-                        self._build = self.extract_prop(s_build, line.strip())
-                        self._build = self._build.split('/')[3]
-                    elif s_api_level in line and not self._api_level:
-                        self._api_level = self.extract_prop(s_api_level, line.strip())
-                    elif s_hardware in line and not self._hardware:
-                        self._hardware = self.extract_prop(s_hardware, line.strip())
-                    elif s_architecture in line and not self._architecture:
-                        self._architecture = self.extract_prop(s_architecture, line.strip())
-                    elif s_sys_oem_unlock_allowed in line and not self._sys_oem_unlock_allowed:
-                        self._sys_oem_unlock_allowed = self.extract_prop(s_sys_oem_unlock_allowed, line.strip())
-                    elif s_ro_boot_flash_locked in line and not self._ro_boot_flash_locked:
-                        self._ro_boot_flash_locked = self.extract_prop(s_ro_boot_flash_locked, line.strip())
-                    elif s_ro_boot_vbmeta_device_state in line and not self._ro_boot_vbmeta_device_state:
-                        self._ro_boot_vbmeta_device_state = self.extract_prop(s_ro_boot_vbmeta_device_state, line.strip())
-                    elif s_vendor_boot_verifiedbootstate in line and not self._vendor_boot_verifiedbootstate:
-                        self._vendor_boot_verifiedbootstate = self.extract_prop(s_vendor_boot_verifiedbootstate, line.strip())
-                    elif s_ro_product_first_api_level in line and not self._ro_product_first_api_level:
-                        self._ro_product_first_api_level = self.extract_prop(s_ro_product_first_api_level, line.strip())
-                    elif s_ro_boot_verifiedbootstate in line and not self._ro_boot_verifiedbootstate:
-                        self._ro_boot_verifiedbootstate = self.extract_prop(s_ro_boot_verifiedbootstate, line.strip())
-                    elif s_vendor_boot_vbmeta_device_state in line and not self._vendor_boot_vbmeta_device_state:
-                        self._vendor_boot_vbmeta_device_state = self.extract_prop(s_vendor_boot_vbmeta_device_state, line.strip())
-                    elif s_ro_boot_warranty_bit in line and not self._ro_boot_warranty_bit:
-                        self._ro_boot_warranty_bit = self.extract_prop(s_ro_boot_warranty_bit, line.strip())
-                    elif s_ro_warranty_bit in line and not self._ro_warranty_bit:
-                        self._ro_warranty_bit = self.extract_prop(s_ro_warranty_bit, line.strip())
-                    elif s_ro_secure in line and not self._ro_secure:
-                        self._ro_secure = self.extract_prop(s_ro_secure, line.strip())
-                    elif s_ro_zygote in line and not self._ro_zygote:
-                        self._ro_zygote = self.extract_prop(s_ro_zygote, line.strip())
-                    elif s_ro_vendor_product_cpu_abilist in line and not self._ro_vendor_product_cpu_abilist:
-                        self._ro_vendor_product_cpu_abilist = self.extract_prop(s_ro_vendor_product_cpu_abilist, line.strip())
-                    elif s_ro_vendor_product_cpu_abilist32 in line and not self._ro_vendor_product_cpu_abilist32:
-                        self._ro_vendor_product_cpu_abilist32 = self.extract_prop(s_ro_vendor_product_cpu_abilist32, line.strip())
-        elif mode == 'f.b':
-            device_info = self.fastboot_device_info
-            if device_info:
-                s_active_slot = "(bootloader) current-slot"
-                s_hardware = "(bootloader) product"
-                s_unlocked = "(bootloader) unlocked"
-                for line in device_info.split("\n"):
-                    if s_active_slot in line and not self._active_slot:
-                        self._active_slot = self.extract_prop(s_active_slot, line.strip())
-                    elif s_hardware in line and not self._hardware:
-                        self._hardware = self.extract_prop(s_hardware, line.strip())
-                    elif s_unlocked in line and not self._unlocked:
-                        self._unlocked = self.extract_prop(s_unlocked, line.strip())
-                        if self._unlocked == 'yes':
-                            self._unlocked = True
-                        else:
-                            self._unlocked = False
+        # getprop / getvar all is read and parsed once, the properties below look into it
+        self.props
 
         # set has_init_boot
         self._has_init_boot = False
@@ -284,17 +408,29 @@ class Device():
             self._has_init_boot = True
 
     # ----------------------------------------------------------------------------
-    #                               property extract_prop
+    #                               property props
     # ----------------------------------------------------------------------------
-    def extract_prop(self, search, match):
-        if self.mode == 'adb':
-            l,r = match.split(": ")
-            if l.strip() == f"[{search}]":
-                return r.strip().strip("[").strip("]")
-        elif self.mode == 'f.b':
-            l,r = match.split(":")
-            if l.strip() == f"{search}":
-                return r.strip()
+    @property
+    def props(self):
+        # getprop in adb mode, getvar all (without the "(bootloader) " prefix) in fastboot mode
+        if self._props is None:
+            device_info = self.device_info or ''
+            if self.mode == 'adb':
+                self._props = {m.group(1): m.group(2) for m in GETPROP_RE.finditer(device_info)}
+            elif self.mode == 'f.b':
+                self._props = {m.group(1).strip(): m.group(2).strip() for m in FASTBOOT_VAR_RE.finditer(device_info)}
+            else:
+                self._props = {}
+        return self._props
+
+    # ----------------------------------------------------------------------------
+    #                               method get_prop
+    # ----------------------------------------------------------------------------
+    def get_prop(self, name, mode = 'adb'):
+        # returns '' when not in the given mode or the property is not set
+        if self.mode != mode:
+            return ''
+        return self.props.get(name, '')
 
     # ----------------------------------------------------------------------------
     #                               property has_init_boot
@@ -311,10 +447,9 @@ class Device():
     # ----------------------------------------------------------------------------
     @property
     def active_slot(self):
-        if self._active_slot is None:
-            return ''
-        else:
-            return self._active_slot
+        if self.mode == 'f.b':
+            return self.get_prop('current-slot', 'f.b')
+        return self.get_prop('ro.boot.slot_suffix').replace("_", "")
 
     # ----------------------------------------------------------------------------
     #                               property inactive_slot
@@ -334,190 +469,140 @@ class Device():
     # ----------------------------------------------------------------------------
     @property
     def bootloader_version(self):
-        if self._bootloader_version is None:
-            return ''
-        else:
-            return self._bootloader_version
+        return self.get_prop('ro.bootloader')
 
     # ----------------------------------------------------------------------------
     #                               property build
     # ----------------------------------------------------------------------------
     @property
     def build(self):
-        if self._build is None:
-            return ''
-        else:
-            return self._build
+        build = self.get_prop('ro.build.fingerprint').split('/')
+        if len(build) > 3:
+            return build[3]
+        return ''
 
     # ----------------------------------------------------------------------------
     #                               property api_level
     # ----------------------------------------------------------------------------
     @property
     def api_level(self):
-        if self._api_level is None:
-            return ''
-        else:
-            return self._api_level
+        return self.get_prop('ro.build.version.sdk')
 
     # ----------------------------------------------------------------------------
     #                               property hardware
     # ----------------------------------------------------------------------------
     @property
     def hardware(self):
-        if self._hardware is None:
-            return ''
-        else:
-            return self._hardware
+        if self.mode == 'f.b':
+            return self.get_prop('product', 'f.b')
+        return self.get_prop('ro.hardware')
 
     # ----------------------------------------------------------------------------
     #                               property architecture
     # ----------------------------------------------------------------------------
     @property
     def architecture(self):
-        if self._architecture is None:
-            return ''
-        else:
-            return self._architecture
+        return self.get_prop('ro.product.cpu.abi')
 
     # ----------------------------------------------------------------------------
     #                               property sys_oem_unlock_allowed
     # ----------------------------------------------------------------------------
     @property
     def sys_oem_unlock_allowed(self):
-        if self._sys_oem_unlock_allowed is None:
-            return ''
-        else:
-            return self._sys_oem_unlock_allowed
+        return self.get_prop('sys.oem_unlock_allowed')
 
     # ----------------------------------------------------------------------------
     #                               property ro_boot_flash_locked
     # ----------------------------------------------------------------------------
     @property
     def ro_boot_flash_locked(self):
-        if self._ro_boot_flash_locked is None:
-            return ''
-        else:
-            return self._ro_boot_flash_locked
+        return self.get_prop('ro.boot.flash.locked')
 
     # ----------------------------------------------------------------------------
     #                               property ro_boot_vbmeta_device_state
     # ----------------------------------------------------------------------------
     @property
     def ro_boot_vbmeta_device_state(self):
-        if self._ro_boot_vbmeta_device_state is None:
-            return ''
-        else:
-            return self._ro_boot_vbmeta_device_state
+        return self.get_prop('ro.boot.vbmeta.device_state')
 
     # ----------------------------------------------------------------------------
     #                               property vendor_boot_verifiedbootstate
     # ----------------------------------------------------------------------------
     @property
     def vendor_boot_verifiedbootstate(self):
-        if self._vendor_boot_verifiedbootstate is None:
-            return ''
-        else:
-            return self._vendor_boot_verifiedbootstate
+        return self.get_prop('vendor.boot.verifiedbootstate')
 
     # ----------------------------------------------------------------------------
     #                               property ro_product_first_api_level
     # ----------------------------------------------------------------------------
     @property
     def ro_product_first_api_level(self):
-        if self._ro_product_first_api_level is None:
-            return ''
-        else:
-            return self._ro_product_first_api_level
+        return self.get_prop('ro.product.first_api_level')
 
     # ----------------------------------------------------------------------------
     #                               property ro_boot_verifiedbootstate
     # ----------------------------------------------------------------------------
     @property
     def ro_boot_verifiedbootstate(self):
-        if self._ro_boot_verifiedbootstate is None:
-            return ''
-        else:
-            return self._ro_boot_verifiedbootstate
+        return self.get_prop('ro.boot.verifiedbootstate')
 
     # ----------------------------------------------------------------------------
     #                               property vendor_boot_vbmeta_device_state
     # ----------------------------------------------------------------------------
     @property
     def vendor_boot_vbmeta_device_state(self):
-        if self._vendor_boot_vbmeta_device_state is None:
-            return ''
-        else:
-            return self._vendor_boot_vbmeta_device_state
+        return self.get_prop('vendor.boot.vbmeta.device_state')
 
     # ----------------------------------------------------------------------------
     #                               property ro_boot_warranty_bit
     # ----------------------------------------------------------------------------
     @property
     def ro_boot_warranty_bit(self):
-        if self._ro_boot_warranty_bit is None:
-            return ''
-        else:
-            return self._ro_boot_warranty_bit
+        return self.get_prop('ro.boot.warranty_bit')
 
     # ----------------------------------------------------------------------------
     #                               property ro_warranty_bit
     # ----------------------------------------------------------------------------
     @property
     def ro_warranty_bit(self):
-        if self._ro_warranty_bit is None:
-            return ''
-        else:
-            return self._ro_warranty_bit
+        return self.get_prop('ro.warranty_bit')
 
     # ----------------------------------------------------------------------------
     #                               property ro_secure
     # ----------------------------------------------------------------------------
     @property
     def ro_secure(self):
-        if self._ro_secure is None:
-            return ''
-        else:
-            return self._ro_secure
+        return self.get_prop('ro.secure')
 
     # ----------------------------------------------------------------------------
     #                               property ro_zygote
     # ----------------------------------------------------------------------------
     @property
     def ro_zygote(self):
-        if self._ro_zygote is None:
-            return ''
-        else:
-            return self._ro_zygote
+        return self.get_prop('ro.zygote')
 
     # ----------------------------------------------------------------------------
     #                               property ro_vendor_product_cpu_abilist
     # ----------------------------------------------------------------------------
     @property
     def ro_vendor_product_cpu_abilist(self):
-        if self._ro_vendor_product_cpu_abilist is None:
-            return ''
-        else:
-            return self._ro_vendor_product_cpu_abilist
+        return self.get_prop('ro.vendor.product.cpu.abilist')
 
     # ----------------------------------------------------------------------------
     #                               property ro_vendor_product_cpu_abilist32
     # ----------------------------------------------------------------------------
     @property
     def ro_vendor_product_cpu_abilist32(self):
-        if self._ro_vendor_product_cpu_abilist32 is None:
-            return ''
-        else:
-            return self._ro_vendor_product_cpu_abilist32
+        return self.get_prop('ro.vendor.product.cpu.abilist32')
 
     # ----------------------------------------------------------------------------
     #                               property unlocked
     # ----------------------------------------------------------------------------
     @property
     def unlocked(self):
-        if self._unlocked is None:
-            return ''
-        else:
-            return self._unlocked
+        if self.mode == 'f.b':
+            return self.get_prop('unlocked', 'f.b') == 'yes'
+        return ''
 
     # ----------------------------------------------------------------------------
     #                               property root_symbol
@@ -550,8 +635,8 @@ class Device():
     def magisk_version(self):
         if self._magisk_version is None and self.mode == 'adb' and self.rooted:
             try:
-                theCmd = f"\"{get_adb()}\" -s {self.id} shell \"su -c \'magisk -c\'\""
-                res = run_shell(theCmd)
+                theCmd = "magisk -c"
+                res = self.shell(theCmd, with_su=True)
                 if res.returncode == 0:
                     regex = re.compile("(.*?):.*\((.*?)\)")
                     m = re.findall(regex, res.stdout)
@@ -565,8 +650,8 @@ class Device():
                     self._magisk_version = self._magisk_version.strip('\n')
             except Exception:
                 try:
-                    theCmd = f"\"{get_adb()}\" -s {self.id} shell \"su -c \'/data/adb/magisk/magisk32 -c\'\""
-                    res = run_shell(theCmd)
+                    theCmd = "/data/adb/magisk/magisk32 -c"
+                    res = self.shell(theCmd, with_su=True)
                     if res.returncode == 0:
                         self._magisk_version = res.stdout.strip('\n')
                         self._magisk_version_code = self._magisk_version.strip(':')
@@ -592,8 +677,8 @@ class Device():
     def magisk_config_path(self):
         if self._magisk_config_path is None and self.mode == 'adb' and self.rooted:
             try:
-                theCmd = f"\"{get_adb()}\" -s {self.id} shell \"su -c \'ls -1 $(magisk --path)/.magisk/config\'\""
-                res = run_shell(theCmd)
+                theCmd = "ls -1 $(magisk --path)/.magisk/config"
+                res = self.shell(theCmd, with_su=True)
                 if res.returncode == 0:
                     self._magisk_config_path = res.stdout.strip('\n')
                 else:
@@ -611,12 +696,9 @@ class Device():
     def get_partitions(self):
         if self.mode != 'adb':
             return -1
-        if self.rooted:
-            theCmd = f"\"{get_adb()}\" -s {self.id} shell \"su -c \'cd /dev/block/bootdevice/by-name/; ls -1 .\'\""
-        else:
-            theCmd = f"\"{get_adb()}\" -s {self.id} shell cd /dev/block/bootdevice/by-name/; ls -1 ."
+        theCmd = "cd /dev/block/bootdevice/by-name/; ls -1 ."
         try:
-            res = run_shell(theCmd)
+            res = self.shell(theCmd, self.rooted)
             if res.returncode == 0:
                 list = res.stdout.split('\n')
             else:
@@ -638,8 +720,8 @@ class Device():
             return -1
         try:
             self.backups.clear()
-            theCmd = f"\"{get_adb()}\" -s {self.id} shell \"su -c \'ls -l -d -1 /data/magisk_backup_*\'\""
-            res = run_shell(theCmd)
+            theCmd = "ls -l -d -1 /data/magisk_backup_*"
+            res = self.shell(theCmd, with_su=True)
             if res.returncode == 0:
                 list = res.stdout.split('\n')
             else:
@@ -687,8 +769,8 @@ class Device():
     def magisk_backups(self):
         if self.mode == 'adb' and self.rooted:
             try:
-                theCmd = f"\"{get_adb()}\" -s {self.id} shell \"su -c \'ls -d -1 /data/magisk_backup_*\'\""
-                res = run_shell(theCmd)
+                theCmd = "ls -d -1 /data/magisk_backup_*"
+                res = self.shell(theCmd, with_su=True)
                 if res.returncode == 0:
                     _magisk_backups = res.stdout.replace('/data/magisk_backup_', '').split('\n')
                 else:
@@ -707,8 +789,8 @@ class Device():
     def magisk_sha1(self):
         if self.mode == 'adb' and self.rooted:
             try:
-                theCmd = f"\"{get_adb()}\" -s {self.id} shell \"su -c \'cat $(magisk --path)/.magisk/config | grep SHA1 | cut -d \'=\' -f 2\'\""
-                res = run_shell(theCmd)
+                theCmd = "cat $(magisk --path)/.magisk/config | grep SHA1 | cut -d '=' -f 2"
+                res = self.shell(theCmd, with_su=True)
                 if res.returncode == 0:
                     _magisk_sha1 = res.stdout.strip('\n')
                 else:
@@ -727,8 +809,8 @@ class Device():
         if self.mode == 'adb' and self.rooted:
             try:
                 print("Making sure stock_boot.img is found on the device ...")
-                theCmd = f"\"{get_adb()}\" -s {self.id} shell \"su -c \'ls -l /data/adb/magisk/stock_boot.img\'\""
-                res = run_shell(theCmd)
+                theCmd = "ls -l /data/adb/magisk/stock_boot.img"
+                res = self.shell(theCmd, with_su=True)
                 # expect 0
                 if res.returncode != 0:
                     print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: /data/adb/magisk/stock_boot.img is not found!")
@@ -739,8 +821,8 @@ class Device():
                     return -2
 
                 print("Triggering Magisk run_migration to create a Backup of source boot.img")
-                theCmd = f"\"{get_adb()}\" -s {self.id} shell \"su -c \'cd /data/adb/magisk; ./magiskboot cleanup; . ./util_functions.sh; run_migrations\'\""
-                res = run_shell(theCmd)
+                theCmd = "cd /data/adb/magisk; ./magiskboot cleanup; . ./util_functions.sh; run_migrations"
+                res = self.shell(theCmd, with_su=True)
                 if res.returncode == 0:
                     print("run_migration completed.")
                     if sha1:
@@ -785,9 +867,9 @@ class Device():
 
                 # copy stock_boot from /data/local/tmp folder
                 print("Copying /data/local/tmp/stock_boot.img to /data/adb/magisk/stock_boot.img ...")
-                theCmd = f"\"{get_adb()}\" -s {self.id} shell \"su -c \'cp /data/adb/magisk/stock_boot.img /data/adb/magisk/stock_boot.img\'\""
+                theCmd = "cp /data/adb/magisk/stock_boot.img /data/adb/magisk/stock_boot.img"
                 debug(theCmd)
-                res = run_shell(theCmd)
+                res = self.shell(theCmd, with_su=True)
                 # expect ret 0
                 if res.returncode != 0:
                     print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: Encountered an error.")
@@ -838,8 +920,8 @@ class Device():
                 magisk_sha1 = self.magisk_sha1
                 print(f"The Current SHA1 in Magisk config is: {magisk_sha1}")
                 print(f"Changing Magisk config SHA1 to: {sha1} ...")
-                theCmd = f"\"{get_adb()}\" -s {self.id} shell \"su -c \'cd {magisk_config_path}; sed -i \"s/{magisk_sha1}/{sha1}/g\" config\'\""
-                res = run_shell(theCmd)
+                theCmd = f'cd {magisk_config_path}; sed -i "s/{magisk_sha1}/{sha1}/g" config'
+                res = self.shell(theCmd, with_su=True)
                 if res.returncode == 0:
                     # Read back to make sure it us updated
                     print("Getting back the SHA1 from Magisk config ...")
@@ -887,13 +969,13 @@ class Device():
             if with_su:
                 if self.rooted:
                     print(f"Deleting {file_path} from the device as root ...")
-                    theCmd = f"\"{get_adb()}\" -s {self.id} shell \"su -c \'rm -{flag}f {file_path}\'\""
+                    theCmd = f"rm -{flag}f {file_path}"
                 else:
                     print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: Could not delete {file_path}. Device is not rooted.")
             else:
                 print(f"Deleting {file_path} from the device ...")
-                theCmd = f"\"{get_adb()}\" -s {self.id} shell rm -{flag}f {file_path}"
-            res = run_shell(theCmd)
+                theCmd = f"rm -{flag}f {file_path}"
+            res = self.shell(theCmd, with_su)
             if res.returncode == 0:
                 print("Return Code: 0")
                 return 0
@@ -944,8 +1026,8 @@ class Device():
 
             print(f"Dumping partition to file: {file_path} ...")
             puml(f":Dump Partition;\nnote right:Partition: {partition};\n", True)
-            theCmd = f"\"{get_adb()}\" -s {self.id} shell \"su -c \'dd if=/dev/block/bootdevice/by-name/{partition} of={file_path}\'\""
-            res = run_shell(theCmd)
+            theCmd = f"dd if=/dev/block/bootdevice/by-name/{partition} of={file_path}"
+            res = self.shell(theCmd, with_su=True)
             if res.returncode == 0:
                 print("Return Code: 0")
                 return 0, file_path
@@ -979,8 +1061,8 @@ class Device():
             return -1
         try:
             print(f"Copying {source} to {dest} ...")
-            theCmd = f"\"{get_adb()}\" -s {self.id} shell \"su -c \'cp {source} {dest}\'\""
-            res = run_shell(theCmd)
+            theCmd = f"cp {source} {dest}"
+            res = self.shell(theCmd, with_su=True)
             if res.returncode == 0:
                 print("Return Code: 0")
                 return 0
@@ -1014,13 +1096,13 @@ class Device():
             if with_su:
                 if self.rooted:
                     print(f"Checking for {file_path} on the device as root ...")
-                    theCmd = f"\"{get_adb()}\" -s {self.id} shell \"su -c \'ls {file_path}\'\""
+                    theCmd = f"ls {file_path}"
                 else:
                     print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: Could not check {file_path}. Device is not rooted.")
             else:
                 print(f"Checking for {file_path} on the device ...")
-                theCmd = f"\"{get_adb()}\" -s {self.id} shell ls {file_path}"
-            res = run_shell(theCmd)
+                theCmd = f"ls {file_path}"
+            res = self.shell(theCmd, with_su)
             if res.returncode == 0:
                 print(f"File: {file_path} is found on the device.")
                 return 1, res.stdout.strip()
@@ -1053,13 +1135,13 @@ class Device():
             if with_su:
                 if self.rooted:
                     print(f"Creating directory {dir_path} on the device as root ...")
-                    theCmd = f"\"{get_adb()}\" -s {self.id} shell \"su -c \'mkdir -p {dir_path}\'\""
+                    theCmd = f"mkdir -p {dir_path}"
                 else:
                     print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: Could not create directory {dir_path}. Device is not rooted.")
             else:
                 print(f"Creating directory {dir_path} on the device ...")
-                theCmd = f"\"{get_adb()}\" -s {self.id} shell mkdir -p {dir_path}"
-            res = run_shell(theCmd)
+                theCmd = f"mkdir -p {dir_path}"
+            res = self.shell(theCmd, with_su)
             if res.returncode == 0:
                 print("Return Code: 0")
                 return 0
@@ -1092,13 +1174,13 @@ class Device():
             if with_su:
                 if self.rooted:
                     print(f"Getting file content of {file_path} on the device as root ...")
-                    theCmd = f"\"{get_adb()}\" -s {self.id} shell \"su -c \'cat {file_path}\'\""
+                    theCmd = f"cat {file_path}"
                 else:
                     print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: Could not get file content of {file_path}. Device is not rooted.")
             else:
                 print(f"Getting file content of {file_path} on the device ...")
-                theCmd = f"\"{get_adb()}\" -s {self.id} shell cat {file_path}"
-            res = run_shell(theCmd)
+                theCmd = f"cat {file_path}"
+            res = self.shell(theCmd, with_su)
             if res.returncode == 0:
                 print("Return Code: 0")
                 return res.stdout
@@ -1148,6 +1230,11 @@ class Device():
                     return -1
             else:
                 print(f"Pushing local file: {local_file} to the device: {file_path} ...")
+                if get_use_native_adb():
+                    with contextlib.suppress(AdbError, OSError):
+                        get_adb_client().push(self.id, local_file.strip('"'), file_path)
+                        print("Return Code: 0")
+                        return 0
                 theCmd = f"\"{get_adb()}\" -s {self.id} push \"{local_file}\" {file_path}"
                 res = run_shell(theCmd)
                 if res.returncode == 0:
@@ -1198,6 +1285,11 @@ class Device():
                     return -1
 
             print(f"Pulling remote file: {remote_file} from the device to: {local_file} ...")
+            if get_use_native_adb():
+                with contextlib.suppress(AdbError, OSError):
+                    get_adb_client().pull(self.id, remote_file, local_file.strip('"'))
+                    print("Return Code: 0")
+                    return 0
             theCmd = f"\"{get_adb()}\" -s {self.id} pull \"{remote_file}\" {local_file}"
             res = run_shell(theCmd)
             if res.returncode == 0:
@@ -1236,13 +1328,13 @@ class Device():
             if with_su:
                 if self.rooted:
                     print(f"Setting permissions {permissions} on {file_path} as root ...")
-                    theCmd = f"\"{get_adb()}\" -s {self.id} shell \"su -c \'chmod {permissions} {file_path}\'\""
+                    theCmd = f"chmod {permissions} {file_path}"
                 else:
                     print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: Could not set permissions on {file_path}. Device is not rooted.")
             else:
                 print(f"Setting permissions {permissions} on {file_path} on the device ...")
-                theCmd = f"\"{get_adb()}\" -s {self.id} shell chmod {permissions} {file_path}"
-            res = run_shell(theCmd)
+                theCmd = f"chmod {permissions} {file_path}"
+            res = self.shell(theCmd, with_su)
             if res.returncode == 0:
                 print("Return Code: 0")
                 return 0
@@ -1297,8 +1389,8 @@ class Device():
             return -1
         try:
             print(f"Getting package {pkg} path on the device ...")
-            theCmd = f"\"{get_adb()}\" -s {self.id} shell pm path {pkg}"
-            res = run_shell(theCmd)
+            theCmd = f"pm path {pkg}"
+            res = self.shell(theCmd)
             if res.returncode == 0:
                 pkg_path = res.stdout.split('\n')[0]
                 pkg_path = pkg_path.split(':')[1]
@@ -1347,8 +1439,8 @@ class Device():
                 print(f"    Package Path: {pkg_path}")
             print(f"Getting package {pkg} label from the device ...")
             # theCmd = f"\"{get_adb()}\" -s {self.id} shell /data/local/tmp/aapt2 d badging {pkg_path} | grep \"application: label=\" |awk \"{{print $2}}\""
-            theCmd = f"\"{get_adb()}\" -s {self.id} shell /data/local/tmp/aapt2 d badging {pkg_path} | grep \"application: label=\""
-            res = run_shell(theCmd)
+            theCmd = f"/data/local/tmp/aapt2 d badging {pkg_path} | grep \"application: label=\""
+            res = self.shell(theCmd)
             if res.returncode == 0:
                 # print(res.stdout)
                 regex = re.compile("application: label='(.*)' icon='(.*)'")
@@ -1360,8 +1452,8 @@ class Device():
                 return pkg_label, pkg_icon
             elif res.stderr.startswith("ERROR getting 'android:icon'"):
                 # try another way
-                theCmd = f"\"{get_adb()}\" -s {self.id} shell /data/local/tmp/aapt2 d badging {pkg_path} | grep \"application-label:\""
-                res = run_shell(theCmd)
+                theCmd = f"/data/local/tmp/aapt2 d badging {pkg_path} | grep \"application-label:\""
+                res = self.shell(theCmd)
                 # print(res.stdout)
                 regex = re.compile("application-label:'(.*)'")
                 m = re.findall(regex, res.stdout)
@@ -1389,8 +1481,8 @@ class Device():
             return -1
         try:
             print(f"uiautomator dump {path} path on the device ...")
-            theCmd = f"\"{get_adb()}\" -s {self.id} shell uiautomator dump {path}"
-            res = run_shell(theCmd)
+            theCmd = f"uiautomator dump {path}"
+            res = self.shell(theCmd)
             if res.returncode == 0 and res.stderr == '':
                 return path
             print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: uiautomator dump failed.")
@@ -1410,8 +1502,8 @@ class Device():
             return -1
         try:
             print(f"click {coords} on the device ...")
-            theCmd = f"\"{get_adb()}\" -s {self.id} shell input tap {coords}"
-            res = run_shell(theCmd)
+            theCmd = f"input tap {coords}"
+            res = self.shell(theCmd)
             if res.returncode == 0:
                 return 0
             print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: click failed.")
@@ -1429,8 +1521,8 @@ class Device():
     def magisk_app_version(self):
         if self._magisk_app_version is None and self.mode == 'adb':
             try:
-                theCmd = f"\"{get_adb()}\" -s {self.id} shell dumpsys package {get_magisk_package()}"
-                res = run_shell(theCmd)
+                theCmd = f"dumpsys package {get_magisk_package()}"
+                res = self.shell(theCmd)
                 data = res.stdout.split('\n')
                 version = None
                 versionCode = None
@@ -1476,8 +1568,8 @@ class Device():
         print("Checking to see if display is unlocked ...")
         try:
             if self.mode == 'adb':
-                theCmd = f"\"{get_adb()}\" -s {self.id} shell \"dumpsys power | grep \'mHolding\'\""
-                res = run_shell(theCmd)
+                theCmd = "dumpsys power | grep 'mHolding'"
+                res = self.shell(theCmd)
                 mHoldingWakeLockSuspendBlocker = False
                 mHoldingDisplaySuspendBlocker = False
                 if res.returncode == 0:
@@ -1512,8 +1604,8 @@ class Device():
         print("Stopping Magisk ...")
         with contextlib.suppress(Exception):
             if self.mode == 'adb':
-                theCmd = f"\"{get_adb()}\" -s {self.id} shell am force-stop {get_magisk_package()}"
-                res = run_shell(theCmd)
+                theCmd = f"am force-stop {get_magisk_package()}"
+                res = self.shell(theCmd)
 
     # ----------------------------------------------------------------------------
     #                               property magisk_detailed_modules
@@ -1524,8 +1616,8 @@ class Device():
             try:
                 if self.mode == 'adb' and self.rooted:
                     if sys.platform == "win32":
-                        theCmd = f"\"{get_adb()}\" -s {self.id} shell \"su -c \'for FILE in /data/adb/modules/*; do echo $FILE; if test -f \"$FILE/disable\"; then echo \"state=disabled\"; else echo \"state=enabled\"; fi; cat \"$FILE/module.prop\"; echo; echo -----pf;done\'\""
-                        res = run_shell(theCmd)
+                        theCmd = f'for FILE in /data/adb/modules/*; do echo $FILE; if test -f "$FILE/disable"; then echo "state=disabled"; else echo "state=enabled"; fi; cat "$FILE/module.prop"; echo; echo -----pf;done'
+                        res = self.shell(theCmd, with_su=True)
                         if res.returncode == 0:
                             modules = []
                             themodules = res.stdout.split('-----pf\n')
@@ -1561,8 +1653,8 @@ class Device():
                             print(f"Stdout: {res.stdout}.")
                             print(f"Stderr: {res.stderr}.")
                     else:
-                        theCmd = f"\"{get_adb()}\" -s {self.id} shell \"su -c \'ls /data/adb/modules\'\""
-                        res = run_shell(theCmd)
+                        theCmd = "ls /data/adb/modules"
+                        res = self.shell(theCmd, with_su=True)
                         if res.returncode == 0:
                             modules = []
                             self._magisk_detailed_modules = res.stdout.split('\n')
@@ -1571,14 +1663,14 @@ class Device():
                                     m = Magisk(module)
                                     if self.mode == 'adb' and get_adb():
                                         # get the state by checking if there is a disable file in the module directory
-                                        theCmd = f"\"{get_adb()}\" -s {self.id} shell \"su -c \'ls /data/adb/modules/{module}/disable\'\""
-                                        res = run_shell(theCmd)
+                                        theCmd = f"ls /data/adb/modules/{module}/disable"
+                                        res = self.shell(theCmd, with_su=True)
                                         if res.returncode == 0:
                                             m.state = 'disabled'
                                         else:
                                             m.state = 'enabled'
-                                        theCmd = f"\"{get_adb()}\" -s {self.id} shell \"su -c \'cat /data/adb/modules/{module}/module.prop\'\""
-                                        res = run_shell(theCmd)
+                                        theCmd = f"cat /data/adb/modules/{module}/module.prop"
+                                        res = self.shell(theCmd, with_su=True)
                                         if res.returncode == 0:
                                             module_prop = res.stdout.split('\n')
                                             setattr(m, 'id', '')
@@ -1737,8 +1829,8 @@ If your are bootlooping due to bad modules, and if you load stock boot image, it
     def rooted(self):
         if self._rooted is None and self.mode == 'adb':
             if get_adb():
-                theCmd = f"\"{get_adb()}\" -s {self.id} shell \"su -c \'ls -l /data/adb/magisk/\'\""
-                res = run_shell(theCmd)
+                theCmd = "ls -l /data/adb/magisk/"
+                res = self.shell(theCmd, with_su=True)
                 if res.returncode == 0:
                     self._rooted = True
                 else:
@@ -1806,9 +1898,9 @@ If your are bootlooping due to bad modules, and if you load stock boot image, it
         if self.mode == 'adb' and get_adb() and self.rooted:
             print(f"Rebooting device {self.id} to safe mode ...")
             puml(f":Rebooting device {self.id} to safe mode;\n", True)
-            theCmd = f"\"{get_adb()}\" -s {self.id} shell \"su -c \'setprop persist.sys.safemode 1\'\""
+            theCmd = "setprop persist.sys.safemode 1"
             debug(theCmd)
-            run_shell(theCmd)
+            self.shell(theCmd, with_su=True)
             self.reboot_system()
 
     # ----------------------------------------------------------------------------
@@ -1969,9 +2061,9 @@ If your are bootlooping due to bad modules, and if you load stock boot image, it
             puml(":Enable magisk module;\n", True)
             puml(f"note right:{dirname};\n")
             theCmd = f"\"{get_adb()}\" -s {self.id} wait-for-device shell magisk --remove-modules"
-            theCmd = f"\"{get_adb()}\" -s {self.id} shell \"su -c \'rm -f /data/adb/modules/{dirname}/disable\'\""
+            theCmd = f"rm -f /data/adb/modules/{dirname}/disable"
             debug(theCmd)
-            res = run_shell(theCmd)
+            res = self.shell(theCmd, with_su=True)
             return 0
         else:
             print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: The Device {self.id} is not in adb mode.")
@@ -2012,9 +2104,9 @@ If your are bootlooping due to bad modules, and if you load stock boot image, it
             puml(":Disable magisk module;\n", True)
             puml(f"note right:{dirname};\n")
             theCmd = f"\"{get_adb()}\" -s {self.id} wait-for-device shell magisk --remove-modules"
-            theCmd = f"\"{get_adb()}\" -s {self.id} shell \"su -c \'touch /data/adb/modules/{dirname}/disable\'\""
+            theCmd = f"touch /data/adb/modules/{dirname}/disable"
             debug(theCmd)
-            res = run_shell(theCmd)
+            res = self.shell(theCmd, with_su=True)
             return 0
         else:
             print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: The Device {self.id} is not in adb mode.")
@@ -2081,6 +2173,7 @@ If your are bootlooping due to bad modules, and if you load stock boot image, it
             elif action == 'launch':
                 theCmd = f"\"{get_adb()}\" -s {self.id} shell monkey -p {pkg} -c android.intent.category.LAUNCHER 1"
 
+            # streamed as it comes, not through a (buffering) shell session
             res = run_shell2(theCmd)
         except Exception as e:
             print(e)
@@ -2096,21 +2189,21 @@ If your are bootlooping due to bad modules, and if you load stock boot image, it
             return
         try:
             if state == 'all':
-                theCmd = f"\"{get_adb()}\" -s {self.id} shell pm list packages"
+                theCmd = "pm list packages"
             elif state == 'all+uninstalled':
-                theCmd = f"\"{get_adb()}\" -s {self.id} shell pm list packages -u"
+                theCmd = "pm list packages -u"
             elif state == 'disabled':
-                theCmd = f"\"{get_adb()}\" -s {self.id} shell pm list packages -d"
+                theCmd = "pm list packages -d"
             elif state == 'enabled':
-                theCmd = f"\"{get_adb()}\" -s {self.id} shell pm list packages -e"
+                theCmd = "pm list packages -e"
             elif state == 'system':
-                theCmd = f"\"{get_adb()}\" -s {self.id} shell pm list packages -s"
+                theCmd = "pm list packages -s"
             elif state == '3rdparty':
-                theCmd = f"\"{get_adb()}\" -s {self.id} shell pm list packages -3"
+                theCmd = "pm list packages -3"
             elif state == 'user0':
-                theCmd = f"\"{get_adb()}\" -s {self.id} shell pm list packages -s --user 0"
+                theCmd = "pm list packages -s --user 0"
 
-            res = run_shell(theCmd)
+            res = self.shell(theCmd)
             if res.returncode == 0:
                 return res.stdout.replace('package:','')
             print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: Could not get package list.")
@@ -2203,52 +2296,381 @@ def debug(message):
         print(f"debug: {message}")
 
 
+# ============================================================================
+#                               Function init_devices
+# ============================================================================
+def init_devices(found, on_device=None):
+    """Initializes devices in parallel.
+
+    Args:
+        found:      List of (id, mode, true_mode) as listed by adb / fastboot.
+        on_device:  Called on the calling thread with the details string of each
+                    device as soon as it is initialized (Default: None)
+
+    Returns:
+        The initialized Device objects in the order of found, devices that fail
+        or take longer than DEVICE_INIT_TIMEOUT seconds are left out.
+    """
+    if not found:
+        return []
+    devices = [None] * len(found)
+    started = {}
+    pending = queue.Queue()
+    results = queue.Queue()
+    for index, item in enumerate(found):
+        pending.put((index, item))
+
+    def worker():
+        # daemon threads rather than a ThreadPoolExecutor, which is joined at exit,
+        # so that a device that never answers can't hold up closing the app
+        while True:
+            try:
+                index, (d_id, mode, true_mode) = pending.get_nowait()
+            except queue.Empty:
+                return
+            device = Device(d_id, mode, true_mode)
+            device.command_timeout = DEVICE_INIT_TIMEOUT
+            devices[index] = device
+            started[index] = time.time()
+            try:
+                device.init(mode)
+                results.put((index, device.get_device_details(), None))
+            except Exception as e:
+                results.put((index, None, e))
+            device.command_timeout = None
+
+    def start_worker():
+        threading.Thread(target=worker, daemon=True).start()
+
+    for i in range(min(DEVICE_SCAN_WORKERS, len(found))):
+        start_worker()
+    phones = [None] * len(found)
+    remaining = set(range(len(found)))
+    while remaining:
+        with contextlib.suppress(queue.Empty):
+            index, device_details, error = results.get(timeout=0.1)
+            if index in remaining:
+                remaining.discard(index)
+                if error:
+                    print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: Could not initialize device {found[index][0]}")
+                    print(error)
+                else:
+                    phones[index] = devices[index]
+                    if on_device:
+                        on_device(device_details)
+        for index in list(remaining):
+            if index in started and time.time() - started[index] > DEVICE_INIT_TIMEOUT:
+                print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: Device {found[index][0]} did not respond within {DEVICE_INIT_TIMEOUT} seconds, skipping it.")
+                remaining.discard(index)
+                # kills the commands it's stuck in and fails the rest, the worker finishes shortly
+                devices[index].abandon()
+                # the stuck worker is out for now, don't let the devices still queued wait for it
+                if not pending.empty():
+                    start_worker()
+        if threading.current_thread() is threading.main_thread():
+            wx.Yield()
+    return [phone for phone in phones if phone]
+
+
+# ============================================================================
+#                               Class DeviceWatcher
+# ============================================================================
+class DeviceWatcher():
+    """Keeps a live registry of connected devices.
+
+    adb devices come from the adb server's track-devices stream and fastboot
+    devices from polling `fastboot devices`. Devices still connected keep their
+    Device object (and everything it cached), new ones are initialized in the
+    background and on_change is called (from a watcher thread) after each change.
+    With the native adb client disabled, adb devices are polled with `adb devices`.
+    While paused (a device operation is running) nothing is polled or initialized,
+    afterwards the devices known from before the pause are initialized again, as the
+    operation may have rebooted, flashed or rooted them.
+    """
+    def __init__(self, on_change=None, phones=None):
+        self.on_change = on_change
+        self.stop_event = threading.Event()
+        self.paused = threading.Event()
+        self.lock = threading.Lock()
+        self.sync_lock = threading.Lock()
+        # (id, mode, true_mode) -> Device
+        self.devices = {get_device_key(phone): phone for phone in phones or []}
+        self.adb_found = None
+        self.fastboot_found = None
+        self.failed = {}
+        # devices registered when the pause started, and keys to initialize again after it
+        self.paused_devices = set()
+        self.stale = set()
+
+    # ----------------------------------------------------------------------------
+    #                               method start
+    # ----------------------------------------------------------------------------
+    def start(self):
+        for target in (self._track_adb, self._poll_fastboot):
+            threading.Thread(target=target, daemon=True).start()
+
+    # ----------------------------------------------------------------------------
+    #                               method stop
+    # ----------------------------------------------------------------------------
+    def stop(self):
+        self.stop_event.set()
+
+    # ----------------------------------------------------------------------------
+    #                               method pause
+    # ----------------------------------------------------------------------------
+    def pause(self):
+        # keeps the watcher off the devices while an operation (flash, reboot ...) runs
+        with self.lock:
+            if not self.paused.is_set():
+                self.paused_devices = set(self.devices.values())
+            self.paused.set()
+
+    # ----------------------------------------------------------------------------
+    #                               method resume
+    # ----------------------------------------------------------------------------
+    def resume(self):
+        if not self.paused.is_set():
+            return
+        with self.lock:
+            # the cached props, root and Magisk state of these can't be trusted anymore,
+            # devices a rescan registered during the pause are fresh
+            self.stale = {key for key, device in self.devices.items() if device in self.paused_devices}
+            self.paused_devices = set()
+            self.paused.clear()
+        # catch up with what changed meanwhile without waiting for the next poll
+        threading.Thread(target=self._resync, daemon=True).start()
+
+    # ----------------------------------------------------------------------------
+    #                               method _resync
+    # ----------------------------------------------------------------------------
+    def _resync(self):
+        found = []
+        with contextlib.suppress(Exception):
+            found = list_fastboot_devices()
+        if not get_use_native_adb() and get_adb():
+            adb_found = []
+            with contextlib.suppress(Exception):
+                adb_found = list_adb_devices()
+            self._update(adb_found=adb_found, fastboot_found=found)
+        else:
+            self._update(fastboot_found=found)
+
+    # ----------------------------------------------------------------------------
+    #                               method is_ready
+    # ----------------------------------------------------------------------------
+    def is_ready(self):
+        # both device lists have been seen at least once
+        return self.adb_found is not None and self.fastboot_found is not None
+
+    # ----------------------------------------------------------------------------
+    #                               method get_devices
+    # ----------------------------------------------------------------------------
+    def get_devices(self):
+        # the initialized devices in adb / fastboot listing order
+        with self.lock:
+            found = (self.adb_found or []) + (self.fastboot_found or [])
+            return [self.devices[key] for key in found if key in self.devices]
+
+    # ----------------------------------------------------------------------------
+    #                               method set_devices
+    # ----------------------------------------------------------------------------
+    def set_devices(self, phones):
+        # takes over the devices of a full rescan
+        with self.lock:
+            for key, device in self.devices.items():
+                if device not in phones:
+                    device.close_shell_sessions()
+            self.devices = {get_device_key(phone): phone for phone in phones}
+            self.failed.clear()
+            self.stale.clear()
+
+    # ----------------------------------------------------------------------------
+    #                               method _track_adb
+    # ----------------------------------------------------------------------------
+    def _track_adb(self):
+        while not self.stop_event.is_set():
+            if get_adb() and not get_use_native_adb():
+                # the native client is opt-in, without it poll the adb binary like _poll_fastboot does
+                if not self.paused.is_set():
+                    found = []
+                    with contextlib.suppress(Exception):
+                        found = list_adb_devices()
+                    self._update(adb_found=found)
+            elif get_adb():
+                try:
+                    for devices in get_adb_client().track_devices(self.stop_event):
+                        found = []
+                        for d_id, mode in devices:
+                            if mode in ('device', 'recovery', 'sideload'):
+                                found.append((d_id, 'adb', mode if mode in ('recovery', 'sideload') else None))
+                        self._update(adb_found=found)
+                except (AdbError, OSError) as e:
+                    debug(f"Device watcher lost the adb server: {e}")
+                    # devices can't be seen without the server, start it again like any adb command would
+                    self._update(adb_found=[])
+                    with contextlib.suppress(Exception):
+                        run_shell(f"\"{get_adb()}\" start-server")
+            else:
+                self._update(adb_found=[])
+            self.stop_event.wait(FASTBOOT_POLL_INTERVAL)
+
+    # ----------------------------------------------------------------------------
+    #                               method _poll_fastboot
+    # ----------------------------------------------------------------------------
+    def _poll_fastboot(self):
+        while not self.stop_event.is_set():
+            if not self.paused.is_set():
+                found = []
+                with contextlib.suppress(Exception):
+                    found = list_fastboot_devices()
+                self._update(fastboot_found=found)
+            self.stop_event.wait(FASTBOOT_POLL_INTERVAL)
+
+    # ----------------------------------------------------------------------------
+    #                               method _update
+    # ----------------------------------------------------------------------------
+    def _update(self, adb_found=None, fastboot_found=None):
+        with self.sync_lock:
+            with self.lock:
+                before = list(self.devices.items())
+                if adb_found is not None:
+                    self.adb_found = adb_found
+                if fastboot_found is not None:
+                    self.fastboot_found = fastboot_found
+                # while paused only the lists are kept, resume reconciles the devices
+                if not self.is_ready() or self.paused.is_set():
+                    return
+                found = self.adb_found + self.fastboot_found
+                for key in [key for key in self.devices if key not in found]:
+                    self.devices.pop(key).close_shell_sessions()
+                    self.failed.pop(key, None)
+                self.stale &= set(found)
+                now = time.time()
+                # stale devices keep serving until their replacement is initialized
+                new = [key for key in found if (key not in self.devices or key in self.stale) and now - self.failed.get(key, 0) > DEVICE_RETRY_INTERVAL]
+            if new:
+                phones = init_devices(new)
+                with self.lock:
+                    for key in new:
+                        self.failed[key] = now
+                    initialized = {get_device_key(phone): phone for phone in phones}
+                    for key in new:
+                        if key in self.stale:
+                            self.stale.discard(key)
+                            if key in self.devices:
+                                old = self.devices.pop(key)
+                                if old is not initialized.get(key):
+                                    old.close_shell_sessions()
+                    for key, phone in initialized.items():
+                        self.failed.pop(key, None)
+                        if key in self.adb_found + self.fastboot_found:
+                            self.devices[key] = phone
+                        else:
+                            # it went away while it was being initialized
+                            phone.close_shell_sessions()
+            with self.lock:
+                changed = list(self.devices.items()) != before
+        if changed and self.on_change:
+            self.on_change()
+
+
+# ============================================================================
+#                               Function get_device_key
+# ============================================================================
+def get_device_key(device):
+    true_mode = device.true_mode if device.true_mode != device.mode else None
+    return (device.id, device.mode, true_mode)
+
+
+# ============================================================================
+#                               Function start_device_watcher
+# ============================================================================
+def start_device_watcher(on_change=None):
+    # seeds the watcher with the devices of the last scan so that they are not initialized again
+    watcher = get_device_watcher()
+    if watcher:
+        watcher.stop()
+    watcher = DeviceWatcher(on_change, get_phones())
+    set_device_watcher(watcher)
+    watcher.start()
+    return watcher
+
+
+# ============================================================================
+#                               Function list_adb_devices
+# ============================================================================
+def list_adb_devices():
+    # returns [(id, 'adb', true_mode)] of the devices adb can talk to
+    found = []
+    theCmd = f"\"{get_adb()}\" devices"
+    response = run_shell(theCmd)
+    if response.stdout:
+        for device in response.stdout.split('\n'):
+            if 'device' in device or 'recovery' in device or 'sideload' in device:
+                with contextlib.suppress(Exception):
+                    d_id = device.split("\t")
+                    mode = d_id[1].strip()
+                    d_id = d_id[0].strip()
+                    true_mode = None
+                    if mode in ('recovery', 'sideload'):
+                        true_mode = mode
+                    found.append((d_id, 'adb', true_mode))
+    else:
+        print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: Unable to determine Android Platform Tools version.\n")
+    return found
+
+
+# ============================================================================
+#                               Function list_fastboot_devices
+# ============================================================================
+def list_fastboot_devices():
+    # returns [(id, 'f.b', None)] of the devices in fastboot mode
+    found = []
+    if get_fastboot():
+        theCmd = f"\"{get_fastboot()}\" devices"
+        response = run_shell(theCmd)
+        for device in response.stdout.split('\n'):
+            if 'fastboot' in device:
+                d_id = device.split("\t")
+                d_id = d_id[0].strip()
+                found.append((d_id, 'f.b', None))
+    return found
+
+
 # ============================================================================
 #                               Function get_connected_devices
 # ============================================================================
-def get_connected_devices():
+def get_connected_devices(on_device=None, rescan=False):
     devices = []
     phones = []
 
     try:
-        if get_adb():
-            theCmd = f"\"{get_adb()}\" devices"
-            response = run_shell(theCmd)
-            if response.stdout:
-                for device in response.stdout.split('\n'):
-                    if 'device' in device or 'recovery' in device or 'sideload' in device:
-                        with contextlib.suppress(Exception):
-                            d_id = device.split("\t")
-                            mode = d_id[1].strip()
-                            d_id = d_id[0].strip()
-                            true_mode = None
-                            if mode in ('recovery', 'sideload'):
-                                true_mode = mode
-                            device = Device(d_id, 'adb', true_mode)
-                            device.init('adb')
-                            device_details = device.get_device_details()
-                            devices.append(device_details)
-                            phones.append(device)
-            else:
-                print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: Unable to determine Android Platform Tools version.\n")
+        watcher = get_device_watcher()
+        if watcher and watcher.is_ready() and not watcher.paused.is_set() and not rescan:
+            # the watcher keeps the list current, no need to talk to the devices
+            phones = watcher.get_devices()
         else:
-            print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: adb command is not found!")
+            found = []
+            if get_adb():
+                found += list_adb_devices()
+            else:
+                print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: adb command is not found!")
 
-        if get_fastboot():
-            theCmd = f"\"{get_fastboot()}\" devices"
-            response = run_shell(theCmd)
-            for device in response.stdout.split('\n'):
-                if 'fastboot' in device:
-                    d_id = device.split("\t")
-                    d_id = d_id[0].strip()
-                    device = Device(d_id, 'f.b')
-                    device.init('f.b')
-                    device_details = device.get_device_details()
-                    devices.append(device_details)
-                    phones.append(device)
-        else:
-            print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: fastboot command is not found!")
+            if get_fastboot():
+                found += list_fastboot_devices()
+            else:
+                print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: fastboot command is not found!")
 
+            # a paused watcher (an operation is running) is frozen, e.g. across the reboots of a flash
+            phones = init_devices(found, on_device)
+            if watcher:
+                watcher.set_devices(phones)
+        devices = [phone.get_device_details() for phone in phones]
+        for phone in get_phones():
+            if phone not in phones and not (watcher and phone in watcher.get_devices()):
+                phone.close_shell_sessions()
+                if get_use_native_adb():
+                    get_adb_client().forget(phone.id)
         set_phones(phones)
     except Exception as e:
         print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: Encountered an error while scanning for devices.")
@@ -1,29 +1,39 @@
 #!/usr/bin/env python
 
-import binascii
 import contextlib
+import fnmatch
 import hashlib
 import io
 import json
+import mmap
 import os
 import re
 import shutil
 import sqlite3 as sl
+import struct
 import subprocess
 import sys
 import tarfile
 import tempfile
+import threading
 import time
 import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+import lz4.block
 import lz4.frame
 import requests
 import wx
 from packaging.version import parse
 from platformdirs import *
 
+from adb_client import AdbClient, AdbError
 from constants import *
+from payload_dumper import get_zip_member_offset
+
+BOOT_MARKERS_RE = re.compile(b'|'.join(re.escape(marker.encode('ascii')) for marker in BOOT_MARKERS))
 
 verbose = False
 adb = None
@@ -31,6 +41,7 @@ fastboot = None
 adb_sha256 = None
 fastboot_sha256 = None
 phones = []
+device_watcher = None
 phone = None
 advanced_options = False
 update_check = True
@@ -62,7 +73,10 @@ app_labels = {}
 a_only = False
 offer_patch_methods = False
 use_busybox_shell = False
+use_native_adb = False
+adb_client = None
 firmware_hash_valid = False
+firmware_hash_pending = False
 firmware_has_init_boot = False
 rom_has_init_boot = False
 dlg_checkbox_values = None
@@ -71,10 +85,13 @@ config_path = None
 android_versions = {}
 android_devices = {}
 env_variables = os.environ.copy()
-boot_list_columns = 8
+boot_list_columns = 9
 boot_column_widths = column_widths = [0] * boot_list_columns
 is_ota = False
 sdk_is_ok = False
+archive_indexes = {}
+boot_metadata_by_stat = {}
+boot_metadata_by_hash = {}
 
 # ============================================================================
 #                               Class Boot
@@ -96,6 +113,13 @@ class Boot():
         self.package_path = None
         self.package_epoch = None
         self.is_odin = None
+        self.header_version = None
+        self.os_version = None
+        self.os_patch_level = None
+        self.kernel_size = None
+        self.ramdisk_size = None
+        self.cmdline = None
+        self.has_magisk_ramdisk = None
 
 
 # ============================================================================
@@ -373,6 +397,22 @@ def set_phones(value):
     phones = value
 
 
+# ============================================================================
+#                               Function get_device_watcher
+# ============================================================================
+def get_device_watcher():
+    global device_watcher
+    return device_watcher
+
+
+# ============================================================================
+#                               Function set_device_watcher
+# ============================================================================
+def set_device_watcher(value):
+    global device_watcher
+    device_watcher = value
+
+
 # ============================================================================
 #                               Function get_phone
 # ============================================================================
@@ -629,6 +669,33 @@ def set_use_busybox_shell_settings(value):
     use_busybox_shell = value
 
 
+# ============================================================================
+#                               Function get_use_native_adb
+# ============================================================================
+def get_use_native_adb():
+    global use_native_adb
+    return use_native_adb
+
+
+# ============================================================================
+#                               Function set_use_native_adb
+# ============================================================================
+def set_use_native_adb(value):
+    global use_native_adb
+    use_native_adb = value
+
+
+# ============================================================================
+#                               Function get_adb_client
+# ============================================================================
+def get_adb_client():
+    # shared client of the adb server, so sync connections are reused across devices' calls
+    global adb_client
+    if adb_client is None:
+        adb_client = AdbClient()
+    return adb_client
+
+
 # ============================================================================
 #                               Function get_update_check
 # ============================================================================
@@ -661,6 +728,22 @@ def set_firmware_hash_validity(value):
     firmware_hash_valid = value
 
 
+# ============================================================================
+#                               Function get_firmware_hash_pending
+# ============================================================================
+def get_firmware_hash_pending():
+    global firmware_hash_pending
+    return firmware_hash_pending
+
+
+# ============================================================================
+#                               Function set_firmware_hash_pending
+# ============================================================================
+def set_firmware_hash_pending(value):
+    global firmware_hash_pending
+    firmware_hash_pending = value
+
+
 # ============================================================================
 #                               Function get_firmware_has_init_boot
 # ============================================================================
@@ -983,6 +1066,36 @@ def init_db():
             # Add the is_odin column to the BOOT table
             db.execute("ALTER TABLE BOOT ADD COLUMN is_odin INTEGER;")
 
+        # Check if the boot header columns already exist in the BOOT table
+        # Added in version 5.3
+        boot_header_columns = {
+            'header_version': 'INTEGER',
+            'os_version': 'TEXT',
+            'os_patch_level': 'TEXT',
+            'kernel_size': 'INTEGER',
+            'ramdisk_size': 'INTEGER',
+            'cmdline': 'TEXT',
+            'has_magisk_ramdisk': 'INTEGER',
+        }
+        for column, column_type in boot_header_columns.items():
+            if column not in column_names:
+                db.execute(f"ALTER TABLE BOOT ADD COLUMN {column} {column_type};")
+
+        # FILE_HASH Table, content hash cache for md5 / sha1 / sha256
+        # Added in version 5.3
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS FILE_HASH (
+                file_path TEXT NOT NULL,
+                algorithm TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                hash TEXT NOT NULL,
+                epoch INTEGER NOT NULL,
+                PRIMARY KEY (file_path, algorithm)
+            );
+        """)
+
 
 # ============================================================================
 #                               Function get_config_file_path
@@ -1123,91 +1236,313 @@ def open_terminal(path, isFile=False):
 
 
 # ============================================================================
-#                               Function check_archive_contains_file
+#                               Class ArchiveIndex
+# ============================================================================
+class ArchiveIndex():
+    # Scans an archive once, including archives nested in it, and answers membership queries from memory.
+    def __init__(self, archive_file_path):
+        self.path = archive_file_path
+        self.kind = get_archive_kind(archive_file_path)
+        # (name, depth) in archive order, nested members follow their container as container/name
+        self.entries = []
+        # uncompressed size of each member
+        self.sizes = {}
+        debug(f"Indexing {archive_file_path}")
+        if self.kind == 'zip':
+            with zipfile.ZipFile(archive_file_path, 'r') as zip_file:
+                self._scan_zip(zip_file, '', 0)
+        elif self.kind == 'tar':
+            with tarfile.open(archive_file_path, 'r') as tar_file:
+                self._scan_tar(tar_file, '', 0)
+        else:
+            debug("Unsupported file format.")
+
+    # ----------------------------------------------------------------------------
+    #                               method _scan_zip
+    # ----------------------------------------------------------------------------
+    def _scan_zip(self, zip_file, prefix, depth):
+        for info in zip_file.infolist():
+            name = info.filename
+            self.entries.append((f"{prefix}{name}", depth))
+            self.sizes[f"{prefix}{name}"] = info.file_size
+            if name.endswith('.zip'):
+                # only the central directory of the nested zip is read
+                with contextlib.suppress(zipfile.BadZipFile):
+                    with open_zip_member(zip_file, name) as nested_zip_file:
+                        with zipfile.ZipFile(nested_zip_file, 'r') as nested_zip:
+                            self._scan_zip(nested_zip, f"{prefix}{name}/", depth + 1)
+
+    # ----------------------------------------------------------------------------
+    #                               method _scan_tar
+    # ----------------------------------------------------------------------------
+    def _scan_tar(self, tar_file, prefix, depth):
+        for member in tar_file.getmembers():
+            self.entries.append((f"{prefix}{member.name}", depth))
+            self.sizes[f"{prefix}{member.name}"] = member.size
+            if not member.isfile():
+                continue
+            if member.name.endswith('.tar'):
+                with contextlib.suppress(tarfile.TarError):
+                    with tarfile.open(fileobj=tar_file.extractfile(member), mode='r') as nested_tar:
+                        self._scan_tar(nested_tar, f"{prefix}{member.name}/", depth + 1)
+            elif member.name.endswith('.zip'):
+                # tar members are stored contiguously, the member file object seeks within the tar
+                with contextlib.suppress(zipfile.BadZipFile):
+                    with zipfile.ZipFile(tar_file.extractfile(member), 'r') as nested_zip:
+                        self._scan_zip(nested_zip, f"{prefix}{member.name}/", depth + 1)
+
+    # ----------------------------------------------------------------------------
+    #                               method namelist
+    # ----------------------------------------------------------------------------
+    def namelist(self, nested=False):
+        return [name for name, depth in self.entries if nested or depth == 0]
+
+    # ----------------------------------------------------------------------------
+    #                               method find
+    # ----------------------------------------------------------------------------
+    def find(self, file_to_check, nested=False):
+        # returns the (nested) path of the first member named file_to_check, or ''
+        for name in self.namelist(nested):
+            if name.endswith(f'/{file_to_check}') or name == file_to_check:
+                debug(f"Found: {name}")
+                return name
+        debug(f"file: {file_to_check} was NOT found")
+        return ''
+
+    # ----------------------------------------------------------------------------
+    #                               method match
+    # ----------------------------------------------------------------------------
+    def match(self, pattern, nested=False):
+        return fnmatch.filter(self.namelist(nested), pattern)
+
+
 # ============================================================================
-def check_archive_contains_file(archive_file_path, file_to_check, nested=False, is_recursive=False):
-    debug(f"Looking for {file_to_check} in file {archive_file_path} with nested: {nested}")
+#                               Class SubFile
+# ============================================================================
+class SubFile(io.RawIOBase):
+    # Seekable read-only window [start, start + length) of another seekable file.
+    def __init__(self, fileobj, start, length):
+        self.fileobj = fileobj
+        self.start = start
+        self.length = length
+        self.position = 0
 
-    file_ext = os.path.splitext(archive_file_path)[1].lower()
+    def readable(self):
+        return True
 
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.length
+        self.position = max(offset, 0)
+        return self.position
+
+    def readinto(self, buffer):
+        length = min(len(buffer), self.length - self.position)
+        if length <= 0:
+            return 0
+        # the underlying file can be shared, always seek before reading
+        self.fileobj.seek(self.start + self.position)
+        data = self.fileobj.read(length)
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+# ============================================================================
+#                               Function open_zip_member
+# ============================================================================
+def open_zip_member(zip_file, name):
+    # Stored members are returned as a window into the zip itself, so seeking is free.
+    # Compressed members fall back to zipfile's own (seekable, but decompressing) stream.
+    info = zip_file.getinfo(name)
+    offset = get_zip_member_offset(zip_file, info)
+    if offset != -1:
+        return SubFile(zip_file.fp, offset, info.file_size)
+    return zip_file.open(info, 'r')
+
+
+# ============================================================================
+#                               Function get_archive_kind
+# ============================================================================
+def get_archive_kind(archive_file_path):
+    file_ext = os.path.splitext(archive_file_path)[1].lower()
     if file_ext == '.zip':
-        return check_zip_contains_file(archive_file_path, file_to_check, nested, is_recursive)
+        return 'zip'
     elif file_ext in ['.tgz', '.gz', '.tar', '.md5']:
-        return check_tar_contains_file(archive_file_path, file_to_check, nested, is_recursive)
-    else:
-        debug("Unsupported file format.")
-        return ''
+        return 'tar'
+    return ''
+
+
+# ============================================================================
+#                               Function get_archive_index
+# ============================================================================
+def get_archive_index(archive_file_path):
+    # cached per path and modification time, so repeated queries during processing don't rescan.
+    global archive_indexes
+    st = os.stat(archive_file_path)
+    key = os.path.abspath(archive_file_path)
+    cached = archive_indexes.get(key)
+    if cached and cached[0] == (st.st_mtime_ns, st.st_size):
+        return cached[1]
+    index = ArchiveIndex(archive_file_path)
+    archive_indexes[key] = ((st.st_mtime_ns, st.st_size), index)
+    return index
+
+
+# ============================================================================
+#                               Function open_archive_member
+# ============================================================================
+@contextlib.contextmanager
+def open_archive_member(archive_file_path, member_path):
+    # member_path is a path as returned by ArchiveIndex.find(), it can go through nested archives,
+    # i.e. image-oriole.zip/boot.img. Nested archives are read in place, nothing is written to disk.
+    with contextlib.ExitStack() as stack:
+        kind = get_archive_kind(archive_file_path)
+        if kind == 'zip':
+            container = stack.enter_context(zipfile.ZipFile(archive_file_path, 'r'))
+        elif kind == 'tar':
+            container = stack.enter_context(tarfile.open(archive_file_path, 'r'))
+        else:
+            raise ValueError(f"Unsupported archive: {archive_file_path}")
+        remaining = member_path
+        while True:
+            if kind == 'zip':
+                names = set(container.namelist())
+            else:
+                names = set(container.getnames())
+            if remaining in names:
+                if kind == 'zip':
+                    member = stack.enter_context(open_zip_member(container, remaining))
+                else:
+                    member = stack.enter_context(container.extractfile(remaining))
+                yield member
+                return
+            # descend into the nested archive that prefixes the remaining path
+            for i, c in enumerate(remaining):
+                if c != '/' or remaining[:i] not in names:
+                    continue
+                nested_kind = get_archive_kind(remaining[:i])
+                if not nested_kind:
+                    continue
+                if kind == 'zip':
+                    fileobj = stack.enter_context(open_zip_member(container, remaining[:i]))
+                else:
+                    fileobj = stack.enter_context(container.extractfile(remaining[:i]))
+                if nested_kind == 'zip':
+                    container = stack.enter_context(zipfile.ZipFile(fileobj, 'r'))
+                else:
+                    container = stack.enter_context(tarfile.open(fileobj=fileobj, mode='r'))
+                kind = nested_kind
+                remaining = remaining[i + 1:]
+                break
+            else:
+                raise KeyError(f"{member_path} is not found in {archive_file_path}")
+
+
+# ============================================================================
+#                               Function extract_archive_member
+# ============================================================================
+def extract_archive_member(archive_file_path, member_path, dest):
+    # Streams a (possibly nested) member of an archive to the file dest.
+    debug(f"Extracting {member_path} from {archive_file_path} to {dest}")
+    try:
+        os.makedirs(os.path.dirname(dest) or '.', exist_ok=True)
+        # write under a temporary name so that an interrupted extraction never looks complete
+        with open_archive_member(archive_file_path, member_path) as src, open(f"{dest}.part", 'wb') as dst:
+            shutil.copyfileobj(src, dst, ARCHIVE_COPY_CHUNK_SIZE)
+        os.replace(f"{dest}.part", dest)
+        return 0
+    except Exception as e:
+        print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: Could not extract {member_path} from {archive_file_path}")
+        print(e)
+        with contextlib.suppress(Exception):
+            os.remove(f"{dest}.part")
+        return -1
+
+
+# ============================================================================
+#                               Function unpack_archive
+# ============================================================================
+def unpack_archive(archive_file_path, dest_dir):
+    # In process replacement for 7z x of a whole zip / tar archive.
+    debug(f"Unpacking {archive_file_path} into {dest_dir}")
+    try:
+        kind = get_archive_kind(archive_file_path)
+        if kind == 'zip':
+            with zipfile.ZipFile(archive_file_path, 'r') as zip_file:
+                zip_file.extractall(dest_dir)
+        elif kind == 'tar':
+            with tarfile.open(archive_file_path, 'r') as tar_file:
+                if hasattr(tarfile, 'data_filter'):
+                    # rejects members (and links) that would end up outside dest_dir, device files etc.
+                    tar_file.extractall(dest_dir, filter='data')
+                else:
+                    # Python without extraction filters, check the paths ourselves.
+                    root = os.path.realpath(dest_dir)
+                    for member in tar_file.getmembers():
+                        paths = [os.path.join(root, member.name)]
+                        if member.issym():
+                            paths.append(os.path.join(root, os.path.dirname(member.name), member.linkname))
+                        elif member.islnk():
+                            paths.append(os.path.join(root, member.linkname))
+                        for path in paths:
+                            if os.path.commonpath([root, os.path.realpath(path)]) != root:
+                                raise ValueError(f"{member.name} would be extracted outside of {dest_dir}")
+                        if member.isdev():
+                            raise ValueError(f"{member.name} is a device file")
+                    tar_file.extractall(dest_dir)
+        else:
+            raise ValueError(f"Unsupported archive: {archive_file_path}")
+        return 0
+    except Exception as e:
+        print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: Could not unpack {archive_file_path}")
+        print(e)
+        return -1
+
+
+# ============================================================================
+#                               Function check_archive_contains_file
+# ============================================================================
+def check_archive_contains_file(archive_file_path, file_to_check, nested=False, is_recursive=False):
+    debug(f"Looking for {file_to_check} in file {archive_file_path} with nested: {nested}")
+    return get_archive_index(archive_file_path).find(file_to_check, nested)
 
 
 # ============================================================================
 #                               Function check_zip_conatins_file
 # ============================================================================
 def check_zip_contains_file(zip_file_path, file_to_check, nested=False, is_recursive=False):
-    if not is_recursive:
-        debug(f"Looking for {file_to_check} in zipfile {zip_file_path} with zip-nested: {nested}")
-    with zipfile.ZipFile(zip_file_path, 'r') as zip_file:
-        for name in zip_file.namelist():
-            if name.endswith(f'/{file_to_check}') or name == file_to_check:
-                if not is_recursive:
-                    debug(f"Found: {name}")
-                return name
-            elif nested and name.endswith('.zip'):
-                with zip_file.open(name, 'r') as nested_zip_file:
-                    nested_zip_data = nested_zip_file.read()
-                with io.BytesIO(nested_zip_data) as nested_zip_stream:
-                    with zipfile.ZipFile(nested_zip_stream, 'r') as nested_zip:
-                        nested_file_path = check_zip_contains_file(nested_zip_stream, file_to_check, nested=True, is_recursive=True)
-                        if nested_file_path:
-                            if not is_recursive:
-                                debug(f"Found: {name}/{nested_file_path}")
-                            return f'{name}/{nested_file_path}'
-        debug(f"file: {file_to_check} was NOT found")
+    debug(f"Looking for {file_to_check} in zipfile {zip_file_path} with zip-nested: {nested}")
+    index = get_archive_index(zip_file_path)
+    if index.kind != 'zip':
         return ''
+    return index.find(file_to_check, nested)
 
 
 # ============================================================================
 #                               Function check_tar_contains_file
 # ============================================================================
 def check_tar_contains_file(tar_file_path, file_to_check, nested=False, is_recursive=False):
-    if not is_recursive:
-        debug(f"Looking for {file_to_check} in tarfile {tar_file_path} with tar-nested: {nested}")
-    with tarfile.open(tar_file_path, 'r') as tar_file:
-        for member in tar_file.getmembers():
-            if member.name.endswith(f'/{file_to_check}') or member.name == file_to_check:
-                if not is_recursive:
-                    debug(f"Found: {member.name}")
-                return member.name
-            elif nested and member.name.endswith('.tar'):
-                nested_tar_file_path = tar_file.extractfile(member).read()
-                nested_file_path = check_tar_contains_file(nested_tar_file_path, file_to_check, nested=True, is_recursive=True)
-                if nested_file_path:
-                    if not is_recursive:
-                        debug(f"Found: {member.name}/{nested_file_path}")
-                    return f'{member.name}/{nested_file_path}'
-            elif nested and member.name.endswith('.zip'):
-                with tar_file.extractfile(member) as nested_zip_file:
-                    nested_zip_data = nested_zip_file.read()
-
-                # Create a temporary file to write the nested zip data
-                with tempfile.NamedTemporaryFile(delete=False) as temp_zip_file:
-                    temp_zip_file.write(nested_zip_data)
-
-                nested_file_path = check_zip_contains_file(temp_zip_file.name, file_to_check, nested=True, is_recursive=True)
-                if nested_file_path:
-                    if not is_recursive:
-                        debug(f"Found: {member.name}/{nested_file_path}")
-                    return f'{member.name}/{nested_file_path}'
-        debug(f"File {file_to_check} was NOT found")
+    debug(f"Looking for {file_to_check} in tarfile {tar_file_path} with tar-nested: {nested}")
+    index = get_archive_index(tar_file_path)
+    if index.kind != 'tar':
         return ''
+    return index.find(file_to_check, nested)
 
 
 # ============================================================================
 #                               Function get_zip_file_list
 # ============================================================================
 def get_zip_file_list(zip_file_path):
-    with zipfile.ZipFile(zip_file_path, 'r') as zip_file:
-        file_list = zip_file.namelist()
-    return file_list
+    return get_archive_index(zip_file_path).namelist()
 
 
 # ============================================================================
@@ -1226,31 +1561,242 @@ def get_ui_cooridnates(xmlfile, search):
         return f"{x} {y}"
 
 
+# ============================================================================
+#                               Class BootImageMetadata
+# ============================================================================
+class BootImageMetadata():
+    def __init__(self, file_hash):
+        self.file_hash = file_hash
+        # marker name -> offset of the first occurrence in the image
+        self.markers = {}
+        # raw bytes that follow each marker
+        self.values = {}
+
+    def get_value(self, marker, length):
+        value = self.values.get(marker)
+        if value is None:
+            return None
+        return printable_ascii(value[:length])
+
+    @property
+    def sha1(self):
+        return self.get_value('SHA1=', 40)
+
+    @property
+    def fingerprint(self):
+        return self.get_value('fingerprint', 65)
+
+
+# ============================================================================
+#                               Function printable_ascii
+# ============================================================================
+def printable_ascii(byte_string):
+    ascii_string = byte_string.decode('ascii', errors='replace')
+    # replace non-decodable characters with ~
+    ascii_string = ascii_string.replace('\ufffd', '~')
+    # replace non-printable characters with !
+    return ''.join(['!' if ord(c) < 32 or ord(c) > 126 else c for c in ascii_string])
+
+
+# ============================================================================
+#                               Function get_boot_image_metadata
+# ============================================================================
+def get_boot_image_metadata(binfile):
+    # Scans the image once (memory mapped) for all the markers and caches the result by content hash.
+    global boot_metadata_by_stat
+    global boot_metadata_by_hash
+    path = os.path.abspath(binfile)
+    st = os.stat(path)
+    key = (path, st.st_size, st.st_mtime_ns, st.st_ino)
+    if key in boot_metadata_by_stat:
+        return boot_metadata_by_stat[key]
+    file_hash = get_cached_hash(path, 'sha1', st)
+    if file_hash and file_hash in boot_metadata_by_hash:
+        boot_metadata_by_stat[key] = boot_metadata_by_hash[file_hash]
+        return boot_metadata_by_hash[file_hash]
+
+    with open(path, 'rb') as f:
+        if st.st_size:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            data = b''
+        try:
+            metadata = BootImageMetadata(hashlib.sha1(data).hexdigest())
+            for match in BOOT_MARKERS_RE.finditer(data):
+                marker = match.group().decode('ascii')
+                if marker in metadata.markers:
+                    continue
+                metadata.markers[marker] = match.start()
+                length, skip = BOOT_MARKERS[marker]
+                start = match.end() + skip
+                metadata.values[marker] = bytes(data[start:start + length])
+                if len(metadata.markers) == len(BOOT_MARKERS):
+                    break
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+    set_cached_hash(path, 'sha1', st, metadata.file_hash)
+    boot_metadata_by_stat[key] = metadata
+    boot_metadata_by_hash[metadata.file_hash] = metadata
+    return metadata
+
+
+# ============================================================================
+#                               Class BootImageHeader
+# ============================================================================
+class BootImageHeader():
+    def __init__(self):
+        self.image_type = None              # 'boot' or 'vendor_boot'
+        self.header_version = None
+        self.page_size = None
+        self.kernel_size = 0
+        self.kernel_offset = 0
+        self.ramdisk_size = 0
+        self.ramdisk_offset = 0
+        self.os_version = ''
+        self.os_patch_level = ''
+        self.cmdline = ''
+        self.has_magisk_ramdisk = None      # None when the ramdisk could not be decompressed
+
+    @property
+    def summary(self):
+        if self.header_version is None:
+            return ''
+        summary = f"v{self.header_version}"
+        if self.image_type == 'vendor_boot':
+            summary = f"vendor {summary}"
+        return f"{summary} {self.os_version} {self.os_patch_level}".strip()
+
+
+# ============================================================================
+#                               Function align_to_page
+# ============================================================================
+def align_to_page(value, page_size):
+    return (value + page_size - 1) // page_size * page_size
+
+
+# ============================================================================
+#                               Function decode_os_version
+# ============================================================================
+def decode_os_version(value):
+    # os_version packs A.B.C (7 bits each) and the security patch level year / month (7 / 4 bits)
+    if not value:
+        return '', ''
+    version = value >> 11
+    patch = value & 0x7ff
+    os_version = f"{(version >> 14) & 0x7f}.{(version >> 7) & 0x7f}.{version & 0x7f}"
+    os_patch_level = f"{(patch >> 4) + 2000}-{patch & 0xf:02d}" if patch else ''
+    return os_version, os_patch_level
+
+
+# ============================================================================
+#                               Function decompress_ramdisk
+# ============================================================================
+def decompress_ramdisk(data, limit=BOOT_RAMDISK_SCAN_LIMIT):
+    # Returns (up to limit bytes of) the ramdisk cpio, or None if the compression is not recognized.
+    if data[:6] in [b'070701', b'070702']:
+        return data
+    if data[:2] == b'\x1f\x8b':
+        return zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(data, limit)
+    if data[:4] == b'\x04\x22\x4d\x18':
+        decompressor = lz4.frame.LZ4FrameDecompressor()
+        return decompressor.decompress(data, max_length=limit)
+    if data[:4] == b'\x02\x21\x4c\x18':
+        # lz4 legacy: magic followed by blocks of (u32 compressed size, data), each up to 8 MB uncompressed
+        output = bytearray()
+        pos = 4
+        while pos + 4 <= len(data) and len(output) < limit:
+            size = struct.unpack('<I', data[pos:pos + 4])[0]
+            pos += 4
+            if size == 0x184c2102:
+                continue
+            if size == 0 or pos + size > len(data):
+                break
+            output += lz4.block.decompress(data[pos:pos + size], uncompressed_size=8 * 1024 * 1024)
+            pos += size
+        return bytes(output)
+    return None
+
+
+# ============================================================================
+#                               Function parse_boot_image_header
+# ============================================================================
+def parse_boot_image_header(binfile):
+    # Parses boot / init_boot (header v0 - v4) and vendor_boot images, only the header page and the ramdisk are read.
+    # Returns a BootImageHeader or None if the file is not a boot image.
+    header = BootImageHeader()
+    try:
+        with open(binfile, 'rb') as f:
+            data = f.read(4096)
+            if data[:8] == b'ANDROID!' and len(data) >= 1632:
+                header.image_type = 'boot'
+                header.header_version = struct.unpack('<I', data[40:44])[0]
+                if header.header_version >= 3:
+                    kernel_size, ramdisk_size, os_version = struct.unpack('<III', data[8:20])
+                    header.page_size = 4096
+                    header.cmdline = data[44:1580]
+                else:
+                    kernel_size, _, ramdisk_size = struct.unpack('<III', data[8:20])
+                    header.page_size, _, os_version = struct.unpack('<III', data[36:48])
+                    header.cmdline = data[64:576] + data[608:1632]
+                header.kernel_size = kernel_size
+                header.kernel_offset = header.page_size
+                header.ramdisk_size = ramdisk_size
+                header.ramdisk_offset = header.page_size + align_to_page(kernel_size, header.page_size)
+            elif data[:8] == b'VNDRBOOT' and len(data) >= 2112:
+                header.image_type = 'vendor_boot'
+                header.header_version, header.page_size = struct.unpack('<II', data[8:16])
+                header.ramdisk_size = struct.unpack('<I', data[24:28])[0]
+                header.cmdline = data[28:2076]
+                header_size = struct.unpack('<I', data[2096:2100])[0]
+                header.ramdisk_offset = align_to_page(header_size, header.page_size)
+                os_version = 0
+            else:
+                return None
+            header.os_version, header.os_patch_level = decode_os_version(os_version)
+            header.cmdline = header.cmdline.split(b'\x00', 1)[0].decode('ascii', errors='replace').strip()
+            if header.ramdisk_size:
+                f.seek(header.ramdisk_offset)
+                ramdisk = decompress_ramdisk(f.read(min(header.ramdisk_size, BOOT_RAMDISK_SCAN_LIMIT)))
+                if ramdisk is not None:
+                    header.has_magisk_ramdisk = b'.backup/.magisk' in ramdisk
+            else:
+                header.has_magisk_ramdisk = False
+    except Exception as e:
+        print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: Encountered an error while parsing the header of {binfile}")
+        print(e)
+        return None
+    return header
+
+
+# ============================================================================
+#                               Function update_boot_header_info
+# ============================================================================
+def update_boot_header_info(con, boot_hash, binfile):
+    # Stores the parsed header in the BOOT record, header_version -1 marks a file that is not a parsable boot image.
+    header = None
+    if binfile and os.path.exists(binfile):
+        header = parse_boot_image_header(binfile)
+    if header is None:
+        header = BootImageHeader()
+        header.header_version = -1
+    has_magisk_ramdisk = None if header.has_magisk_ramdisk is None else int(header.has_magisk_ramdisk)
+    sql = 'UPDATE BOOT SET header_version = ?, os_version = ?, os_patch_level = ?, kernel_size = ?, ramdisk_size = ?, cmdline = ?, has_magisk_ramdisk = ? WHERE boot_hash = ?'
+    data = header.header_version, header.os_version, header.os_patch_level, header.kernel_size, header.ramdisk_size, header.cmdline, has_magisk_ramdisk, boot_hash
+    try:
+        with con:
+            con.execute(sql, data)
+    except Exception as e:
+        print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: Encountered an error while updating the BOOT record.")
+        print(e)
+    return header
+
+
 # ============================================================================
 #                               Function extract_sha1
 # ============================================================================
 def extract_sha1(binfile, length=8):
-    with open(binfile, 'rb') as f:
-        s = f.read()
-        # Find SHA1=
-        pos = s.find(b'\x53\x48\x41\x31\x3D')
-        # Move to that location
-        if pos != -1:
-            # move to 5 characters from the found position
-            f.seek(pos + 5, 0)
-            # read length bytes
-            byte_string = f.read(length)
-            # convert byte string to hex string
-            hex_string = binascii.hexlify(byte_string).decode('ascii')
-            # convert hex string to ASCII string
-            ascii_string = binascii.unhexlify(hex_string).decode('ascii', errors='replace')
-            # replace non-decodable characters with ~
-            ascii_string = ascii_string.replace('\ufffd', '~')
-            # replace non-printable characters with !
-            ascii_string = ''.join(['!' if ord(c) < 32 or ord(c) > 126 else c for c in ascii_string])
-            return ascii_string
-        else:
-            return None
+    return get_boot_image_metadata(binfile).get_value('SHA1=', length)
 
 
 # ============================================================================
@@ -1273,26 +1819,7 @@ def compare_sha1(SHA1, Extracted_SHA1):
 #                               Function extract_fingerprint
 # ============================================================================
 def extract_fingerprint(binfile):
-    with open(binfile, 'rb') as f:
-        s = f.read()
-        # Find fingerprint=
-        pos = s.find(b'\x66\x69\x6E\x67\x65\x72\x70\x72\x69\x6E\x74')
-        # Move to that location
-        if pos == -1:
-            return None
-        # move to 12 characters from the found position
-        f.seek(pos + 12, 0)
-        # read 65 bytes
-        byte_string = f.read(65)
-        # convert byte string to hex string
-        hex_string = binascii.hexlify(byte_string).decode('ascii')
-        # convert hex string to ASCII string
-        ascii_string = binascii.unhexlify(hex_string).decode('ascii', errors='replace')
-        # replace non-decodable characters with ~
-        ascii_string = ascii_string.replace('\ufffd', '~')
-        # replace non-printable characters with !
-        ascii_string = ''.join(['!' if ord(c) < 32 or ord(c) > 126 else c for c in ascii_string])
-        return ascii_string
+    return get_boot_image_metadata(binfile).fingerprint
 
 
 # ============================================================================
@@ -1303,48 +1830,219 @@ def debug(message):
         print(f"debug: {message}")
 
 
+# ============================================================================
+#                               Function get_cached_hash
+# ============================================================================
+def get_cached_hash(fname, algorithm, st):
+    con = get_db()
+    if con is None:
+        return None
+    with contextlib.suppress(Exception):
+        row = con.execute("SELECT hash FROM FILE_HASH WHERE file_path = ? AND algorithm = ? AND size = ? AND mtime_ns = ? AND inode = ?", (fname, algorithm, st.st_size, st.st_mtime_ns, st.st_ino)).fetchone()
+        if row:
+            return row[0]
+    return None
+
+
+# ============================================================================
+#                               Function set_cached_hash
+# ============================================================================
+def set_cached_hash(fname, algorithm, st, value):
+    con = get_db()
+    if con is None:
+        return
+    # a file modified within the mtime granularity could change again without its mtime changing, don't trust it yet.
+    if time.time_ns() - st.st_mtime_ns < HASH_CACHE_MIN_AGE_NS:
+        return
+    with contextlib.suppress(Exception):
+        with con:
+            con.execute("INSERT OR REPLACE INTO FILE_HASH (file_path, algorithm, size, mtime_ns, inode, hash, epoch) VALUES (?, ?, ?, ?, ?, ?, ?)", (fname, algorithm, st.st_size, st.st_mtime_ns, st.st_ino, value, int(time.time())))
+
+
+# ============================================================================
+#                               Function compute_hashes
+# ============================================================================
+def compute_hashes(fname, algorithms, progress=None):
+    # one read of the file feeds all the digests, hashlib releases the GIL on large updates
+    hash_objs = [hashlib.new(algorithm) for algorithm in algorithms]
+    buffer = bytearray(HASH_CHUNK_SIZE)
+    view = memoryview(buffer)
+    total = os.path.getsize(fname)
+    done = 0
+    with open(fname, "rb", buffering=0) as f:
+        while True:
+            size = f.readinto(buffer)
+            if not size:
+                break
+            for hash_obj in hash_objs:
+                hash_obj.update(view[:size])
+            done += size
+            if progress:
+                progress(done, total)
+    return {algorithm: hash_obj.hexdigest() for algorithm, hash_obj in zip(algorithms, hash_objs)}
+
+
+# ============================================================================
+#                               Function multi_hash
+# ============================================================================
+def multi_hash(fname, algorithms=('sha1', 'sha256')):
+    return multi_hash_files([fname], algorithms, max_workers=1)[fname]
+
+
+# ============================================================================
+#                               Function multi_hash_files
+# ============================================================================
+def multi_hash_files(fnames, algorithms=('sha1', 'sha256'), max_workers=None):
+    """
+    Returns {fname: {algorithm: hexdigest}} for each of the files.
+    Cached digests are used where the file is unchanged, the rest are computed with a single
+    read per file, files are hashed in parallel on a thread pool.
+    """
+    results = {}
+    pending = {}
+    stats = {}
+    for fname in fnames:
+        path = os.path.abspath(fname)
+        st = os.stat(path)
+        stats[fname] = (path, st)
+        results[fname] = {}
+        for algorithm in algorithms:
+            value = get_cached_hash(path, algorithm, st)
+            if value:
+                debug(f"Using cached {algorithm} for {path}")
+                results[fname][algorithm] = value
+            else:
+                pending.setdefault(fname, []).append(algorithm)
+    if not pending:
+        return results
+
+    if len(pending) == 1 or max_workers == 1:
+        computed = {fname: compute_hashes(stats[fname][0], missing) for fname, missing in pending.items()}
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers or min(len(pending), os.cpu_count() or 1)) as executor:
+            futures = {fname: executor.submit(compute_hashes, stats[fname][0], missing) for fname, missing in pending.items()}
+            computed = {fname: future.result() for fname, future in futures.items()}
+
+    # db access stays on the calling thread
+    for fname, hashes in computed.items():
+        path, st = stats[fname]
+        for algorithm, value in hashes.items():
+            set_cached_hash(path, algorithm, st, value)
+        results[fname].update(hashes)
+    return results
+
+
+# ============================================================================
+#                               Function hash_file_async
+# ============================================================================
+def hash_file_async(fname, algorithm, on_done, progress=None):
+    """
+    Calls on_done(hexdigest) on the main thread, or on_done(None) if the file could not be hashed.
+    A cached digest is delivered right away, otherwise the file is hashed on a worker thread.
+    progress(bytes_done, bytes_total) is called from the worker thread.
+    """
+    path = os.path.abspath(fname)
+    try:
+        st = os.stat(path)
+    except Exception as e:
+        print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: Encountered an error while hashing {fname}")
+        print(e)
+        on_done(None)
+        return None
+    value = get_cached_hash(path, algorithm, st)
+    if value:
+        debug(f"Using cached {algorithm} for {path}")
+        on_done(value)
+        return None
+
+    def finish(value):
+        # back on the main thread, the db connection can only be used from here
+        if value:
+            set_cached_hash(path, algorithm, st, value)
+        on_done(value)
+
+    def worker():
+        try:
+            value = compute_hashes(path, (algorithm,), progress)[algorithm]
+        except Exception as e:
+            print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: Encountered an error while hashing {fname}")
+            print(e)
+            value = None
+        wx.CallAfter(finish, value)
+
+    thread = threading.Thread(target=worker, name=f"hash {os.path.basename(path)}", daemon=True)
+    thread.start()
+    return thread
+
+
+# ============================================================================
+#                               Function hash_file
+# ============================================================================
+def hash_file(fname, algorithm):
+    return multi_hash(fname, (algorithm,))[algorithm]
+
+
 # ============================================================================
 #                               Function md5
 # ============================================================================
 def md5(fname):
-    hash_md5 = hashlib.md5()
-    with open(fname, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            hash_md5.update(chunk)
-    return hash_md5.hexdigest()
+    return hash_file(fname, 'md5')
 
 
 # ============================================================================
 #                               Function sha1
 # ============================================================================
 def sha1(fname):
-    hash_sha1 = hashlib.sha1()
-    with open(fname, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            hash_sha1.update(chunk)
-    return hash_sha1.hexdigest()
+    return hash_file(fname, 'sha1')
 
 
 # ============================================================================
 #                               Function sha256
 # ============================================================================
 def sha256(fname):
-    hash_sha256 = hashlib.sha256()
-    with open(fname, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            hash_sha256.update(chunk)
-    return hash_sha256.hexdigest()
+    return hash_file(fname, 'sha256')
 
 
 # ============================================================================
 #                               Function unpack_lz4
 # ============================================================================
-def unpack_lz4(source, dest):
-    with open(source, 'rb') as file:
-        compressed_data = file.read()
-    decompressed_data = lz4.frame.decompress(compressed_data)
-    with open(dest, 'wb') as file:
-        file.write(decompressed_data)
+def unpack_lz4(source, dest, algorithms=()):
+    # source is a path or a readable file object (i.e. a tar member from open_archive_member).
+    # Decompresses in chunks, optionally hashing the output in the same pass.
+    # Returns {algorithm: hexdigest} of the decompressed data, or -1 on failure.
+    hash_objs = [hashlib.new(algorithm) for algorithm in algorithms]
+    try:
+        with contextlib.ExitStack() as stack:
+            if isinstance(source, (str, bytes, os.PathLike)):
+                source = stack.enter_context(open(source, 'rb'))
+            dst = stack.enter_context(open(f"{dest}.part", 'wb'))
+            # lz4.frame.open would allocate the whole content size of the frame, feed the decompressor ourselves
+            decompressor = lz4.frame.LZ4FrameDecompressor()
+            pending = b''
+            while True:
+                if decompressor.eof:
+                    # the file can hold several concatenated frames
+                    pending = decompressor.unused_data or source.read(ARCHIVE_COPY_CHUNK_SIZE)
+                    if not pending:
+                        break
+                    decompressor = lz4.frame.LZ4FrameDecompressor()
+                elif decompressor.needs_input and not pending:
+                    pending = source.read(ARCHIVE_COPY_CHUNK_SIZE)
+                    if not pending:
+                        raise EOFError("lz4 data is truncated")
+                chunk = decompressor.decompress(pending, max_length=ARCHIVE_COPY_CHUNK_SIZE)
+                pending = b''
+                dst.write(chunk)
+                for hash_obj in hash_objs:
+                    hash_obj.update(chunk)
+        os.replace(f"{dest}.part", dest)
+    except Exception as e:
+        print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: Could not unpack {dest}")
+        print(e)
+        with contextlib.suppress(Exception):
+            os.remove(f"{dest}.part")
+        return -1
+    return {algorithm: hash_obj.hexdigest() for algorithm, hash_obj in zip(algorithms, hash_objs)}
 
 
 # ============================================================================
@@ -1589,7 +2287,9 @@ def delete_all(dir):
 def run_shell(cmd, timeout=None):
     try:
         response = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding='ISO-8859-1', errors="replace", timeout=timeout, env=get_env_variables())
-        wx.Yield()
+        # wx.Yield is only allowed on the main (GUI) thread
+        if threading.current_thread() is threading.main_thread():
+            wx.Yield()
         return response
     except subprocess.TimeoutExpired as e:
         print(f"\n{datetime.now():%Y-%m-%d %H:%M:%S} ERROR: Command timed out after {timeout} seconds")
@@ -1621,7 +2321,8 @@ def run_shell2(cmd, timeout=None):
         start_time = time.time()
         while True:
             line = proc.stdout.readline()
-            wx.Yield()
+            if threading.current_thread() is threading.main_thread():
+                wx.Yield()
             if line.strip() != "":
                 print(line.strip())
                 stdout += line
@@ -0,0 +1,152 @@
+import socketserver
+import stat
+import struct
+import threading
+import time
+
+
+class FakeAdbServer(socketserver.ThreadingTCPServer):
+    # A minimal stand in for the adb server, enough to exercise adb_client.AdbClient:
+    # host:version, host:devices, host:track-devices, host-serial:<serial>:features,
+    # shell v2 (answers from self.shell_results) and sync STAT / SEND / RECV on self.files.
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), FakeAdbHandler)
+        self.port = self.server_address[1]
+        # [(serial, state)] reported by host:devices and host:track-devices
+        self.devices = [('FAKE01', 'device')]
+        self.features = 'shell_v2,cmd,stat_v2'
+        # shell command -> (stdout, stderr, exit code)
+        self.shell_results = {}
+        # the device's file system: remote path -> (mode, bytes, mtime)
+        self.files = {}
+        self.sync_connections = 0
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class FakeAdbHandler(socketserver.BaseRequestHandler):
+    def _recv(self, size):
+        data = bytearray()
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                raise EOFError
+            data += chunk
+        return bytes(data)
+
+    def _read_request(self):
+        return self._recv(int(self._recv(4), 16)).decode('utf-8')
+
+    def _okay(self, data=None):
+        if data is None:
+            self.request.sendall(b'OKAY')
+        else:
+            self.request.sendall(b'OKAY' + b'%04x' % len(data) + data)
+
+    def _fail(self, message):
+        message = message.encode('utf-8')
+        self.request.sendall(b'FAIL' + b'%04x' % len(message) + message)
+
+    def handle(self):
+        try:
+            request = self._read_request()
+            if request == 'host:version':
+                self._okay(b'%04x' % 41)
+            elif request == 'host:devices':
+                self._okay(self._device_list())
+            elif request == 'host:track-devices':
+                self._track_devices()
+            elif request.startswith('host-serial:') and request.endswith(':features'):
+                self._okay(self.server.features.encode('utf-8'))
+            elif request.startswith('host:transport:'):
+                serial = request[len('host:transport:'):]
+                if serial not in [d_id for d_id, state in self.server.devices]:
+                    self._fail(f"device '{serial}' not found")
+                    return
+                self._okay()
+                service = self._read_request()
+                if service.startswith('shell,v2,raw:'):
+                    self._okay()
+                    self._shell(service[len('shell,v2,raw:'):])
+                elif service == 'sync:':
+                    self._okay()
+                    self.server.sync_connections += 1
+                    self._sync()
+                else:
+                    self._fail(f"unknown service {service}")
+            else:
+                self._fail(f"unknown host service {request}")
+        except (EOFError, OSError):
+            pass
+
+    def _device_list(self):
+        return ''.join(f"{d_id}\t{state}\n" for d_id, state in self.server.devices).encode('utf-8')
+
+    def _track_devices(self):
+        self._okay()
+        last = None
+        while True:
+            current = self._device_list()
+            if current != last:
+                self.request.sendall(b'%04x' % len(current) + current)
+                last = current
+            time.sleep(0.02)
+
+    def _shell(self, cmd):
+        # stdin is closed by the client first
+        packet_id, size = struct.unpack('<BI', self._recv(5))
+        self._recv(size)
+        stdout, stderr, returncode = self.server.shell_results.get(cmd, ('', f"/system/bin/sh: {cmd}: not found\n", 127))
+        for packet_id, data in ((1, stdout.encode('utf-8')), (2, stderr.encode('utf-8'))):
+            if data:
+                self.request.sendall(struct.pack('<BI', packet_id, len(data)) + data)
+        self.request.sendall(struct.pack('<BI', 3, 1) + bytes([returncode]))
+
+    def _sync_fail(self, message):
+        message = message.encode('utf-8')
+        self.request.sendall(b'FAIL' + struct.pack('<I', len(message)) + message)
+
+    def _sync(self):
+        files = self.server.files
+        while True:
+            command, size = struct.unpack('<4sI', self._recv(8))
+            if command == b'QUIT':
+                return
+            arg = self._recv(size).decode('utf-8')
+            if command == b'STAT':
+                mode, data, mtime = files.get(arg, (0, b'', 0))
+                self.request.sendall(b'STAT' + struct.pack('<III', mode, len(data), mtime))
+            elif command == b'SEND':
+                path, mode = arg.rsplit(',', 1)
+                data = bytearray()
+                while True:
+                    command, size = struct.unpack('<4sI', self._recv(8))
+                    if command == b'DONE':
+                        mtime = size
+                        break
+                    data += self._recv(size)
+                if path.startswith('/system/'):
+                    self._sync_fail("couldn't create file: Read-only file system")
+                else:
+                    files[path] = (int(mode), bytes(data), mtime)
+                    self.request.sendall(b'OKAY' + struct.pack('<I', 0))
+            elif command == b'RECV':
+                if arg not in files or not stat.S_ISREG(files[arg][0]):
+                    self._sync_fail(f"remote object '{arg}' does not exist")
+                    continue
+                data = files[arg][1]
+                for i in range(0, len(data), 64 * 1024):
+                    chunk = data[i:i + 64 * 1024]
+                    self.request.sendall(b'DATA' + struct.pack('<I', len(chunk)) + chunk)
+                self.request.sendall(b'DONE' + struct.pack('<I', 0))
+            else:
+                return
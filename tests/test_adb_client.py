@@ -0,0 +1,116 @@
+import os
+import stat
+import subprocess
+import threading
+
+import pytest
+
+from adb_client import AdbClient, AdbError
+from fake_adb_server import FakeAdbServer
+
+
+@pytest.fixture
+def server():
+    server = FakeAdbServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def client(server):
+    client = AdbClient(port=server.port, timeout=5)
+    yield client
+    client.close()
+
+
+def test_version(client):
+    assert client.version() == 41
+
+
+def test_devices(server, client):
+    server.devices = [('FAKE01', 'device'), ('FAKE02', 'unauthorized')]
+    assert client.devices() == [('FAKE01', 'device'), ('FAKE02', 'unauthorized')]
+
+
+def test_track_devices(server, client):
+    stop = threading.Event()
+    updates = client.track_devices(stop)
+    assert next(updates) == [('FAKE01', 'device')]
+    server.devices = [('FAKE01', 'device'), ('FAKE02', 'recovery')]
+    assert next(updates) == [('FAKE01', 'device'), ('FAKE02', 'recovery')]
+    server.devices = []
+    assert next(updates) == []
+    stop.set()
+    with pytest.raises(StopIteration):
+        next(updates)
+
+
+def test_shell(server, client):
+    server.shell_results['getprop ro.product.model'] = ('Pixel 8\n', '', 0)
+    server.shell_results['ls /nope'] = ('', 'ls: /nope: No such file or directory\n', 1)
+    res = client.shell('FAKE01', 'getprop ro.product.model')
+    assert isinstance(res, subprocess.CompletedProcess)
+    assert (res.returncode, res.stdout, res.stderr) == (0, 'Pixel 8\n', '')
+    res = client.shell('FAKE01', 'ls /nope')
+    assert (res.returncode, res.stdout, res.stderr) == (1, '', 'ls: /nope: No such file or directory\n')
+
+
+def test_shell_without_shell_v2(server, client):
+    server.features = 'cmd'
+    with pytest.raises(AdbError):
+        client.shell('FAKE01', 'true')
+
+
+def test_unknown_device(client):
+    with pytest.raises(AdbError, match="not found"):
+        client.stat('NOPE', '/sdcard')
+
+
+def test_push_stat_pull(server, client, tmp_path):
+    data = os.urandom(200 * 1024)
+    local = tmp_path / 'boot.img'
+    local.write_bytes(data)
+    assert client.push('FAKE01', str(local), '/sdcard/Download/boot.img') == len(data)
+    mode, size, mtime = client.stat('FAKE01', '/sdcard/Download/boot.img')
+    assert stat.S_ISREG(mode) and size == len(data) and mtime == int(local.stat().st_mtime)
+    assert client.stat('FAKE01', '/sdcard/Download/missing.img')[0] == 0
+
+    assert client.pull('FAKE01', '/sdcard/Download/boot.img', str(tmp_path / 'pulled.img')) == len(data)
+    assert (tmp_path / 'pulled.img').read_bytes() == data
+    # into a directory keeps the remote name
+    (tmp_path / 'out').mkdir()
+    client.pull('FAKE01', '/sdcard/Download/boot.img', str(tmp_path / 'out'))
+    assert (tmp_path / 'out' / 'boot.img').read_bytes() == data
+    # one sync connection served all of it
+    assert server.sync_connections == 1
+
+
+def test_sync_failures(server, client, tmp_path):
+    local = tmp_path / 'boot.img'
+    local.write_bytes(b'boot')
+    with pytest.raises(AdbError, match="Read-only"):
+        client.push('FAKE01', str(local), '/system/boot.img')
+    with pytest.raises(AdbError, match="does not exist"):
+        client.pull('FAKE01', '/sdcard/missing.img', str(tmp_path / 'missing.img'))
+    assert not (tmp_path / 'missing.img.part').exists()
+    assert not (tmp_path / 'missing.img').exists()
+    # a failed transfer doesn't leave its connection in the pool, the next one starts afresh
+    assert client.push('FAKE01', str(local), '/sdcard/boot.img') == 4
+    assert server.sync_connections == 3
+
+
+def test_stale_sync_connection(server, client, tmp_path):
+    local = tmp_path / 'boot.img'
+    local.write_bytes(b'boot')
+    client.push('FAKE01', str(local), '/sdcard/boot.img')
+    # the device reconnected, the pooled connection is dead
+    client._sync['FAKE01'].close()
+    assert client.stat('FAKE01', '/sdcard/boot.img')[1] == 4
+    assert server.sync_connections == 2
+
+
+def test_server_gone(server):
+    client = AdbClient(port=server.port, timeout=5)
+    server.stop()
+    with pytest.raises(OSError):
+        client.devices()
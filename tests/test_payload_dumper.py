@@ -0,0 +1,236 @@
+import bz2
+import hashlib
+import http.server
+import lzma
+import os
+import random
+import re
+import struct
+import threading
+import zipfile
+
+import pytest
+
+import payload_dumper
+import update_metadata_pb2 as um
+
+BLOCK_SIZE = 4096
+
+
+def build_payload(path, partitions, seed=0):
+    # Writes a CrAU payload with REPLACE / REPLACE_XZ / REPLACE_BZ / ZERO ops and returns the expected images.
+    rnd = random.Random(seed)
+    manifest = um.DeltaArchiveManifest()
+    manifest.block_size = BLOCK_SIZE
+    blobs = []
+    offset = 0
+    images = {}
+    for name, num_blocks in partitions.items():
+        part = manifest.partitions.add()
+        part.partition_name = name
+        image = bytearray(num_blocks * BLOCK_SIZE)
+        block = 0
+        while block < num_blocks:
+            count = min(rnd.randint(1, 16), num_blocks - block)
+            data = rnd.randbytes(count * BLOCK_SIZE // 2) + bytes(count * BLOCK_SIZE // 2)
+            op = part.operations.add()
+            kind = len(part.operations) % 4
+            if kind == 0:
+                op.type = op.ZERO
+                data = bytes(count * BLOCK_SIZE)
+                blob = b''
+            elif kind == 1:
+                op.type = op.REPLACE
+                blob = data
+            elif kind == 2:
+                op.type = op.REPLACE_XZ
+                blob = lzma.compress(data)
+            else:
+                op.type = op.REPLACE_BZ
+                blob = bz2.compress(data)
+            extent = op.dst_extents.add()
+            extent.start_block = block
+            extent.num_blocks = count
+            if blob:
+                op.data_offset = offset
+                op.data_length = len(blob)
+                op.data_sha256_hash = hashlib.sha256(blob).digest()
+                blobs.append(blob)
+                offset += len(blob)
+            image[block * BLOCK_SIZE:(block + count) * BLOCK_SIZE] = data
+            block += count
+        part.new_partition_info.size = len(image)
+        part.new_partition_info.hash = hashlib.sha256(image).digest()
+        images[name] = bytes(image)
+    serialized = manifest.SerializeToString()
+    with open(path, 'wb') as f:
+        f.write(b'CrAU' + struct.pack('>QQI', 2, len(serialized), 0) + serialized)
+        for blob in blobs:
+            f.write(blob)
+    return images
+
+
+class RangeHandler(http.server.BaseHTTPRequestHandler):
+    # Serves the files of self.server.root, honouring single byte ranges unless self.server.ranges is off,
+    # self.server.truncate cuts that many bytes off each range response.
+    def log_message(self, *args):
+        pass
+
+    def _open(self):
+        path = os.path.join(self.server.root, self.path.lstrip('/'))
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return None, 0
+        return open(path, 'rb'), os.path.getsize(path)
+
+    def do_GET(self):
+        f, size = self._open()
+        if not f:
+            return
+        with f:
+            match = re.fullmatch(r'bytes=(\d+)-(\d+)', self.headers.get('Range', ''))
+            if self.server.ranges and match:
+                start, end = int(match.group(1)), min(int(match.group(2)), size - 1)
+                self.server.range_requests += 1
+                self.send_response(206)
+                self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, end, size))
+            else:
+                start, end = 0, size - 1
+                self.send_response(200)
+            if self.server.ranges and match and end > start:
+                end -= self.server.truncate
+            self.send_header('Content-Length', str(end - start + 1))
+            self.end_headers()
+            f.seek(start)
+            self.wfile.write(f.read(end - start + 1))
+
+
+@pytest.fixture
+def ota(tmp_path):
+    # a stored payload.bin inside an OTA zip, served over http
+    images = build_payload(tmp_path / 'payload.bin', {'boot': 300, 'vbmeta': 2, 'init_boot': 120, 'system': 64})
+    with zipfile.ZipFile(tmp_path / 'ota.zip', 'w') as zip_file:
+        zip_file.write(tmp_path / 'payload.bin', 'payload.bin')
+        zip_file.writestr('META-INF/com/android/metadata', 'ota-type=AB\n', compress_type=zipfile.ZIP_DEFLATED)
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), RangeHandler)
+    server.daemon_threads = True
+    server.root = str(tmp_path)
+    server.ranges = True
+    server.range_requests = 0
+    server.truncate = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield images, tmp_path / 'ota.zip', server, 'http://127.0.0.1:%d/ota.zip' % server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_remote_matches_local(ota, tmp_path, workers):
+    images, zip_path, server, url = ota
+    selected = 'boot,vbmeta,init_boot'
+    local_out = tmp_path / 'local'
+    remote_out = tmp_path / 'remote'
+    local_out.mkdir()
+    remote_out.mkdir()
+    assert payload_dumper.extract_payload(str(zip_path), out=str(local_out), images=selected, member='payload.bin') == 0
+    assert payload_dumper.extract_payload(url, out=str(remote_out), images=selected, workers=workers, member='payload.bin', verify=True) == 0
+    for name in selected.split(','):
+        remote = (remote_out / ('%s.img' % name)).read_bytes()
+        assert remote == (local_out / ('%s.img' % name)).read_bytes()
+        assert remote == images[name]
+    assert not (remote_out / 'system.img').exists()
+    assert server.range_requests > 0
+
+
+def test_remote_downloads_only_what_it_needs(ota, tmp_path, monkeypatch):
+    images, zip_path, server, url = ota
+    monkeypatch.setattr(payload_dumper, 'REMOTE_READ_AHEAD', 64 * 1024)
+    fetched = []
+
+    class CountingFetcher(payload_dumper.HttpRangeFetcher):
+        def fetch(self, offset, length):
+            data = super().fetch(offset, length)
+            fetched.append(len(data))
+            return data
+
+    assert payload_dumper.extract_payload(url, out=str(tmp_path), images='vbmeta', member='payload.bin', fetcher=CountingFetcher(url)) == 0
+    assert (tmp_path / 'vbmeta.img').read_bytes() == images['vbmeta']
+    # the zip directory, the manifest and vbmeta's blobs, not the other partitions
+    assert sum(fetched) < os.path.getsize(zip_path) / 4
+
+
+def test_server_without_range_support(ota, tmp_path, capsys):
+    images, zip_path, server, url = ota
+    server.ranges = False
+    assert payload_dumper.extract_payload(url, out=str(tmp_path), images='boot', member='payload.bin') == -1
+    assert "does not support range requests" in capsys.readouterr().err
+    assert not (tmp_path / 'boot.img').exists()
+    with pytest.raises(payload_dumper.PayloadError, match="does not support range requests"):
+        payload_dumper.HttpRangeFetcher(url).fetch(0, 1024)
+
+
+def test_small_selection_is_extracted_in_process(ota, tmp_path, monkeypatch):
+    images, zip_path, server, url = ota
+
+    def no_pool(*args, **kwargs):
+        raise AssertionError("a worker pool was started")
+
+    monkeypatch.setattr(payload_dumper, 'ProcessPoolExecutor', no_pool)
+    assert payload_dumper.extract_payload(str(zip_path), out=str(tmp_path), images='boot,vbmeta,init_boot', workers=None, member='payload.bin') == 0
+    assert (tmp_path / 'boot.img').read_bytes() == images['boot']
+
+
+def test_worker_failure(tmp_path, capsys):
+    images = build_payload(tmp_path / 'payload.bin', {'boot': 300})
+    # corrupt the last operation blob, which a worker picks up
+    with open(tmp_path / 'payload.bin', 'r+b') as f:
+        f.seek(-16, os.SEEK_END)
+        f.write(bytes(16))
+    assert payload_dumper.extract_payload(str(tmp_path / 'payload.bin'), out=str(tmp_path), workers=2, verify=True) == -1
+    assert "hash mismatch" in capsys.readouterr().err
+
+
+def test_list_payload_partitions(ota, tmp_path):
+    images, zip_path, server, url = ota
+    partitions = payload_dumper.list_payload_partitions(str(zip_path), member='payload.bin', index_dir=str(tmp_path))
+    assert {name: entry['size'] for name, entry in partitions.items()} == {name: len(image) for name, image in images.items()}
+    # served from the index the second time
+    assert payload_dumper.list_payload_partitions(str(zip_path), member='payload.bin', index_dir=str(tmp_path)) == partitions
+
+
+def test_remote_short_response(ota, tmp_path, capsys):
+    images, zip_path, server, url = ota
+    server.truncate = 10
+    assert payload_dumper.extract_payload(url, out=str(tmp_path), images='boot', member='payload.bin') == -1
+    assert "bytes for a" in capsys.readouterr().err
+
+
+def test_bad_sources(ota, tmp_path, capsys):
+    images, zip_path, server, url = ota
+    # missing member, locally and remotely
+    assert payload_dumper.extract_payload(str(zip_path), out=str(tmp_path), member='nope.bin') == -1
+    assert "nope.bin is not in the zip file" in capsys.readouterr().err
+    assert payload_dumper.extract_payload(url, out=str(tmp_path), member='nope.bin') == -1
+    assert "nope.bin is not in the zip file" in capsys.readouterr().err
+    # not a zip
+    assert payload_dumper.extract_payload(str(tmp_path / 'payload.bin'), out=str(tmp_path), member='payload.bin') == -1
+    assert "not a valid zip file" in capsys.readouterr().err
+    # nothing listening
+    server.shutdown()
+    server.server_close()
+    assert payload_dumper.extract_payload(url, out=str(tmp_path), member='payload.bin') == -1
+    assert "Could not download" in capsys.readouterr().err
+
+
+def test_truncated_index_is_rebuilt(ota, tmp_path, capsys):
+    images, zip_path, server, url = ota
+    partitions = payload_dumper.list_payload_partitions(str(zip_path), member='payload.bin', index_dir=str(tmp_path))
+    index_dir = tmp_path / 'payload_index'
+    [index_file] = os.listdir(index_dir)
+    # e.g. left behind by a crash while it was written
+    content = (index_dir / index_file).read_text()
+    (index_dir / index_file).write_text(content[:len(content) // 2])
+    assert payload_dumper.list_payload_partitions(str(zip_path), member='payload.bin', index_dir=str(tmp_path)) == partitions
+    assert "Discarding payload index" in capsys.readouterr().err
+    assert os.listdir(index_dir) == [index_file]
+    assert (index_dir / index_file).read_text() == content
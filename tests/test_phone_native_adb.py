@@ -0,0 +1,110 @@
+import os
+import stat
+import sys
+import textwrap
+
+import pytest
+
+# phone / runtime are part of the GUI and need wxPython
+pytest.importorskip('wx')
+
+import phone
+import runtime
+from adb_client import AdbClient
+from fake_adb_server import FakeAdbServer
+
+pytestmark = pytest.mark.skipif(sys.platform == 'win32', reason="the fake adb binary is a POSIX script")
+
+SERIAL = 'FAKE01'
+
+# Stands in for the adb binary the native client falls back to: shell runs the commands with sh,
+# push / pull copy to and from $FAKE_DEVICE_ROOT, every call is logged to $FAKE_ADB_LOG.
+FAKE_ADB = textwrap.dedent('''\
+    #!{python}
+    import os, shutil, subprocess, sys
+    args = sys.argv[1:]
+    with open(os.environ['FAKE_ADB_LOG'], 'a') as log:
+        log.write(' '.join(args) + '\\n')
+    if args[:1] == ['-s']:
+        args = args[2:]
+    root = os.environ['FAKE_DEVICE_ROOT']
+    if args[0] == 'features':
+        print('cmd')
+    elif args[0] == 'shell':
+        sys.exit(subprocess.run(['sh'] + args[1:]).returncode)
+    elif args[0] == 'push':
+        dest = root + args[2]
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        shutil.copyfile(args[1], dest)
+    elif args[0] == 'pull':
+        shutil.copyfile(root + args[1], args[2])
+    ''')
+
+
+@pytest.fixture
+def server():
+    server = FakeAdbServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def device(server, tmp_path, monkeypatch):
+    adb = tmp_path / 'adb'
+    adb.write_text(FAKE_ADB.format(python=sys.executable))
+    adb.chmod(adb.stat().st_mode | stat.S_IXUSR)
+    env = dict(os.environ, FAKE_ADB_LOG=str(tmp_path / 'adb.log'), FAKE_DEVICE_ROOT=str(tmp_path / 'device'))
+    (tmp_path / 'adb.log').write_text('')
+    client = AdbClient(port=server.port, timeout=5)
+    monkeypatch.setattr(runtime, 'adb', str(adb))
+    monkeypatch.setattr(runtime, 'env_variables', env)
+    monkeypatch.setattr(runtime, 'pumlfile', str(tmp_path / 'flash.puml'))
+    monkeypatch.setattr(runtime, 'adb_client', client)
+    monkeypatch.setattr(runtime, 'use_native_adb', True)
+    device = phone.Device(SERIAL, 'adb')
+    yield device
+    device.close_shell_sessions()
+    client.close()
+
+
+def adb_calls(tmp_path):
+    return (tmp_path / 'adb.log').read_text().splitlines()
+
+
+def test_shell_through_native_client(server, device, tmp_path):
+    server.shell_results['getprop ro.product.model'] = ('Pixel 8\n', '', 0)
+    res = device.shell('getprop ro.product.model')
+    assert (res.returncode, res.stdout) == (0, 'Pixel 8\n')
+    assert adb_calls(tmp_path) == []
+
+
+def test_shell_falls_back_to_adb_binary(server, device, tmp_path):
+    # the server refuses the transport, e.g. the device is still being authorized
+    server.devices = []
+    res = device.shell('echo out; echo err >&2; exit 3')
+    assert (res.returncode, res.stdout.strip(), res.stderr.strip()) == (3, 'out', 'err')
+    assert any(call.startswith(f"-s {SERIAL} shell") for call in adb_calls(tmp_path))
+
+
+def test_push_pull_through_native_client(server, device, tmp_path):
+    local = tmp_path / 'boot.img'
+    local.write_bytes(b'boot image')
+    assert device.push_file(str(local), '/sdcard/Download/boot.img') == 0
+    assert server.files['/sdcard/Download/boot.img'][1] == b'boot image'
+    assert device.pull_file('/sdcard/Download/boot.img', str(tmp_path / 'pulled.img')) == 0
+    assert (tmp_path / 'pulled.img').read_bytes() == b'boot image'
+    assert adb_calls(tmp_path) == []
+
+
+def test_push_pull_fall_back_to_adb_binary(server, device, tmp_path):
+    local = tmp_path / 'boot.img'
+    local.write_bytes(b'boot image')
+    # the fake server refuses writes to /system
+    assert device.push_file(str(local), '/system/boot.img') == 0
+    assert (tmp_path / 'device' / 'system' / 'boot.img').read_bytes() == b'boot image'
+    # and doesn't have the file, the adb binary does
+    assert device.pull_file('/system/boot.img', str(tmp_path / 'pulled.img')) == 0
+    assert (tmp_path / 'pulled.img').read_bytes() == b'boot image'
+    calls = adb_calls(tmp_path)
+    assert any(call.startswith(f"-s {SERIAL} push") for call in calls)
+    assert any(call.startswith(f"-s {SERIAL} pull") for call in calls)